@@ -1,3 +1,3 @@
-from pieces import Piece
-from board import Board
-from game import GameState
+from src.pieces import Piece
+from src.board import Board
+from src.game import GameState
@@ -1,5 +1,420 @@
+import multiprocessing
+import pathlib
+import time
+from typing import Callable, Union
+from src.board import Board
+from src.analysis import static_exchange_evaluation
+from src.book import OpeningBook
+from src.clock import allocate, soft_limit_scale
+from src.ordering import Move, MovePicker, is_promotion, is_capture, is_tactical
+from src.tablebase import Tablebases
+from src.transposition import SharedTranspositionTable
+from src.utils import cute_print, timer, position_to_chess_notation, LRUCache
+
+MATE_SCORE = 100000
+INFINITY = 1000000
+# Scores closer than this to MATE_SCORE are mates, stored in the transposition table relative to the node
+MATE_THRESHOLD = MATE_SCORE - 1000
+
+# Transposition table entry bounds
+EXACT, LOWER_BOUND, UPPER_BOUND = 0, 1, 2
+TRANSPOSITION_TABLE_SIZE = 200000
+MAX_PLY = 64
+
+
+def score_to_table(score: int, ply: int) -> int:
+    return score + ply if score > MATE_THRESHOLD else score - ply if score < -MATE_THRESHOLD else score
+
+
+def score_from_table(score: int, ply: int) -> int:
+    return score - ply if score > MATE_THRESHOLD else score + ply if score < -MATE_THRESHOLD else score
+
+
+def tablebase_score(value: int, ply: int) -> int:
+    # Tablebase value (0 draw, n > 0 mates in n plies, -n - 1 gets mated in n plies) as a search score at ply
+    if value > 0:
+        return MATE_SCORE - ply - value
+    if value < 0:
+        return -MATE_SCORE + ply - value - 1
+    return 0
+
+
+class SearchAborted(Exception):
+    # Raised inside the search tree when a node or time limit is reached
+    pass
+
+
+def _search_root_moves(board: Board, root_moves: list[Move], depth: Union[int, None], transposition_table: Union[SharedTranspositionTable, None],
+                       max_nodes: Union[int, None], max_time: Union[float, None], tablebases: Union[Tablebases, None] = None) -> tuple[Union[Move, None], int, int, int]:
+    # Process pool task: search a share of the root moves, with the shared table if there is one
+    engine = Engine(transposition_table=transposition_table, tablebases=tablebases)
+    best_move, best_score = engine.search(board, depth, root_moves=root_moves, max_nodes=max_nodes, max_time=max_time)
+    return best_move, best_score, engine.nodes + engine.quiescence_nodes, engine.depth_reached
+
+
+class Engine:
+    def __init__(self, max_depth: int = 3, workers: int = 1, hash_mb: Union[int, None] = None, transposition_table=None,
+                 book: Union[OpeningBook, str, pathlib.Path, None] = None, tablebases: Union[Tablebases, str, pathlib.Path, None] = None):
+        self.max_depth = max_depth
+        # Opening book checked before searching (a path opens a book owned by this engine)
+        self.book = OpeningBook(book) if isinstance(book, (str, pathlib.Path)) else book
+        self.owns_book = isinstance(book, (str, pathlib.Path))
+        # Endgame tables answering exactly once material is low enough (a path is a tables directory)
+        self.tablebases = Tablebases(tablebases) if isinstance(tablebases, (str, pathlib.Path)) else tablebases
+        self.owns_tablebases = isinstance(tablebases, (str, pathlib.Path))
+        # Processes used to split root moves (1 searches in this process)
+        self.workers = workers
+        self.pool = None
+        # Position hash -> (depth, score, bound, best move). With hash_mb every worker shares one table of that size
+        if transposition_table is not None:
+            self.transposition_table = transposition_table
+        elif hash_mb is not None:
+            self.transposition_table = SharedTranspositionTable(hash_mb)
+        else:
+            self.transposition_table = LRUCache(TRANSPOSITION_TABLE_SIZE)
+        # Move ordering: two killer moves per ply and a history score per (start, end)
+        self.killers: list[list[Move]] = [[] for _ in range(MAX_PLY)]
+        self.history: dict[tuple, int] = {}
+        # Search limits of the running search
+        self.max_nodes: Union[int, None] = None
+        self.deadline: Union[float, None] = None
+        # Event another process sets to stop the search (pondering)
+        self.stop_event = None
+        # Called with (depth, best move, score) after every completed iteration (UCI info lines)
+        self.on_iteration: Union[Callable[[int, Move, int], None], None] = None
+        # Search statistics (reset on every search)
+        self.depth_reached = 0
+        self.nodes = 0
+        self.quiescence_nodes = 0
+        self.tablebase_hits = 0
+        self.moves_generated = 0
+        self.legality_checks = 0
+        self.moves_searched = 0
+
+    @staticmethod
+    def evaluate(board: Board) -> int:
+        # Incremental material and piece-square score, from the side to move point of view
+        score = board.static_score()
+        return score if board.turn == 'white' else -score
+
+    def reset_statistics(self):
+        self.depth_reached = 0
+        self.nodes = 0
+        self.quiescence_nodes = 0
+        self.tablebase_hits = 0
+        self.moves_generated = 0
+        self.legality_checks = 0
+        self.moves_searched = 0
+
+    def report(self):
+        ratio = self.moves_searched / self.moves_generated if self.moves_generated else 0
+        cute_print(f"{self.nodes} nodes, {self.quiescence_nodes} quiescence nodes, {self.moves_searched}/{self.moves_generated} generated moves searched ({ratio:.0%}), {self.legality_checks} legality checks, {self.tablebase_hits} tablebase hits", 'info')
+
+    def search(self, board: Board, depth: Union[int, None] = None, root_moves: Union[list[Move], None] = None,
+               max_nodes: Union[int, None] = None, max_time: Union[float, None] = None, soft_time: Union[float, None] = None) -> tuple[Union[Move, None], int]:
+        """
+        Iterative deepening alpha-beta search, resolving captures at the leaves with quiescence search.
+        Positions in the opening book are answered with the book move without searching (score 0), and positions in
+        the endgame tables with the exact best move.
+
+        Args:
+            board: The Board to search; it is left as it was found.
+            depth: Search depth in plies (defaults to max_depth, or as deep as the limits allow if there are limits).
+            root_moves: Only search these moves at the root (defaults to every legal move).
+            max_nodes: Stop after searching this many nodes (quiescence nodes included).
+            max_time: Stop after this many seconds.
+            soft_time: Don't start another iteration after about this many seconds: less once the best move has
+                stayed the same for a few iterations, more while it keeps changing.
+
+        Returns:
+            The best move of the last completed iteration (None if there are no legal moves) and its score from
+            the side to move point of view.
+        """
+        self.reset_statistics()
+        self.killers = [[] for _ in range(MAX_PLY)]
+        if self.book is not None and root_moves is None:
+            book_move = self.book.choose(board)
+            if book_move is not None:
+                return book_move, 0
+        if self.tablebases is not None and root_moves is None:
+            scored_moves = self.tablebase_scores(board)
+            if scored_moves:
+                return scored_moves[0]
+        if depth is None:
+            depth = MAX_PLY - 1 if max_nodes is not None or max_time is not None or soft_time is not None else self.max_depth
+        if self.workers > 1 and root_moves is None:
+            return self.search_parallel(board, depth, max_nodes, max_time)
+
+        root_moves = list(root_moves) if root_moves is not None else list(MovePicker(board))
+        if not root_moves:
+            return None, -MATE_SCORE if board.in_check() else 0
+        # The root entry is only stored when every legal move was searched: a share's best isn't the position's
+        all_root_moves = len(root_moves) == len(board.get_legal_moves())
+
+        self.max_nodes = max_nodes
+        search_start = time.monotonic()
+        self.deadline = search_start + max_time if max_time is not None else None
+        plies_played = len(board.move_stack)
+        best_move, best_score = root_moves[0], -INFINITY
+        stable_iterations = 0
+        for current_depth in range(1, depth + 1):
+            previous_best_move = best_move
+            try:
+                best_move, best_score = self.search_root(board, root_moves, current_depth, store=all_root_moves)
+            except SearchAborted:
+                # Take back the moves of the interrupted line and keep the last completed iteration
+                while len(board.move_stack) > plies_played:
+                    board.unmake_move()
+                if current_depth == 1:
+                    # No iteration completed: score the fallback move statically rather than as -INFINITY (worse than mate)
+                    board.make_move(*best_move)
+                    best_score = -self.evaluate(board)
+                    board.unmake_move()
+                break
+            self.depth_reached = current_depth
+            if self.on_iteration is not None:
+                self.on_iteration(current_depth, best_move, best_score)
+            # Search the best move first on the next iteration
+            root_moves.remove(best_move)
+            root_moves.insert(0, best_move)
+            # A forced mate won't change with more depth
+            if abs(best_score) > MATE_THRESHOLD:
+                break
+            # Time management: stop early once the best move has settled
+            stable_iterations = stable_iterations + 1 if current_depth > 1 and best_move == previous_best_move else 0
+            if soft_time is not None and time.monotonic() - search_start >= soft_time * soft_limit_scale(stable_iterations):
+                break
+
+        self.max_nodes, self.deadline = None, None
+        return best_move, best_score
+
+    def search_clock(self, board: Board, time_left: float, increment: float = 0.0, moves_to_go: Union[int, None] = None) -> tuple[Union[Move, None], int]:
+        """
+        Searches with a time budget taken from the clock of the side to move (see clock.allocate()).
+
+        Args:
+            board: The Board to search.
+            time_left: Seconds on the clock of the side to move.
+            increment: Seconds added after the move.
+            moves_to_go: Moves until the next time control, if the time control has sessions.
+        """
+        soft_time, hard_time = allocate(time_left, increment, moves_to_go)
+        return self.search(board, max_time=hard_time, soft_time=soft_time)
+
+    def principal_variation(self, board: Board, move: Move, max_length: int = 16) -> list[Move]:
+        # The expected line starting with move, following the best moves stored in the transposition table
+        line, plies_played = [], len(board.move_stack)
+        while move is not None and len(line) < max_length and move in board.get_legal_moves():
+            line.append(move)
+            board.make_move(*move)
+            if board.repetitions() >= 1:
+                break
+            entry = self.transposition_table.get(board.hash)
+            move = entry[3] if entry is not None else None
+        while len(board.move_stack) > plies_played:
+            board.unmake_move()
+        return line
+
+    def check_limits(self):
+        nodes = self.nodes + self.quiescence_nodes
+        if self.max_nodes is not None and nodes >= self.max_nodes:
+            raise SearchAborted
+        if nodes % 256 == 0 and ((self.deadline is not None and time.monotonic() >= self.deadline) or (self.stop_event is not None and self.stop_event.is_set())):
+            raise SearchAborted
+
+    def search_root(self, board: Board, root_moves: list[Move], depth: int, store: bool = True) -> tuple[Move, int]:
+        self.nodes += 1
+        alpha, best_move = -INFINITY, root_moves[0]
+        for move in root_moves:
+            board.make_move(*move)
+            score = -self.negamax(board, depth - 1, -INFINITY, -alpha, 1)
+            board.unmake_move()
+            if score > alpha:
+                alpha, best_move = score, move
+        if store:
+            self.transposition_table.put(board.hash, (depth, score_to_table(alpha, 0), EXACT, best_move))
+        return best_move, alpha
+
+    def score_moves(self, board: Board, depth: Union[int, None] = None) -> list[tuple[Move, int]]:
+        """
+        Scores every legal move with a full window search, for analysis (top alternatives, played move loss).
+
+        Args:
+            board: The Board to analyse; it is left as it was found.
+            depth: Search depth in plies (defaults to max_depth).
+
+        Returns:
+            (move, score) pairs from the side to move point of view, best first.
+        """
+        depth = depth or self.max_depth
+        scored_moves = self.tablebase_scores(board) if self.tablebases is not None else None
+        if scored_moves is not None:
+            return scored_moves
+        # A normal search first fills the tables, so the full window searches below are cheap
+        self.search(board, depth)
+        scored_moves = []
+        for move in MovePicker(board, self.transposition_table.get(board.hash, (0, 0, 0, None))[3]):
+            board.make_move(*move)
+            scored_moves.append((move, -self.negamax(board, depth - 1, -INFINITY, INFINITY, 1)))
+            board.unmake_move()
+        return sorted(scored_moves, key=lambda scored_move: -scored_move[1])
+
+    def tablebase_scores(self, board: Board) -> Union[list[tuple[Move, int]], None]:
+        """
+        Scores every legal move with the endgame tables, best first (the fastest mate, the slowest loss), or None
+        if some position isn't in the tables.
+        """
+        scored_moves = []
+        for move in MovePicker(board):
+            board.make_move(*move)
+            value = self.tablebases.probe(board)
+            board.unmake_move()
+            if value is None:
+                return None
+            self.tablebase_hits += 1
+            scored_moves.append((move, -tablebase_score(value, 1)))
+        return sorted(scored_moves, key=lambda scored_move: -scored_move[1])
+
+    def search_parallel(self, board: Board, depth: int, max_nodes: Union[int, None] = None, max_time: Union[float, None] = None) -> tuple[Union[Move, None], int]:
+        """
+        Splits the root moves across a process pool, each worker searching its share to full depth (with the shared
+        transposition table if the engine has one). Moves are ordered by a shallow search first and dealt round-robin, so every worker gets some good
+        candidates. Results are merged deterministically: best score, then earliest move in the root ordering.
+        """
+        root_moves = list(MovePicker(board))
+        if not root_moves:
+            return None, -MATE_SCORE if board.in_check() else 0
+        if depth > 1:
+            best_move, _ = self.search(board, 1, root_moves=root_moves)
+            root_moves.remove(best_move)
+            root_moves.insert(0, best_move)
+
+        if self.pool is None:
+            self.pool = multiprocessing.Pool(self.workers)
+        shares = [root_moves[i::self.workers] for i in range(self.workers)]
+        shared_table = self.transposition_table if isinstance(self.transposition_table, SharedTranspositionTable) else None
+        results = self.pool.starmap(_search_root_moves, [(board, share, depth, shared_table, max_nodes // self.workers if max_nodes else None, max_time, self.tablebases)
+                                                          for share in shares if share])
+
+        best_move, best_score = None, -INFINITY
+        for move, score, nodes, _ in results:
+            self.nodes += nodes
+            if score > best_score or (score == best_score and root_moves.index(move) < root_moves.index(best_move)):
+                best_move, best_score = move, score
+        # Workers only searched their shares, the merged result is the root entry (at the depth every share completed)
+        self.depth_reached = min(depth_reached for _, _, _, depth_reached in results)
+        if self.depth_reached > 0:
+            self.transposition_table.put(board.hash, (self.depth_reached, score_to_table(best_score, 0), EXACT, best_move))
+        return best_move, best_score
+
+    def close(self):
+        # Stop the worker processes of parallel searches and release a shared table, book or endgame tables owned by this engine
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+        if isinstance(self.transposition_table, SharedTranspositionTable) and self.transposition_table.owner:
+            self.transposition_table.close()
+        if self.owns_book:
+            self.book.close()
+        if self.owns_tablebases:
+            self.tablebases.close()
+
+    def negamax(self, board: Board, depth: int, alpha: int, beta: int, ply: int) -> int:
+        self.nodes += 1
+        self.check_limits()
+        # Repeated positions and the fifty-move rule are draws
+        if ply > 0 and (board.repetitions() >= 1 or board.halfmove_clock >= 100):
+            return 0
+        # Exact result from the endgame tables
+        if ply > 0 and self.tablebases is not None:
+            value = self.tablebases.probe(board)
+            if value is not None:
+                self.tablebase_hits += 1
+                return tablebase_score(value, ply)
+        if depth <= 0 or ply >= MAX_PLY - 1:
+            return self.quiescence(board, alpha, beta, ply)
+
+        # Transposition table: cutoff on a deep enough entry, otherwise just use its move first
+        alpha_original = alpha
+        entry = self.transposition_table.get(board.hash)
+        hash_move = None
+        if entry is not None:
+            entry_depth, entry_score, entry_bound, hash_move = entry
+            entry_score = score_from_table(entry_score, ply)
+            if ply > 0 and entry_depth >= depth and (entry_bound == EXACT or (entry_bound == LOWER_BOUND and entry_score >= beta) or (entry_bound == UPPER_BOUND and entry_score <= alpha)):
+                return entry_score
+
+        picker = MovePicker(board, hash_move, self.killers[ply], self.history)
+        best_score, best_move, searched = -INFINITY, None, 0
+        for move in picker:
+            searched += 1
+            board.make_move(*move)
+            score = -self.negamax(board, depth - 1, -beta, -alpha, ply + 1)
+            board.unmake_move()
+            if score > best_score:
+                best_score, best_move = score, move
+            alpha = max(alpha, score)
+            if alpha >= beta:
+                if not is_tactical(board, move):
+                    self.store_killer(move, ply)
+                    self.history[(move[0], move[1])] = self.history.get((move[0], move[1]), 0) + depth * depth
+                break
+        self.update_statistics(picker, searched)
+
+        if best_move is None:
+            return -MATE_SCORE + ply if board.in_check() else 0
+
+        bound = LOWER_BOUND if best_score >= beta else UPPER_BOUND if best_score <= alpha_original else EXACT
+        self.transposition_table.put(board.hash, (depth, score_to_table(best_score, ply), bound, best_move))
+        return best_score
+
+    def update_statistics(self, picker: MovePicker, searched: int):
+        self.moves_generated += picker.generated
+        self.legality_checks += picker.legality_checks
+        self.moves_searched += searched
+
+    def store_killer(self, move: Move, ply: int):
+        killers = self.killers[ply]
+        if move not in killers:
+            killers.insert(0, move)
+            del killers[2:]
+
+    def quiescence(self, board: Board, alpha: int, beta: int, ply: int) -> int:
+        """
+        Searches only captures and promotions until the position is quiet, so the static evaluation is never taken
+        in the middle of an exchange (horizon effect). Captures that lose material by SEE are not searched.
+        """
+        self.quiescence_nodes += 1
+        self.check_limits()
+        # Stand pat: the side to move can always decline to capture
+        stand_pat = self.evaluate(board)
+        if stand_pat >= beta:
+            return stand_pat
+        alpha = max(alpha, stand_pat)
+
+        picker = MovePicker(board, tactical_only=True, capture_filter=lambda b, move: is_promotion(b, move) or (is_capture(b, move) and static_exchange_evaluation(b, move[0], move[1], move[2]) >= 0))
+        searched = 0
+        for move in picker:
+            searched += 1
+            board.make_move(*move)
+            score = -self.quiescence(board, -beta, -alpha, ply + 1)
+            board.unmake_move()
+            if score >= beta:
+                alpha = score
+                break
+            alpha = max(alpha, score)
+        self.update_statistics(picker, searched)
+        return alpha
+
+
+@timer
 def main():
-    print(f'Hello World!')
+    board = Board()
+    engine = Engine()
+    best_move, score = engine.search(board)
+    cute_print(f"Best move {position_to_chess_notation(best_move[0])}-{position_to_chess_notation(best_move[1])} ({score})", 'rocket')
+    engine.report()
 
 
 if __name__ == '__main__':
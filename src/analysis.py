@@ -0,0 +1,62 @@
+from typing import Tuple
+from src.tables import PIECE_VALUES
+
+# A king can take part in an exchange, but it can never be the piece left hanging
+SEE_KING_VALUE = 20000
+
+
+def see_value(piece) -> int:
+    return SEE_KING_VALUE if piece.type == 'king' else PIECE_VALUES[piece.type]
+
+
+def static_exchange_evaluation(board, start_position: Tuple[int, int], end_position: Tuple[int, int], move_label: str = 'opponent-standard') -> int:
+    """
+    Static exchange evaluation (SEE): material balance of capturing on end_position and letting both colors
+    recapture there with their least valuable attacker, each side free to stop when continuing would lose.
+    Attackers hidden behind pieces already traded (x-rays) join the exchange as it goes.
+
+    Args:
+        board: The Board where the capture happens.
+        start_position: A tuple (row, col) of the capturing piece.
+        end_position: A tuple (row, col) of the captured square.
+        move_label: The capture move label (en passant captures a pawn that is not on end_position).
+
+    Returns:
+        Material won (positive) or lost (negative) by the side making the capture, in centipawns.
+    """
+    attacker = board.get_piece_at(start_position)
+    target = board.get_piece_at(end_position)
+    gains = [PIECE_VALUES['pawn'] if 'passant' in move_label else (see_value(target) if target is not None else 0)]
+
+    # Pieces that already captured on end_position are removed from the board for the next attackers lookup
+    traded = [start_position]
+    value_on_square = see_value(attacker)
+    side = 'black' if attacker.color == 'white' else 'white'
+
+    while True:
+        attackers = board.attackers(end_position, side, ignore=tuple(traded))
+        if not attackers:
+            break
+        position, piece = min(attackers, key=lambda attacker_data: see_value(attacker_data[1]))
+        # Gain of capturing the piece standing on the square, if the opponent then keeps going
+        gains.append(value_on_square - gains[-1])
+        value_on_square = see_value(piece)
+        traded.append(position)
+        side = 'black' if side == 'white' else 'white'
+
+    # Each side only keeps capturing if it doesn't make its balance worse
+    for i in range(len(gains) - 1, 0, -1):
+        gains[i - 1] = -max(-gains[i - 1], gains[i])
+
+    return gains[0]
+
+
+def label_capture(board, start_position: Tuple[int, int], end_position: Tuple[int, int], move_label: str = 'opponent-standard') -> str:
+    """
+    Labels a capture for the analysis panel from its static exchange evaluation.
+
+    Returns:
+        'winning', 'even' or 'losing'.
+    """
+    balance = static_exchange_evaluation(board, start_position, end_position, move_label)
+    return 'winning' if balance > 0 else 'losing' if balance < 0 else 'even'
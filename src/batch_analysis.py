@@ -0,0 +1,263 @@
+import argparse
+import json
+import os
+import pathlib
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from typing import Iterator, Union
+from src.board import Board
+from src.game import load_log
+from src.ai import Engine, MATE_SCORE
+from src.book import OpeningBook
+from src.mate_solver import MateSolver, MAX_HORIZON_MOVES
+from src.pgn import read_games, count_games, san_to_move, move_to_san, square_name
+from src.utils import cute_print, progress_bar
+
+# Score lost by the played move against the best move, in centipawns, for each flag
+MOVE_FLAGS = (('blunder', 200), ('mistake', 100), ('inaccuracy', 50))
+TOP_MOVES = 5
+# Forced mates looked for in every position (proof-number search), to flag the missed ones
+MATE_MOVES = 2
+MATE_NODES = 5000
+MATE_HASH_MB = 8
+
+# One engine per worker process, so its tables stay warm from one game to the next
+_WORKER_ENGINE: Union[Engine, None] = None
+_WORKER_BOOK: Union[OpeningBook, None] = None
+_WORKER_SOLVER: Union[MateSolver, None] = None
+
+
+# --------------------------------------------------------------------------------------------------- ARCHIVE
+def iter_archive(directory: pathlib.Path) -> Iterator[tuple[str, dict, list]]:
+    """
+    Streams every game of a directory: PGN files (possibly many games each) and JSON logs saved by GameState.
+    JSON files that aren't game logs are skipped with a warning.
+
+    Yields:
+        (game_id, tags, moves) with moves as SAN strings (PGN) or (start_position, end_position) pairs (logs).
+    """
+    for path in sorted(directory.rglob('*')):
+        relative_path = path.relative_to(directory).as_posix()
+        if path.suffix.lower() == '.pgn':
+            for index, (tags, san_moves) in enumerate(read_games(path)):
+                yield f'{relative_path}#{index}', tags, san_moves
+        elif path.suffix.lower() == '.json':
+            try:
+                tags, moves = load_log(path)
+            except (ValueError, KeyError, TypeError, UnicodeDecodeError) as error:
+                # Other JSON files (dataset manifests, metrics reports...) can share the directory
+                cute_print(f"Skipping {relative_path}: not a game log ({type(error).__name__}: {error})", 'warning', 'yellow')
+                continue
+            yield relative_path, tags, moves
+
+
+def count_archive(directory: pathlib.Path) -> int:
+    return sum(count_games(path) if path.suffix.lower() == '.pgn' else 1 for path in directory.rglob('*') if path.suffix.lower() in ('.pgn', '.json'))
+
+
+def done_game_ids(output_path: pathlib.Path) -> set[str]:
+    # Games already written by a previous run; a line cut by a crash is simply analysed again
+    done = set()
+    if output_path.exists():
+        with open(output_path, encoding='utf-8') as output_file:
+            for line in output_file:
+                try:
+                    done.add(json.loads(line)['GameId'])
+                except (json.JSONDecodeError, KeyError):
+                    continue
+    return done
+
+
+def drop_partial_line(output_path: pathlib.Path):
+    # A crash can leave the last record cut mid-line: truncate it, so resumed records start on a line of their own
+    if not output_path.exists():
+        return
+    with open(output_path, 'rb+') as output_file:
+        end = output_file.seek(0, os.SEEK_END)
+        position = end
+        while position > 0:
+            start = max(position - 65536, 0)
+            output_file.seek(start)
+            newline = output_file.read(position - start).rfind(b'\n')
+            if newline >= 0:
+                position = start + newline + 1
+                break
+            position = start
+        if position < end:
+            output_file.truncate(position)
+
+
+# --------------------------------------------------------------------------------------------------- ANALYSIS
+def tally_mate_search(mate_search: dict, solver: MateSolver):
+    # The solver keeps the statistics of its last call only
+    mate_search['Nodes'] += solver.nodes
+    mate_search['Seconds'] += solver.seconds
+    mate_search['Undecided'] += solver.budget_exhausted
+
+
+def resolve_move(board: Board, move) -> Union[tuple, None]:
+    if isinstance(move, str):
+        return san_to_move(board, move)
+    start_position, end_position = move
+    return next((legal_move for legal_move in board.get_legal_moves() if legal_move[0] == start_position and legal_move[1] == end_position), None)
+
+
+def analyse_game(game_id: str, tags: dict, moves: list, depth: int, book_path: Union[pathlib.Path, None] = None,
+                 tablebases_path: Union[pathlib.Path, None] = None, mate_moves: int = MATE_MOVES, mate_nodes: int = MATE_NODES) -> dict:
+    """
+    Replays a game and analyses every position: best move, evaluation, top alternatives and played move flags.
+    Book moves are reported from the opening book without searching, and endgames in the tables are scored
+    exactly. Forced mates up to mate_moves moves are proven with a mate_nodes budget per position (0 turns it off), and
+    played moves that let one go are flagged 'missed mate'. Runs in a worker process.
+
+    Returns:
+        A JSON-ready dict with the game id, tags and one entry per ply.
+    """
+    global _WORKER_ENGINE, _WORKER_BOOK, _WORKER_SOLVER
+    if _WORKER_ENGINE is None or _WORKER_ENGINE.max_depth != depth or getattr(_WORKER_ENGINE.tablebases, 'directory', None) != tablebases_path:
+        _WORKER_ENGINE = Engine(max_depth=depth, tablebases=tablebases_path)
+    engine = _WORKER_ENGINE
+    if book_path is not None and (_WORKER_BOOK is None or _WORKER_BOOK.path != book_path):
+        _WORKER_BOOK = OpeningBook(book_path)
+    book = _WORKER_BOOK if book_path is not None else None
+    if mate_moves and mate_nodes and (_WORKER_SOLVER is None or _WORKER_SOLVER.max_nodes != mate_nodes):
+        _WORKER_SOLVER = MateSolver(mate_nodes, MATE_HASH_MB)
+    solver = _WORKER_SOLVER if mate_moves and mate_nodes else None
+    mate_search = {'Nodes': 0, 'Seconds': 0.0, 'Undecided': 0}
+
+    board = Board()
+    positions = []
+    for ply, move in enumerate(moves):
+        played_move = resolve_move(board, move)
+        if played_move is None:
+            positions.append({'Ply': ply, 'Error': f'Illegal or unreadable move {move}'})
+            break
+
+        book_moves = book.moves(board) if book is not None else []
+        if played_move in (book_move for book_move, _ in book_moves):
+            positions.append({'Ply': ply,
+                              'Color': board.turn.title(),
+                              'Played': move_to_san(board, played_move),
+                              'Best': move_to_san(board, book_moves[0][0]),
+                              'Book': True,
+                              'Flag': None,
+                              'Top': [{'Move': move_to_san(board, book_move), 'From': square_name(book_move[0]), 'To': square_name(book_move[1]), 'Weight': weight}
+                                      for book_move, weight in book_moves[:TOP_MOVES]]})
+            board.make_move(*played_move)
+            continue
+
+        scored_moves = engine.score_moves(board, depth)
+        tablebase = engine.tablebases is not None and engine.tablebases.probe(board) is not None
+        best_move, best_score = scored_moves[0]
+        played_score = next(score for scored_move, score in scored_moves if scored_move == played_move)
+        side = 1 if board.turn == 'white' else -1
+        mate_in, played_mate_in, missed_mate = None, None, False
+        if solver is not None:
+            mate_move, mate_in = solver.solve(board, mate_moves)
+            tally_mate_search(mate_search, solver)
+            if mate_in is not None:
+                if played_move == mate_move:
+                    played_mate_in = mate_in
+                else:
+                    # Shortest mate the played move still forces within the horizon; missed when it forces none
+                    proofs = []
+                    for moves_to_mate in range(mate_in, mate_moves + 1):
+                        proofs.append(solver.keeps_mate(board, played_move, moves_to_mate))
+                        tally_mate_search(mate_search, solver)
+                        if proofs[-1]:
+                            played_mate_in = moves_to_mate
+                            break
+                    missed_mate = proofs[-1] is False
+                # Proven mates score like the engine's (mate in n moves is 2n - 1 plies away), not the shallow search
+                best_move, best_score = mate_move or best_move, MATE_SCORE - (2 * mate_in - 1)
+                if played_mate_in is not None:
+                    played_score = MATE_SCORE - (2 * played_mate_in - 1)
+                elif not missed_mate:
+                    # Undecided: the engine scores are kept for the loss
+                    best_move, best_score = scored_moves[0]
+        loss = best_score - played_score
+
+        positions.append({'Ply': ply,
+                          'Color': board.turn.title(),
+                          'Played': move_to_san(board, played_move),
+                          'Best': move_to_san(board, best_move),
+                          'Eval': side * best_score,
+                          'PlayedEval': side * played_score,
+                          'Loss': loss,
+                          'Tablebase': tablebase,
+                          'MateIn': mate_in,
+                          'Flag': 'missed mate' if missed_mate else None if played_mate_in is not None else next((flag for flag, threshold in MOVE_FLAGS if loss >= threshold), None),
+                          'Top': [{'Move': move_to_san(board, top_move), 'From': square_name(top_move[0]), 'To': square_name(top_move[1]), 'Eval': side * score}
+                                  for top_move, score in scored_moves[:TOP_MOVES]]})
+        board.make_move(*played_move)
+
+    if solver is not None:
+        mate_search['NodesPerSecond'] = mate_search['Nodes'] / mate_search['Seconds'] if mate_search['Seconds'] else 0
+        mate_search['TableBytes'] = solver.memory_bytes
+    return {'GameId': game_id, 'Tags': tags, 'Positions': positions, 'MateSearch': mate_search if solver is not None else None}
+
+
+def run(directory: pathlib.Path, output_path: pathlib.Path, depth: int = 2, workers: int = os.cpu_count() or 1, resume: bool = True,
+        book_path: Union[pathlib.Path, None] = None, tablebases_path: Union[pathlib.Path, None] = None, mate_moves: int = MATE_MOVES,
+        mate_nodes: int = MATE_NODES):
+    """
+    Analyses a whole archive on a process pool, appending one JSON line per game to output_path as games finish.
+    Only a few games per worker are in flight at a time, so memory doesn't grow with the archive size.
+    """
+    if resume:
+        drop_partial_line(output_path)
+    done = done_game_ids(output_path) if resume else set()
+    total = count_archive(directory) - len(done)
+    if total <= 0:
+        cute_print(f"Nothing to analyse in {directory}", 'finish_flag', 'green')
+        return
+    cute_print(f"Analysing {total} games from {directory} with {workers} workers (depth {depth})", 'rocket')
+
+    games = ((game_id, tags, moves) for game_id, tags, moves in iter_archive(directory) if game_id not in done)
+    completed, start_time = 0, time.time()
+    with ProcessPoolExecutor(workers) as executor, open(output_path, 'a' if resume else 'w', encoding='utf-8') as output_file:
+        pending = set()
+        for game in games:
+            pending.add(executor.submit(analyse_game, *game, depth, book_path, tablebases_path, mate_moves, mate_nodes))
+            if len(pending) < workers * 2:
+                continue
+            finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+            completed = write_results(finished, output_file, completed, total, start_time)
+        while pending:
+            finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+            completed = write_results(finished, output_file, completed, total, start_time)
+
+    cute_print(f"Analysis saved at {output_path}", 'download', 'green')
+
+
+def write_results(finished, output_file, completed: int, total: int, start_time: float) -> int:
+    for future in finished:
+        output_file.write(json.dumps(future.result()) + '\n')
+        # Flushed per game, so a crash loses at most the games in flight
+        output_file.flush()
+        completed += 1
+        progress_bar(min(completed, total), total, start_time, title='Analysis')
+    return completed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Analyse every position of a directory of PGN files and saved game logs.')
+    parser.add_argument('directory', type=pathlib.Path, help='Directory with .pgn and .json game logs (searched recursively)')
+    parser.add_argument('-o', '--output', type=pathlib.Path, default=pathlib.Path('analysis.jsonl'), help='JSON lines output file')
+    parser.add_argument('-d', '--depth', type=int, default=2, help='Engine search depth in plies')
+    parser.add_argument('-w', '--workers', type=int, default=os.cpu_count() or 1, help='Worker processes')
+    parser.add_argument('-b', '--book', type=pathlib.Path, help='Opening book; book moves are not searched')
+    parser.add_argument('-t', '--tablebases', type=pathlib.Path, help='Endgame tables directory; positions in the tables are scored exactly')
+    parser.add_argument('--mate-moves', type=int, default=MATE_MOVES, help=f'Longest forced mate looked for in every position, in moves (0 to skip, up to {MAX_HORIZON_MOVES})')
+    parser.add_argument('--mate-nodes', type=int, default=MATE_NODES, help='Proof-number search node budget per position')
+    parser.add_argument('--restart', action='store_true', help="Overwrite the output instead of resuming after the games it already has")
+    args = parser.parse_args()
+    if not 0 <= args.mate_moves <= MAX_HORIZON_MOVES:
+        parser.error(f"--mate-moves must be between 0 and {MAX_HORIZON_MOVES}")
+
+    run(args.directory, args.output, args.depth, args.workers, resume=not args.restart, book_path=args.book, tablebases_path=args.tablebases,
+        mate_moves=args.mate_moves, mate_nodes=args.mate_nodes)
+
+
+if __name__ == '__main__':
+    main()
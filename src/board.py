@@ -1,13 +1,72 @@
 from src.pieces import Piece, King, Queen, Bishop, Knight, Rook, Pawn
-from typing import Tuple, Union
-from src.utils import cute_print, find_position
+from typing import Callable, Tuple, Union
+from src.utils import cute_print, find_position, LRUCache
+from src.zobrist import compute_hash, piece_key, SIDE_KEY, CASTLING_KEYS, EN_PASSANT_KEYS
+from src.tables import PIECE_VALUES, PIECE_SQUARE_TABLES, KNIGHT_STEPS, KING_STEPS, SLIDER_DIRECTIONS, pst_index, pawn_forward
 import sys
 
+# Valid moves per (position hash, square), shared by every board: UI clicks, hints and analysis
+LEGAL_MOVES_CACHE_SIZE = 4096
+LEGAL_MOVES_CACHE = LRUCache(LEGAL_MOVES_CACHE_SIZE)
+
+
+class MoveRecord:
+    """Everything Board.unmake_move() needs to take a move back, without copying the board."""
+
+    def __init__(self, piece: Piece, start_position: Tuple[int, int], end_position: Tuple[int, int], move_label: str):
+        self.piece = piece
+        self.start_position = start_position
+        self.end_position = end_position
+        self.move_label = move_label
+        # Captured piece and where it was taken (differs from end_position on en passant)
+        self.captured_piece: Union[Piece, None] = None
+        self.captured_position: Union[Tuple[int, int], None] = None
+        # Rook moved by castling
+        self.rook: Union[Rook, None] = None
+        self.rook_start_position: Union[Tuple[int, int], None] = None
+        self.rook_end_position: Union[Tuple[int, int], None] = None
+        # Piece that replaced the pawn on promotion
+        self.promoted_piece: Union[Piece, None] = None
+        # Board state before the move
+        self.hash_before: int = 0
+        self.halfmove_clock_before: int = 0
+        self.en_passant_square_before: Union[Tuple[int, int], None] = None
+        self.material_before: dict[str, int] = {}
+        self.pst_before: dict[str, int] = {}
+
+    @property
+    def special(self) -> Union[bool, dict]:
+        # Same format used by GameState.record_turn() logs
+        if self.promoted_piece is not None:
+            return {'Type': 'Promotion', 'Obs': self.promoted_piece.type.title()}
+        elif 'passant' in self.move_label:
+            return {'Type': 'En Passant', 'Obs': self.move_label[self.move_label.index('-')+1:self.move_label.index('_')].title()}
+        elif self.rook is not None:
+            return {'Type': 'Castling', 'Obs': self.move_label[self.move_label.index('-')+1:self.move_label.index('_')].title()}
+        return False
+
+    @property
+    def capture(self) -> Union[bool, str]:
+        return self.captured_piece.type.title() if self.captured_piece is not None else False
+
 
 class Board:
-    def __init__(self):
+    # When True every make/unmake checks the incremental scores against a full recompute (slow, for debugging)
+    debug_scores: bool = False
+
+    def __init__(self, setup: bool = True):
         self.board: list[list] = [[None for _ in range(8)] for _ in range(8)]
-        self.setup_board()
+        self.move_stack: list[MoveRecord] = []
+        self.kings: dict[str, King] = {}
+        # Side to move, square a pawn can capture en passant and moves since last capture or pawn move
+        self.turn: str = 'white'
+        self.en_passant_square: Union[Tuple[int, int], None] = None
+        self.halfmove_clock: int = 0
+        if setup:
+            self.setup_board()
+        self.hash: int = compute_hash(self)
+        # Material and piece-square table sums per color, updated by deltas on every move
+        self.material, self.pst = self.compute_scores()
 
     def setup_board(self):
         # Initialize board with starting piece placements
@@ -20,6 +79,7 @@ class Board:
         for color, row in zip(("black", "white"), (0, 7)):
             for j, piece_type in enumerate([Rook, Knight, Bishop, Queen, King, Bishop, Knight, Rook]):
                 self.board[row][j] = piece_type(color, positions[row * 8 + j])
+            self.kings[color] = self.board[row][4]
 
     def get_piece_at(self, position: Tuple[int, int]) -> Union[Piece, None]:
         """
@@ -37,6 +97,162 @@ class Board:
         else:
             return None
 
+    def get_valid_moves(self, position: Tuple[int, int]) -> list[tuple[tuple[int, int], str]]:
+        """
+        Gets the valid moves of the piece at a position, cached by position hash so re-clicks and every
+        consumer of the same position (UI, hints, analysis) compute them once. A move changes the hash, so
+        entries of older positions are simply never hit again until the LRU drops them.
+
+        Args:
+            position: A tuple (row, col) representing the board position.
+
+        Returns:
+            The piece get_valid_moves() result, or an empty list if there is no piece at position.
+        """
+        piece = self.get_piece_at(position)
+        if piece is None:
+            return []
+
+        key = (self.hash, position)
+        valid_moves = LEGAL_MOVES_CACHE.get(key)
+        if valid_moves is None:
+            valid_moves = tuple(piece.get_valid_moves(self))
+            LEGAL_MOVES_CACHE.put(key, valid_moves)
+        return list(valid_moves)
+
+    def iter_attackers(self, position: Tuple[int, int], color: str, ignore: tuple = ()):
+        """
+        Yields the (position, piece) of every piece of color attacking a square, looking outwards from that square.
+
+        Args:
+            position: A tuple (row, col) of the attacked square.
+            color: Color of the attacking pieces.
+            ignore: Positions treated as empty (pieces already traded off in an exchange, a king leaving its square).
+        """
+        row, col = position
+        # Pawns attack diagonally forward, so they sit one row behind the square
+        pawn_row = row - pawn_forward(color)
+        for col_step in (-1, 1):
+            piece = self.get_piece_at((pawn_row, col + col_step))
+            if piece is not None and piece.color == color and piece.type == 'pawn' and (pawn_row, col + col_step) not in ignore:
+                yield (pawn_row, col + col_step), piece
+        for steps, piece_type in ((KNIGHT_STEPS, 'knight'), (KING_STEPS, 'king')):
+            for row_step, col_step in steps:
+                piece = self.get_piece_at((row + row_step, col + col_step))
+                if piece is not None and piece.color == color and piece.type == piece_type and (row + row_step, col + col_step) not in ignore:
+                    yield (row + row_step, col + col_step), piece
+        # Sliders: first piece found on each ray
+        for row_step, col_step in SLIDER_DIRECTIONS['queen']:
+            slider_type = 'rook' if row_step == 0 or col_step == 0 else 'bishop'
+            new_row, new_col = row + row_step, col + col_step
+            while 0 <= new_row < 8 and 0 <= new_col < 8:
+                piece = self.board[new_row][new_col]
+                if piece is not None and (new_row, new_col) not in ignore:
+                    if piece.color == color and piece.type in (slider_type, 'queen'):
+                        yield (new_row, new_col), piece
+                    break
+                new_row, new_col = new_row + row_step, new_col + col_step
+
+    def attackers(self, position: Tuple[int, int], color: str, ignore: tuple = ()) -> list[tuple[tuple[int, int], Piece]]:
+        return list(self.iter_attackers(position, color, ignore))
+
+    def is_attacked(self, position: Tuple[int, int], color: str, ignore: tuple = ()) -> bool:
+        return next(self.iter_attackers(position, color, ignore), None) is not None
+
+    def find_king(self, color: str) -> Union[King, None]:
+        king = self.kings.get(color)
+        if king is None or self.get_piece_at(king.current_square) is not king:
+            king = next(self.get_all_pieces(filter_by=(lambda piece, filter_color: isinstance(piece, King) and piece.color == filter_color, color)), None)
+            self.kings[color] = king
+        return king
+
+    def in_check(self, color: Union[str, None] = None) -> bool:
+        color = color or self.turn
+        king = self.find_king(color)
+        return king is not None and self.is_attacked(king.current_square, 'black' if color == 'white' else 'white')
+
+    def get_legal_moves(self, color: Union[str, None] = None, move_filter: Union[Callable, None] = None) -> list[tuple[tuple[int, int], tuple[int, int], str]]:
+        """
+        Gets every move of a color that doesn't leave its own king attacked.
+
+        Args:
+            color: 'white' or 'black', defaults to the side to move.
+            move_filter: Optional function (board, move) -> bool applied before the (more expensive) legality check.
+
+        Returns:
+            A list of (start_position, end_position, move_label) tuples, ready for make_move().
+        """
+        color = color or self.turn
+        legal_moves = []
+        for piece in list(self.get_all_pieces(filter_by=(lambda piece, filter_color: piece is not None and piece.color == filter_color, color))):
+            start_position = piece.current_square
+            for end_position, move_label in self.get_valid_moves(start_position):
+                if move_filter is not None and not move_filter(self, (start_position, end_position, move_label)):
+                    continue
+                if self.is_legal(start_position, end_position, move_label):
+                    legal_moves.append((start_position, end_position, move_label))
+        return legal_moves
+
+    def is_legal(self, start_position: Tuple[int, int], end_position: Tuple[int, int], move_label: str) -> bool:
+        target = self.get_piece_at(end_position)
+        if target is not None and target.type == 'king':
+            return False
+        color = self.get_piece_at(start_position).color
+        self.make_move(start_position, end_position, move_label)
+        legal = not self.in_check(color)
+        self.unmake_move()
+        return legal
+
+    def compute_scores(self) -> tuple[dict[str, int], dict[str, int]]:
+        """Computes material and piece-square table sums per color walking the whole board."""
+        material = {'white': 0, 'black': 0}
+        pst = {'white': 0, 'black': 0}
+        for row in range(8):
+            for col in range(8):
+                piece = self.board[row][col]
+                if piece is not None:
+                    material[piece.color] += PIECE_VALUES[piece.type]
+                    pst[piece.color] += PIECE_SQUARE_TABLES[piece.type][pst_index(piece.color, (row, col))]
+        return material, pst
+
+    def static_score(self) -> int:
+        """
+        Material plus piece-square tables in centipawns from white's point of view, in O(1) from the incremental sums.
+        """
+        return self.material['white'] + self.pst['white'] - self.material['black'] - self.pst['black']
+
+    def check_scores(self):
+        material, pst = self.compute_scores()
+        if material != self.material or pst != self.pst:
+            cute_print(f"Incremental scores {self.material} {self.pst} don't match full recompute {material} {pst}", 'error', 'red')
+            sys.exit()
+
+    def castling_rights(self) -> int:
+        """
+        Castling rights as a 4 bits mask: white kingside (1), white queenside (2), black kingside (4), black queenside (8).
+        A right is kept while the king and that rook have not moved (rook movements start on its corner).
+        """
+        rights = 0
+        for row, king_bit in ((7, 0), (0, 2)):
+            king = self.board[row][4]
+            if isinstance(king, King) and len(king.movements) == 1:
+                for col, side_bit in ((7, 1), (0, 2)):
+                    rook = self.board[row][col]
+                    if isinstance(rook, Rook) and rook.color == king.color and len(rook.movements) == 1:
+                        rights |= side_bit << king_bit
+        return rights
+
+    def repetitions(self) -> int:
+        """
+        Counts how many times the current position already happened since the last capture or pawn move.
+        Walks back the move stack two plies at a time, so it sees both game moves and moves made by a search.
+        """
+        count = 0
+        for ply in range(2, min(self.halfmove_clock, len(self.move_stack)) + 1, 2):
+            if self.move_stack[-ply].hash_before == self.hash:
+                count += 1
+        return count
+
     def get_all_pieces(self, filter_by: Union[None, Tuple] = None):
         filter_func, filter_value = filter_by or (lambda p, _: p is not None, None)  # Default to all pieces
 
@@ -60,43 +276,141 @@ class Board:
                 return False
             # Check if piece found can move to end_position
             else:
-                special_move = False
-                capture_piece = False
-
-                if 'opponent' in move_label:
-                    capture_piece = self.get_piece_at(end_position).type.title()
-                    self.capture_piece(piece, end_position)
-
-                # Pawn promotion
-                if isinstance(piece, Pawn) and end_position[0] in (0, 7):
-                    self.perform_standard_move(piece, start_position, end_position)
-                    self.perform_promotion(piece, end_position)
-                    special_move = {'Type': 'Promotion', 'Obs': 'Queen'}
-                # Pawn passing
-                elif isinstance(piece, Pawn) and 'passant' in move_label:
-                    self.perform_standard_move(piece, start_position, end_position)
-                    self.perform_en_passant(piece, start_position, move_label)
-                    special_move = {'Type': 'En Passant', 'Obs': move_label[move_label.index('-')+1:move_label.index('_')].title()}
-                    capture_piece = 'Pawn'
-                # King castling
-                elif isinstance(piece, King) and 'castling' in move_label:
-                    self.perform_castling(end_position, move_label)
-                    self.perform_standard_move(piece, start_position, end_position)
-                    special_move = {'Type': 'Castling', 'Obs': move_label[move_label.index('-')+1:move_label.index('_')].title()}
-                # Standard move
-                else:
-                    self.perform_standard_move(piece, start_position, end_position)
-
-                return piece, start_position, end_position, special_move, capture_piece
-
-    def capture_piece(self, attacker_piece: Piece, position_taken: tuple[int, int]):
+                record = self.make_move(start_position, end_position, move_label)
+
+                if record.captured_piece is not None:
+                    cute_print(f"{record.captured_piece.color}_{record.captured_piece.type} captured by {piece.color}_{piece.type} at {record.captured_position}", 'swords')
+                if record.promoted_piece is not None:
+                    cute_print(f"Pawn at {end_position} has been promoted", 'star')
+
+                return piece, start_position, end_position, record.special, record.capture
+
+    def make_move(self, start_position: Tuple[int, int], end_position: Tuple[int, int], move_label: str) -> MoveRecord:
+        """
+        Plays an already validated move and pushes a reversible record of it on the move stack.
+
+        Args:
+            start_position: A tuple (row, col) of the piece to move.
+            end_position: A tuple (row, col) where the piece lands.
+            move_label: The label returned by the piece get_valid_moves() for that move.
+
+        Returns:
+            The MoveRecord that unmake_move() needs to take the move back.
+        """
+        piece = self.get_piece_at(start_position)
+        record = MoveRecord(piece, start_position, end_position, move_label)
+        record.hash_before = self.hash
+        record.halfmove_clock_before = self.halfmove_clock
+        record.en_passant_square_before = self.en_passant_square
+        record.material_before = self.material.copy()
+        record.pst_before = self.pst.copy()
+        castling_rights_before = self.castling_rights()
+
+        if 'opponent' in move_label:
+            record.captured_piece = self.capture_piece(piece, end_position)
+            record.captured_position = end_position
+
+        # Pawn promotion
+        if isinstance(piece, Pawn) and end_position[0] in (0, 7):
+            self.perform_standard_move(piece, start_position, end_position)
+            record.promoted_piece = self.perform_promotion(piece, end_position)
+        # Pawn passing
+        elif isinstance(piece, Pawn) and 'passant' in move_label:
+            self.perform_standard_move(piece, start_position, end_position)
+            record.captured_piece, record.captured_position = self.perform_en_passant(piece, start_position, move_label)
+        # King castling
+        elif isinstance(piece, King) and 'castling' in move_label:
+            record.rook, record.rook_start_position, record.rook_end_position = self.perform_castling(end_position, move_label)
+            self.perform_standard_move(piece, start_position, end_position)
+        # Standard move
+        else:
+            self.perform_standard_move(piece, start_position, end_position)
+
+        # Update scores by deltas of the pieces that moved, were captured or promoted
+        final_piece = record.promoted_piece or piece
+        self.material[piece.color] += PIECE_VALUES[final_piece.type] - PIECE_VALUES[piece.type]
+        self.pst[piece.color] += PIECE_SQUARE_TABLES[final_piece.type][pst_index(piece.color, end_position)] - PIECE_SQUARE_TABLES[piece.type][pst_index(piece.color, start_position)]
+        if record.captured_piece is not None:
+            self.material[record.captured_piece.color] -= PIECE_VALUES[record.captured_piece.type]
+            self.pst[record.captured_piece.color] -= PIECE_SQUARE_TABLES[record.captured_piece.type][pst_index(record.captured_piece.color, record.captured_position)]
+        if record.rook is not None:
+            self.pst[piece.color] += PIECE_SQUARE_TABLES['rook'][pst_index(piece.color, record.rook_end_position)] - PIECE_SQUARE_TABLES['rook'][pst_index(piece.color, record.rook_start_position)]
+
+        # Update hash by xor-ing out what left a square and xor-ing in what arrived
+        self.hash ^= piece_key(piece, start_position) ^ piece_key(final_piece, end_position)
+        if record.captured_piece is not None:
+            self.hash ^= piece_key(record.captured_piece, record.captured_position)
+        if record.rook is not None:
+            self.hash ^= piece_key(record.rook, record.rook_start_position) ^ piece_key(record.rook, record.rook_end_position)
+        self.hash ^= CASTLING_KEYS[castling_rights_before] ^ CASTLING_KEYS[self.castling_rights()]
+        if self.en_passant_square is not None:
+            self.hash ^= EN_PASSANT_KEYS[self.en_passant_square[1]]
+        # Pawn two squares move allows en passant capture on the next move only
+        self.en_passant_square = ((start_position[0] + end_position[0]) // 2, start_position[1]) if isinstance(piece, Pawn) and abs(end_position[0] - start_position[0]) == 2 else None
+        if self.en_passant_square is not None:
+            self.hash ^= EN_PASSANT_KEYS[self.en_passant_square[1]]
+        self.hash ^= SIDE_KEY
+        self.turn = 'black' if piece.color == 'white' else 'white'
+        # Fifty-move rule counter
+        self.halfmove_clock = 0 if isinstance(piece, Pawn) or record.captured_piece is not None else self.halfmove_clock + 1
+
+        self.move_stack.append(record)
+        if self.debug_scores:
+            self.check_scores()
+        return record
+
+    def unmake_move(self) -> Union[MoveRecord, None]:
+        """
+        Takes back the last move pushed by make_move(), restoring pieces, movements and captures.
+
+        Returns:
+            The MoveRecord that was taken back, or None if there was no move to take back.
+        """
+        if not self.move_stack:
+            return None
+
+        record = self.move_stack.pop()
+        piece = record.piece
+        start_row, start_col = record.start_position
+        end_row, end_col = record.end_position
+
+        # Move the piece back (a promoted piece is simply dropped, the pawn comes back in its place)
+        piece.movements.pop()
+        piece.current_square = piece.movements[-1]
+        self.board[end_row][end_col] = None
+        self.board[start_row][start_col] = piece
+
+        # Castling rook goes back to its corner
+        if record.rook is not None:
+            record.rook.movements.pop()
+            record.rook.current_square = record.rook.movements[-1]
+            self.board[record.rook_end_position[0]][record.rook_end_position[1]] = None
+            self.board[record.rook_start_position[0]][record.rook_start_position[1]] = record.rook
+
+        # Captured piece goes back to its square (not always end_position, e.g. en passant)
+        if record.captured_piece is not None:
+            piece.captured.pop()
+            self.board[record.captured_position[0]][record.captured_position[1]] = record.captured_piece
+
+        self.turn = piece.color
+        self.hash = record.hash_before
+        self.halfmove_clock = record.halfmove_clock_before
+        self.en_passant_square = record.en_passant_square_before
+        self.material = record.material_before
+        self.pst = record.pst_before
+        if self.debug_scores:
+            self.check_scores()
+
+        return record
+
+    def capture_piece(self, attacker_piece: Piece, position_taken: tuple[int, int]) -> Piece:
         piece_taken = self.get_piece_at(position_taken)
         if piece_taken is not None:
             # Update the piece state
             attacker_piece.capture(piece_taken)
             # Update the board state
             self.board[position_taken[0]][position_taken[1]] = None
-            cute_print(f"{piece_taken.color}_{piece_taken.type} captured by {attacker_piece.color}_{attacker_piece.type} at {position_taken}", 'swords')
+            return piece_taken
         else:
             cute_print(f"There is no Piece to capture at {position_taken}", 'error', 'red')
             sys.exit()
@@ -108,14 +422,14 @@ class Board:
         self.board[start_position[0]][start_position[1]] = None
         self.board[end_position[0]][end_position[1]] = piece
 
-    def perform_promotion(self, piece: Pawn, end_position: tuple[int, int]):
+    def perform_promotion(self, piece: Pawn, end_position: tuple[int, int]) -> Queen:
         self.board[end_position[0]][end_position[1]] = Queen(piece.color, end_position)  # ToDo: Choose a piece to promote to (queen, rook, bishop, knight)")
         promoted_piece = self.get_piece_at(end_position)
         promoted_piece.captured = piece.captured
         promoted_piece.movements = piece.movements
-        cute_print(f"Pawn at {end_position} has been promoted", 'star')
+        return promoted_piece
 
-    def perform_castling(self, end_position: tuple[int, int], move_label: str):
+    def perform_castling(self, end_position: tuple[int, int], move_label: str) -> tuple[Rook, tuple[int, int], tuple[int, int]]:
 
         if 'queenside' not in move_label and 'kingside' not in move_label:
             cute_print(f"'{move_label}' label is not valid. Must be 'empty-queenside_castling' or 'empty-kingside_castling'", 'error', 'red')
@@ -129,11 +443,12 @@ class Board:
         if rook is not None and isinstance(rook, Rook):
             rook_new_position = rook_position[0], 3 if 'queenside' in move_label else 5 if 'kingside' in move_label else None
             self.perform_standard_move(rook, rook_position, rook_new_position)
+            return rook, rook_position, rook_new_position
         else:
             cute_print("Couldn't find Rook for castling special move", 'error', 'red')
             sys.exit()
 
-    def perform_en_passant(self, attacker_pawn: Piece, attacker_position: tuple[int, int], move_label: str):
+    def perform_en_passant(self, attacker_pawn: Piece, attacker_position: tuple[int, int], move_label: str) -> tuple[Piece, tuple[int, int]]:
         if 'left' not in move_label and 'right' not in move_label:
             cute_print(f"'{move_label}' label is not valid. Must be 'opponent-left_passant' or 'opponent-right_passant'", 'error', 'red')
             sys.exit()
@@ -141,7 +456,7 @@ class Board:
         pawn_col = attacker_position[1] - 1 if 'left' in move_label else attacker_position[1] + 1 if 'right' in move_label else None
 
         captured_pawn_position = attacker_position[0], pawn_col
-        self.capture_piece(attacker_pawn, captured_pawn_position)
+        return self.capture_piece(attacker_pawn, captured_pawn_position), captured_pawn_position
 
     def copy(self):
         """Creates a copy of the board.
@@ -150,9 +465,16 @@ class Board:
             Board: A new Board object representing a copy of the current board.
         """
 
-        new_board = Board()  # Create a new Board object
+        new_board = Board(setup=False)  # Create a new empty Board object
         for row in range(8):
             for col in range(8):
                 piece = self.board[row][col]
                 new_board.board[row][col] = piece if piece is not None else None
+        new_board.turn = self.turn
+        new_board.en_passant_square = self.en_passant_square
+        new_board.halfmove_clock = self.halfmove_clock
+        new_board.hash = self.hash
+        new_board.material = self.material.copy()
+        new_board.pst = self.pst.copy()
+        new_board.kings = self.kings.copy()
         return new_board
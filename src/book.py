@@ -0,0 +1,158 @@
+import argparse
+import mmap
+import pathlib
+import random
+import struct
+import time
+from typing import Union
+from src.board import Board
+from src.ordering import Move
+from src.pgn import read_games, count_games, san_to_move
+from src.transposition import pack_move, unpack_move
+from src.utils import cute_print, progress_bar
+
+# File layout: magic header, then fixed size entries sorted by position hash (best weight first within a position)
+BOOK_MAGIC = b'FCBOOK01'
+ENTRY_FORMAT = struct.Struct('<QHH')  # position hash, packed move, weight
+HASH_FORMAT = struct.Struct('<Q')
+BOOK_PLIES = 24
+# Weight a move gets from each game it was played in, by the game result for the side that played it
+RESULT_WEIGHTS = {'win': 2, 'draw': 1, 'loss': 0, 'unknown': 1}
+MAX_WEIGHT = 0xFFFF
+
+
+# --------------------------------------------------------------------------------------------------- BUILDING
+def build_book(pgn_paths: list[pathlib.Path], output_path: pathlib.Path, plies: int = BOOK_PLIES, min_weight: int = 1) -> int:
+    """
+    Compiles PGN games into a binary opening book: every (position, move) of the first plies of each game, weighted
+    by how well the side playing it scored (win 2, draw 1, loss 0).
+
+    Args:
+        pgn_paths: PGN files to read.
+        output_path: Book file to write.
+        plies: Plies read from the start of each game.
+        min_weight: Moves with a lower total weight are left out.
+
+    Returns:
+        Number of book entries written.
+    """
+    weights: dict[tuple[int, int], int] = {}
+    total, start_time = sum(count_games(path) for path in pgn_paths), time.time()
+    games_read = 0
+    for path in pgn_paths:
+        for tags, san_moves in read_games(path):
+            result = tags.get('Result', '*')
+            board = Board()
+            for san in san_moves[:plies]:
+                move = san_to_move(board, san)
+                if move is None:
+                    break
+                if result in ('1-0', '0-1'):
+                    outcome = 'win' if (result == '1-0') == (board.turn == 'white') else 'loss'
+                else:
+                    outcome = 'draw' if result == '1/2-1/2' else 'unknown'
+                key = (board.hash, pack_move(move))
+                weights[key] = weights.get(key, 0) + RESULT_WEIGHTS[outcome]
+                board.make_move(*move)
+            games_read += 1
+            progress_bar(min(games_read, total), max(total, 1), start_time, title='Book')
+
+    entries = sorted(((position_hash, packed_move, min(weight, MAX_WEIGHT)) for (position_hash, packed_move), weight in weights.items() if weight >= min_weight),
+                     key=lambda entry: (entry[0], -entry[2], entry[1]))
+    with open(output_path, 'wb') as book_file:
+        book_file.write(BOOK_MAGIC)
+        for entry in entries:
+            book_file.write(ENTRY_FORMAT.pack(*entry))
+    return len(entries)
+
+
+# --------------------------------------------------------------------------------------------------- READING
+class OpeningBook:
+    """
+    Read-only opening book, memory-mapped so only the pages touched by lookups are ever loaded.
+    Positions are found by binary search over the sorted entries, in O(log n) reads of 8 bytes.
+    """
+
+    def __init__(self, path: Union[pathlib.Path, str]):
+        self.path = pathlib.Path(path)
+        self.book_file = open(self.path, 'rb')
+        self.data = mmap.mmap(self.book_file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.data[:len(BOOK_MAGIC)] != BOOK_MAGIC:
+            self.close()
+            raise ValueError(f"{self.path} is not an opening book")
+        self.entries_count = (len(self.data) - len(BOOK_MAGIC)) // ENTRY_FORMAT.size
+
+    def __len__(self):
+        return self.entries_count
+
+    def __getstate__(self):
+        # Processes reopen the file, the mapping itself can't be pickled
+        return {'path': self.path}
+
+    def __setstate__(self, state):
+        self.__init__(state['path'])
+
+    def _hash_at(self, index: int) -> int:
+        return HASH_FORMAT.unpack_from(self.data, len(BOOK_MAGIC) + index * ENTRY_FORMAT.size)[0]
+
+    def entries(self, position_hash: int) -> list[tuple[int, int]]:
+        # Lower bound binary search, then read the (packed move, weight) entries of the position
+        low, high = 0, self.entries_count
+        while low < high:
+            middle = (low + high) // 2
+            if self._hash_at(middle) < position_hash:
+                low = middle + 1
+            else:
+                high = middle
+        found = []
+        while low < self.entries_count:
+            entry_hash, packed_move, weight = ENTRY_FORMAT.unpack_from(self.data, len(BOOK_MAGIC) + low * ENTRY_FORMAT.size)
+            if entry_hash != position_hash:
+                break
+            found.append((packed_move, weight))
+            low += 1
+        return found
+
+    def moves(self, board: Board) -> list[tuple[Move, int]]:
+        """
+        Book moves of the position, best weight first. Moves that aren't legal on board (a hash collision) are dropped.
+        """
+        book_moves = []
+        for packed_move, weight in self.entries(board.hash):
+            move = unpack_move(packed_move)
+            piece = board.get_piece_at(move[0])
+            if piece is not None and piece.color == board.turn and (move[1], move[2]) in board.get_valid_moves(move[0]) and board.is_legal(*move):
+                book_moves.append((move, weight))
+        return book_moves
+
+    def choose(self, board: Board, rng: Union[random.Random, None] = None) -> Union[Move, None]:
+        """
+        Picks a book move: the heaviest one, or a weighted random one when rng is given. None when out of book.
+        """
+        book_moves = [(move, weight) for move, weight in self.moves(board) if weight > 0]
+        if not book_moves:
+            return None
+        if rng is None:
+            return book_moves[0][0]
+        return rng.choices([move for move, _ in book_moves], weights=[weight for _, weight in book_moves])[0]
+
+    def close(self):
+        self.data.close()
+        self.book_file.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compile PGN files into a binary opening book.')
+    parser.add_argument('pgn', type=pathlib.Path, nargs='+', help='PGN files (or directories of PGN files)')
+    parser.add_argument('-o', '--output', type=pathlib.Path, default=pathlib.Path('book.bin'), help='Book file')
+    parser.add_argument('-p', '--plies', type=int, default=BOOK_PLIES, help='Plies read from the start of each game')
+    parser.add_argument('--min-weight', type=int, default=1, help='Leave out moves with a lower total weight')
+    args = parser.parse_args()
+
+    pgn_paths = [pgn_path for path in args.pgn for pgn_path in (sorted(path.rglob('*.pgn')) if path.is_dir() else [path])]
+    entries_count = build_book(pgn_paths, args.output, args.plies, args.min_weight)
+    cute_print(f"{entries_count} book entries saved at {args.output}", 'download', 'green')
+
+
+if __name__ == '__main__':
+    main()
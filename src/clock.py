@@ -0,0 +1,77 @@
+import re
+from typing import Union
+
+# Seconds kept aside on every move for the move to reach the board (UI, process pool, network)
+MOVE_OVERHEAD = 0.05
+# Moves the remaining time is spread over when the time control doesn't say
+DEFAULT_MOVES_TO_GO = 30
+# Share of the increment spent on top of the time slice, and how far past its slice a move can go
+INCREMENT_USE = 0.75
+HARD_LIMIT_FACTOR = 5
+HARD_LIMIT_SHARE = 0.5
+# Soft limit scale: unstable best moves get more time, settled ones (same move several iterations) less
+UNSTABLE_SCALE = 1.5
+STABLE_STEP = 0.25
+STABLE_SCALE_MIN = 0.5
+
+TIME_CONTROL_PATTERN = re.compile(r'^(?:(\d+)/)?(\d+(?:\.\d+)?)(?:\+(\d+(?:\.\d+)?))?$')
+
+
+class TimeControl:
+    """
+    Base time in seconds plus an increment after every move. With moves_per_session the base time is given again
+    every moves_per_session moves (e.g. 40 moves in 90 minutes); otherwise it's for the whole game.
+    """
+
+    def __init__(self, base: float, increment: float = 0.0, moves_per_session: Union[int, None] = None):
+        self.base = base
+        self.increment = increment
+        self.moves_per_session = moves_per_session
+
+    @classmethod
+    def parse(cls, text: str) -> 'TimeControl':
+        # PGN TimeControl style: '300' (sudden death), '300+2' (increment), '40/5400+30' (sessions)
+        match = TIME_CONTROL_PATTERN.match(text.strip())
+        if match is None:
+            raise ValueError(f"Can't read time control '{text}' (expected base, base+increment or moves/base+increment in seconds)")
+        moves, base, increment = match.groups()
+        return cls(float(base), float(increment or 0), int(moves) if moves else None)
+
+    def __str__(self):
+        text = f'{self.base:g}' + (f'+{self.increment:g}' if self.increment else '')
+        return f'{self.moves_per_session}/{text}' if self.moves_per_session else text
+
+    def moves_to_go(self, moves_made: int) -> Union[int, None]:
+        # Moves left in the current session (None without sessions)
+        return self.moves_per_session - moves_made % self.moves_per_session if self.moves_per_session else None
+
+    def time_added(self, moves_made: int) -> float:
+        # Time a player gets after making their moves_made-th move: the increment, plus a new session when one ends
+        session = self.base if self.moves_per_session and moves_made % self.moves_per_session == 0 else 0
+        return self.increment + session
+
+
+def allocate(time_left: float, increment: float = 0.0, moves_to_go: Union[int, None] = None) -> tuple[float, float]:
+    """
+    Splits the remaining time into a budget for the next move.
+
+    Args:
+        time_left: Seconds on the clock of the side to move.
+        increment: Seconds added after the move.
+        moves_to_go: Moves until the next time control (None if the time is for the rest of the game).
+
+    Returns:
+        (soft, hard) limits in seconds: iterative deepening doesn't start a new iteration after the soft limit
+        (scaled by how settled the best move is) and aborts the search at the hard limit.
+    """
+    usable = max(time_left - MOVE_OVERHEAD, 0.01)
+    moves = min(moves_to_go, DEFAULT_MOVES_TO_GO) if moves_to_go else DEFAULT_MOVES_TO_GO
+    soft = usable / moves + increment * INCREMENT_USE
+    # On the last move of a session the clock is refilled, so nearly all of it can go
+    hard = min(soft * HARD_LIMIT_FACTOR, usable * (0.9 if moves_to_go == 1 else HARD_LIMIT_SHARE))
+    return min(soft, hard), hard
+
+
+def soft_limit_scale(stable_iterations: int) -> float:
+    # Fraction of the soft limit to use, from the iterations the best move has stayed the same
+    return max(STABLE_SCALE_MIN, UNSTABLE_SCALE - STABLE_STEP * stable_iterations)
@@ -21,6 +21,9 @@ ASPECT_RATIO = 16 / 9
 MEDIA_DIRECTORY = pathlib.Path(__file__).absolute().parent.parent / 'media'
 FONT_DIRECTORY = MEDIA_DIRECTORY / 'fonts'
 ICON_DIRECTORY = MEDIA_DIRECTORY / 'icons'
+LOG_DIRECTORY = MEDIA_DIRECTORY.parent / 'logs'
+INDEX_DIRECTORY = MEDIA_DIRECTORY.parent / 'index'
+METRICS_DIRECTORY = MEDIA_DIRECTORY.parent / 'metrics'
 
 # Image settings
 IMG_DIRECTORY = MEDIA_DIRECTORY / 'images'
@@ -46,3 +49,5 @@ BOARD_DARK_COLOR = (158, 122, 91)
 HIGHLIGHT_COLOR = (255, 215, 0)
 POSSIBLE_MOVES_COLOR = (102, 187, 106)  # (153, 204, 0) or (139, 172, 139)
 POSSIBLE_CAPTURES_COLOR = (204, 0, 0)
+CONTROL_WHITE_COLOR = (66, 133, 244)
+CONTROL_BLACK_COLOR = (219, 68, 55)
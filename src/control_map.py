@@ -0,0 +1,185 @@
+import argparse
+import random
+import time
+import pygame
+from src.board import Board, MoveRecord
+from src.tables import KNIGHT_STEPS, SLIDER_DIRECTIONS
+from src.config import update_game_dimensions, FONT_TYPE, FONT_COLOR, CONTROL_WHITE_COLOR, CONTROL_BLACK_COLOR
+from src.utils import LRUCache, cute_print
+
+CONTROL_MAP_KEY = pygame.K_F2
+# Positions kept: control counts are small, shaded surfaces are a board sized image each
+COUNTS_CACHE_SIZE = 4096
+SURFACE_CACHE_SIZE = 16
+# Net control at which a square gets the darkest shade, and the alpha of each step
+MAX_SHADE_CONTROL = 3
+SHADE_ALPHA_STEP = 45
+
+
+def _affected_squares(position: tuple[int, int]) -> frozenset:
+    # Squares whose attackers can change when position changes: every line through it (a slider starts, stops or
+    # sees through there) and the knight jumps; pawn and king attacks are one step away, already on those lines
+    row, col = position
+    squares = {position}
+    for row_step, col_step in SLIDER_DIRECTIONS['queen']:
+        new_row, new_col = row + row_step, col + col_step
+        while 0 <= new_row < 8 and 0 <= new_col < 8:
+            squares.add((new_row, new_col))
+            new_row, new_col = new_row + row_step, new_col + col_step
+    for row_step, col_step in KNIGHT_STEPS:
+        if 0 <= row + row_step < 8 and 0 <= col + col_step < 8:
+            squares.add((row + row_step, col + col_step))
+    return frozenset(squares)
+
+
+AFFECTED_SQUARES = {(row, col): _affected_squares((row, col)) for row in range(8) for col in range(8)}
+
+
+class ControlMap:
+    """
+    Square control of both colors: how many white and black pieces attack each square. For an occupied square the
+    pieces of its own color are its defenders and the others its attackers; net control is white minus black.
+
+    Counts are cached per position hash. A position reached by a move from a cached one only recomputes the squares
+    that move can change, and the shaded overlay is rendered once per position and board size, so drawing it is a blit.
+    """
+
+    def __init__(self):
+        self.counts = LRUCache(COUNTS_CACHE_SIZE)
+        self.surfaces = LRUCache(SURFACE_CACHE_SIZE)
+        self.visible = False
+        # Squares recomputed by the last control() call (0 when cached, 64 on a full computation)
+        self.recomputed = 0
+
+    def toggle_overlay(self):
+        self.visible = not self.visible
+
+    # ----------------------------------------------------------------------------------------------- COUNTS
+    def control(self, board: Board) -> tuple[tuple[int, ...], tuple[int, ...]]:
+        """
+        White and black attacker counts of the 64 squares (index row * 8 + col) in the board position.
+        """
+        counts = self.counts.get(board.hash)
+        self.recomputed = 0
+        if counts is None:
+            counts = self.compute(board)
+            self.counts.put(board.hash, counts)
+        return counts
+
+    def compute(self, board: Board) -> tuple[tuple[int, ...], tuple[int, ...]]:
+        record = board.move_stack[-1] if board.move_stack else None
+        previous = self.counts.get(record.hash_before) if record is not None else None
+        if previous is None:
+            white, black = [0] * 64, [0] * 64
+            squares = AFFECTED_SQUARES.keys()
+        else:
+            white, black = list(previous[0]), list(previous[1])
+            squares = frozenset().union(*(AFFECTED_SQUARES[position] for position in self.changed_squares(record)))
+        for position in squares:
+            index = position[0] * 8 + position[1]
+            white[index] = len(board.attackers(position, 'white'))
+            black[index] = len(board.attackers(position, 'black'))
+        self.recomputed = len(squares)
+        return tuple(white), tuple(black)
+
+    @staticmethod
+    def changed_squares(record: MoveRecord) -> list[tuple[int, int]]:
+        # Squares a piece left or landed on (en passant captures and castling rooks included)
+        squares = (record.start_position, record.end_position, record.captured_position, record.rook_start_position, record.rook_end_position)
+        return [square for square in squares if square is not None]
+
+    def square(self, board: Board, position: tuple[int, int]) -> dict:
+        """
+        Control of one square: white and black attacker counts, attackers and defenders of the piece on it (0 on an
+        empty square) and net control (positive for white).
+        """
+        white, black = self.control(board)
+        index = position[0] * 8 + position[1]
+        piece = board.get_piece_at(position)
+        own, other = (white[index], black[index]) if piece is None or piece.color == 'white' else (black[index], white[index])
+        return {'white': white[index], 'black': black[index],
+                'attackers': other if piece is not None else 0, 'defenders': own if piece is not None else 0,
+                'net': white[index] - black[index]}
+
+    # ----------------------------------------------------------------------------------------------- OVERLAY
+    def render(self, board: Board, screen_width: int) -> pygame.Surface:
+        """
+        Board sized overlay: squares shaded with the color controlling them (darker the larger the net control), pieces
+        with more attackers than defenders outlined like highlighted squares, and the white/black counts in a corner.
+        """
+        BOARD_PX_SIZE, SQUARE_PX_SIZE, _, _, _, FONT_PX_SIZE_S = update_game_dimensions(screen_width)
+        white, black = self.control(board)
+        surface = pygame.Surface((BOARD_PX_SIZE, BOARD_PX_SIZE), pygame.SRCALPHA)
+        font = pygame.font.Font(FONT_TYPE, FONT_PX_SIZE_S)
+        for row in range(8):
+            for col in range(8):
+                index = row * 8 + col
+                net = white[index] - black[index]
+                square_rect = pygame.Rect(col * SQUARE_PX_SIZE, row * SQUARE_PX_SIZE, SQUARE_PX_SIZE, SQUARE_PX_SIZE)
+                if net != 0:
+                    color = CONTROL_WHITE_COLOR if net > 0 else CONTROL_BLACK_COLOR
+                    pygame.draw.rect(surface, (*color, min(abs(net), MAX_SHADE_CONTROL) * SHADE_ALPHA_STEP), square_rect)
+                piece = board.get_piece_at((row, col))
+                if piece is not None:
+                    control = self.square(board, (row, col))
+                    if control['attackers'] > control['defenders']:
+                        attacker_color = CONTROL_BLACK_COLOR if piece.color == 'white' else CONTROL_WHITE_COLOR
+                        pygame.draw.rect(surface, attacker_color, square_rect, width=SQUARE_PX_SIZE // 10)
+                if white[index] or black[index]:
+                    counts_text = font.render(f"{white[index]}:{black[index]}", True, FONT_COLOR)
+                    surface.blit(counts_text, (square_rect.x + FONT_PX_SIZE_S // 2, square_rect.y + FONT_PX_SIZE_S // 2))
+        return surface
+
+    def draw_overlay(self, screen: pygame.Surface, board: Board):
+        if not self.visible:
+            return
+        _, _, MARGIN_PX_SIZE, _, _, _ = update_game_dimensions(screen.get_width())
+        key = (board.hash, screen.get_width())
+        surface = self.surfaces.get(key)
+        if surface is None:
+            surface = self.render(board, screen.get_width())
+            self.surfaces.put(key, surface)
+        screen.blit(surface, (MARGIN_PX_SIZE, MARGIN_PX_SIZE))
+
+
+def check(games: int, plies: int, seed: int = 0) -> int:
+    """
+    Plays random games (with takebacks) and compares the incrementally updated counts with a full computation.
+
+    Returns:
+        The number of positions whose counts differ.
+    """
+    rng, mismatches, positions, recomputed = random.Random(seed), 0, 0, 0
+    start_time = time.perf_counter()
+    for _ in range(games):
+        board, control_map = Board(), ControlMap()
+        control_map.control(board)
+        for _ in range(plies):
+            moves = board.get_legal_moves()
+            if not moves:
+                break
+            board.make_move(*rng.choice(moves))
+            if rng.random() < 0.1:
+                board.unmake_move()
+            incremental = control_map.control(board)
+            recomputed += control_map.recomputed
+            control_map.counts.clear()
+            mismatches += incremental != control_map.control(board)
+            control_map.counts.put(board.hash, incremental)
+            positions += 1
+    cute_print(f"{positions} positions, {mismatches} mismatches, {recomputed / max(positions, 1):.1f} squares recomputed per position "
+               f"({time.perf_counter() - start_time:.2f} s with the full computations)", 'success' if mismatches == 0 else 'error')
+    return mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check the incremental square control map against full computations on random games.')
+    parser.add_argument('-g', '--games', type=int, default=20)
+    parser.add_argument('-p', '--plies', type=int, default=120)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    check(args.games, args.plies, args.seed)
+
+
+if __name__ == '__main__':
+    main()
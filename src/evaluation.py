@@ -0,0 +1,172 @@
+import numpy as np
+from typing import Iterable
+from src.tables import PIECE_NAMES, PIECE_COLORS, PIECE_VALUES, PIECE_SQUARE_TABLES, MOBILITY_WEIGHTS, KING_ZONE_ATTACK_PENALTY, PAWN_SHIELD_BONUS
+from src.tables import KNIGHT_STEPS, KING_STEPS, SLIDER_DIRECTIONS, pst_index, pawn_forward
+
+# Plane order of encoded positions: white king ... white pawn, black king ... black pawn
+PLANES = tuple(f"{color}_{name}" for color in PIECE_COLORS for name in PIECE_NAMES)
+PLANE_INDEX = {name: index for index, name in enumerate(PLANES)}
+
+# Per plane weights: +1 for white, -1 for black, so every term is from white's point of view
+PLANE_SIGNS = np.array([1 if plane.startswith('white') else -1 for plane in PLANES], dtype=np.int64)
+PLANE_VALUES = np.array([PIECE_VALUES[plane.split('_')[1]] for plane in PLANES], dtype=np.int64) * PLANE_SIGNS
+PLANE_PST = np.array([[PIECE_SQUARE_TABLES[plane.split('_')[1]][pst_index(plane.split('_')[0], (row, col))] for row in range(8) for col in range(8)]
+                      for plane in PLANES], dtype=np.int64) * PLANE_SIGNS[:, None]
+
+
+# --------------------------------------------------------------------------------------------------- ENCODING
+def encode_board(board) -> np.ndarray:
+    """
+    Encodes a board as 12x64 piece planes (see PLANES), square index row * 8 + col.
+
+    Args:
+        board: The Board to encode.
+
+    Returns:
+        A (12, 64) uint8 array with a 1 where a piece of that plane stands.
+    """
+    planes = np.zeros((len(PLANES), 64), dtype=np.uint8)
+    for row in range(8):
+        for col in range(8):
+            piece = board.board[row][col]
+            if piece is not None:
+                planes[PLANE_INDEX[f"{piece.color}_{piece.type}"], row * 8 + col] = 1
+    return planes
+
+
+def encode_boards(boards: Iterable) -> np.ndarray:
+    """Encodes several boards into a (N, 12, 64) batch."""
+    encoded = [encode_board(board) for board in boards]
+    return np.stack(encoded) if encoded else np.zeros((0, len(PLANES), 64), dtype=np.uint8)
+
+
+# --------------------------------------------------------------------------------------------------- BATCH (VECTORIZED)
+def _shift(grid: np.ndarray, d_row: int, d_col: int) -> np.ndarray:
+    # Moves every (N, 8, 8) square content by (d_row, d_col), dropping what falls off the board
+    shifted = np.zeros_like(grid)
+    shifted[:, max(d_row, 0):8 + min(d_row, 0), max(d_col, 0):8 + min(d_col, 0)] = grid[:, max(-d_row, 0):8 + min(-d_row, 0), max(-d_col, 0):8 + min(-d_col, 0)]
+    return shifted
+
+
+def _attack_maps(grid: np.ndarray, color: str, empty: np.ndarray) -> dict[str, np.ndarray]:
+    # Number of pieces of each type of color attacking every square, (N, 8, 8) per piece name
+    maps = {}
+    for name in PIECE_NAMES:
+        pieces = grid[:, PLANE_INDEX[f"{color}_{name}"]]
+        if name == 'pawn':
+            maps[name] = _shift(pieces, pawn_forward(color), 1) + _shift(pieces, pawn_forward(color), -1)
+        elif name in ('knight', 'king'):
+            maps[name] = sum(_shift(pieces, d_row, d_col) for d_row, d_col in (KNIGHT_STEPS if name == 'knight' else KING_STEPS))
+        else:
+            attacks = np.zeros_like(pieces)
+            for d_row, d_col in SLIDER_DIRECTIONS[name]:
+                ray = _shift(pieces, d_row, d_col)
+                # A ray keeps going only through empty squares, the first occupied square is still attacked
+                for _ in range(7):
+                    attacks += ray
+                    ray = _shift(ray * empty, d_row, d_col)
+            maps[name] = attacks
+    return maps
+
+
+def evaluate_batch(planes: np.ndarray) -> np.ndarray:
+    """
+    Evaluates a batch of encoded positions at once: material, piece-square tables, mobility and king safety.
+
+    Args:
+        planes: A (N, 12, 64) array from encode_boards().
+
+    Returns:
+        A (N,) int64 array of scores in centipawns from white's point of view.
+    """
+    planes = planes.astype(np.int64)
+    grid = planes.reshape(-1, len(PLANES), 8, 8)
+
+    # Material and piece-square tables are plain weighted sums over the planes
+    scores = planes.sum(axis=2) @ PLANE_VALUES
+    scores += np.einsum('npk,pk->n', planes, PLANE_PST)
+
+    occupancy = {color: grid[:, [PLANE_INDEX[f"{color}_{name}"] for name in PIECE_NAMES]].sum(axis=1) for color in PIECE_COLORS}
+    empty = 1 - occupancy['white'] - occupancy['black']
+    attack_maps = {color: _attack_maps(grid, color, empty) for color in PIECE_COLORS}
+
+    for color, sign in zip(PIECE_COLORS, (1, -1)):
+        enemy = 'black' if color == 'white' else 'white'
+        # Mobility: attacked squares not occupied by a friendly piece
+        for name in PIECE_NAMES:
+            if MOBILITY_WEIGHTS[name]:
+                scores += sign * MOBILITY_WEIGHTS[name] * (attack_maps[color][name] * (1 - occupancy[color])).sum(axis=(1, 2))
+        # King safety: enemy attacks on the king zone and pawns sheltering the king
+        king = grid[:, PLANE_INDEX[f"{color}_king"]]
+        king_zone = king + sum(_shift(king, d_row, d_col) for d_row, d_col in KING_STEPS)
+        enemy_attacks = sum(attack_maps[enemy].values())
+        scores -= sign * KING_ZONE_ATTACK_PENALTY * (enemy_attacks * king_zone).sum(axis=(1, 2))
+        shield = sum(_shift(king, pawn_forward(color), d_col) for d_col in (-1, 0, 1))
+        scores += sign * PAWN_SHIELD_BONUS * (shield * grid[:, PLANE_INDEX[f"{color}_pawn"]]).sum(axis=(1, 2))
+
+    return scores
+
+
+# --------------------------------------------------------------------------------------------------- SCALAR (SINGLE POSITION)
+def _piece_attacks(board, piece, position: tuple[int, int]) -> list[tuple[int, int]]:
+    # Squares attacked by a piece, including squares occupied by friendly pieces (defended)
+    row, col = position
+    if piece.type == 'pawn':
+        targets = [(row + pawn_forward(piece.color), col + d_col) for d_col in (-1, 1)]
+    elif piece.type in ('knight', 'king'):
+        targets = [(row + d_row, col + d_col) for d_row, d_col in (KNIGHT_STEPS if piece.type == 'knight' else KING_STEPS)]
+    else:
+        targets = []
+        for d_row, d_col in SLIDER_DIRECTIONS[piece.type]:
+            new_row, new_col = row + d_row, col + d_col
+            while 0 <= new_row < 8 and 0 <= new_col < 8:
+                targets.append((new_row, new_col))
+                if board.board[new_row][new_col] is not None:
+                    break
+                new_row, new_col = new_row + d_row, new_col + d_col
+    return [(r, c) for r, c in targets if 0 <= r < 8 and 0 <= c < 8]
+
+
+def evaluate(board) -> int:
+    """
+    Evaluates a single position with the same terms as evaluate_batch(), without numpy overhead.
+
+    Args:
+        board: The Board to evaluate.
+
+    Returns:
+        Score in centipawns from white's point of view.
+    """
+    score = 0
+    attacks = {color: [0] * 64 for color in PIECE_COLORS}
+    kings = {}
+
+    for row in range(8):
+        for col in range(8):
+            piece = board.board[row][col]
+            if piece is None:
+                continue
+            sign = 1 if piece.color == 'white' else -1
+            score += sign * (PIECE_VALUES[piece.type] + PIECE_SQUARE_TABLES[piece.type][pst_index(piece.color, (row, col))])
+            if piece.type == 'king':
+                kings[piece.color] = (row, col)
+
+            mobility = 0
+            for target_row, target_col in _piece_attacks(board, piece, (row, col)):
+                attacks[piece.color][target_row * 8 + target_col] += 1
+                target = board.board[target_row][target_col]
+                if target is None or target.color != piece.color:
+                    mobility += 1
+            score += sign * MOBILITY_WEIGHTS[piece.type] * mobility
+
+    for color, (row, col) in kings.items():
+        sign = 1 if color == 'white' else -1
+        enemy = 'black' if color == 'white' else 'white'
+        zone = [(row, col)] + [(row + d_row, col + d_col) for d_row, d_col in KING_STEPS]
+        score -= sign * KING_ZONE_ATTACK_PENALTY * sum(attacks[enemy][r * 8 + c] for r, c in zone if 0 <= r < 8 and 0 <= c < 8)
+        for d_col in (-1, 0, 1):
+            r, c = row + pawn_forward(color), col + d_col
+            if 0 <= r < 8 and 0 <= c < 8 and board.board[r][c] is not None and board.board[r][c].color == color and board.board[r][c].type == 'pawn':
+                score += sign * PAWN_SHIELD_BONUS
+
+    return score
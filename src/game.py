@@ -1,8 +1,10 @@
+import json
 import time
 from src.utils import cute_print, seconds_to_hms
 from src.board import Board
+from src.clock import TimeControl
 from src.pieces import Piece
-from typing import Union, Tuple
+from typing import Callable, Union, Tuple
 
 
 class Player:
@@ -11,6 +13,8 @@ class Player:
         self.color = color
         self.time = 0
         self.cumulative_time = 0
+        # Clock time left at the start of the player's turn (None without a time control)
+        self.remaining_time: Union[float, None] = None
 
     def __str__(self):
         if self.name is None or self.name == '':
@@ -20,8 +24,9 @@ class Player:
 
 
 class GameState:
-    def __init__(self, chessboard: Board):
-        # Timer
+    def __init__(self, chessboard: Board, time_control: Union[TimeControl, None] = None):
+        # Timer (monotonic clock, so system clock changes don't touch the game clocks)
+        self.time_control = time_control
         self.start_time = None
         self.time = None
         self.turn_change_mark = None
@@ -31,12 +36,22 @@ class GameState:
         # Logging
         self.log = []
         self.turn_nm = 1
+        # Draw detection: position hash of every ply and how many times each happened since the last irreversible move
+        self.position_history: list[int] = [chessboard.hash]
+        self.position_counts: dict[int, int] = {chessboard.hash: 1}
+        self.result = None
+        self.result_reason = None
+        # Takebacks: (move record, log record, clocks before, clocks after) per turn
+        self.undo_stack: list[tuple] = []
+        self.redo_stack: list[tuple] = []
         # Board state
         self.chessboard = chessboard
         # Players state
         self.black_player = None
         self.white_player = None
         self.current_player = None
+        # Called with the game whenever the turn passes to the other player (moves and takebacks), e.g. to ponder
+        self.on_turn_change: Union[Callable[['GameState'], None], None] = None
 
     def setup_players(self, white_player_name: Union[str, None], black_player_name: Union[str, None]):
         # Create players
@@ -44,13 +59,16 @@ class GameState:
         self.black_player = Player('black', black_player_name)
         # Set white player as first player
         self.current_player = self.white_player
+        if self.time_control is not None:
+            self.white_player.remaining_time = self.time_control.base
+            self.black_player.remaining_time = self.time_control.base
 
     def start(self, white_player_name: Union[str, None], black_player_name: Union[str, None]):
         self.state = 'running'
         # Timer
-        self.start_time = time.time()
+        self.start_time = time.monotonic()
         self.time = 0
-        self.turn_change_mark = time.time()
+        self.turn_change_mark = time.monotonic()
         self.turn_time = 0
         # Create players
         self.setup_players(white_player_name, black_player_name)
@@ -66,8 +84,13 @@ class GameState:
 
     def turn(self, start_position: Tuple[int, int], end_position: Tuple[int, int], piece_valid_moves: list[tuple[tuple[int, int], str]]):
         piece = self.chessboard.get_piece_at(start_position)
+        # A finished game (mate, draw or time forfeit) takes no more moves; a takeback reopens it
+        if self.result is not None:
+            cute_print(f"Can't move {piece}, the game is over ({self.result}, {self.result_reason})", 'finish_flag', 'yellow')
+            return
         # Check if piece about to move is current_player's piece
         if piece.color == self.current_player.color:
+            clocks_before = self.clocks_snapshot()
             # Make move in board
             move_records = self.chessboard.move_piece(start_position, end_position, piece_valid_moves)
             # Check if movement was valid
@@ -76,6 +99,13 @@ class GameState:
                 self.record_turn(*move_records)
                 # Update turn
                 self.next_player()
+                # A new move invalidates the moves that were taken back
+                self.undo_stack.append((self.chessboard.move_stack[-1], self.log[-1], clocks_before, self.clocks_snapshot()))
+                self.redo_stack.clear()
+                # Draw conditions
+                self.record_position()
+                if self.on_turn_change is not None:
+                    self.on_turn_change(self)
         else:
             cute_print(f"Can't move {piece}, because is {self.current_player}'s turn", f'{piece}', 'yellow')
 
@@ -96,12 +126,173 @@ class GameState:
 
     def next_player(self):
         self.current_player.cumulative_time += self.turn_time
-        self.turn_change_mark = time.time()
+        if self.time_control is not None:
+            self.current_player.remaining_time += self.time_control.time_added(self.moves_made(self.current_player)) - self.turn_time
+        self.turn_change_mark = time.monotonic()
+        self.turn_time = 0
         self.current_player = self.black_player if self.current_player.color == 'white' else self.white_player
         self.turn_nm += 1
 
     def update_elapsed_time(self):
         # Full time since game started (it updates on every main loop of game)
-        self.time = time.time() - self.start_time
-        self.turn_time = time.time() - self.turn_change_mark
+        now = time.monotonic()
+        self.time = now - self.start_time
+        self.turn_time = now - self.turn_change_mark
         self.current_player.time = self.current_player.cumulative_time + self.turn_time
+        if self.time_control is not None and self.result is None and self.time_left(self.current_player) <= 0:
+            self.result = '0-1' if self.current_player.color == 'white' else '1-0'
+            self.result_reason = 'Time forfeit'
+            cute_print(f"{self.current_player} ran out of time ({self.result})", 'finish_flag', 'cyan')
+
+    def moves_made(self, player: Player) -> int:
+        # Moves the player has made, counting the one being recorded while turn_nm still points to it
+        return (self.turn_nm + 1) // 2 if player.color == 'white' else self.turn_nm // 2
+
+    def time_left(self, player: Player) -> Union[float, None]:
+        """Seconds on the player's clock right now (None without a time control)."""
+        if player.remaining_time is None:
+            return None
+        return player.remaining_time - (self.turn_time if player is self.current_player else 0)
+
+    def moves_to_go(self, player: Player) -> Union[int, None]:
+        # Moves the player has to make before the next time control
+        return self.time_control.moves_to_go(self.moves_made(player) - (player is self.current_player)) if self.time_control is not None else None
+
+    def record_position(self):
+        position_hash = self.chessboard.hash
+        # A capture or pawn move can't be reversed: older positions can't repeat anymore
+        if self.chessboard.halfmove_clock == 0:
+            self.position_counts.clear()
+        self.position_history.append(position_hash)
+        self.position_counts[position_hash] = self.position_counts.get(position_hash, 0) + 1
+        self.check_game_over()
+
+    def forget_position(self):
+        self.position_history.pop()
+        # Rebuild counts from the positions since the last irreversible move (at most 100 plies)
+        self.position_counts.clear()
+        for position_hash in self.position_history[-(self.chessboard.halfmove_clock + 1):]:
+            self.position_counts[position_hash] = self.position_counts.get(position_hash, 0) + 1
+        self.result = None
+        self.result_reason = None
+
+    def is_repetition(self, position_hash: int, times: int = 1) -> bool:
+        """
+        Checks if a position already happened in this game since the last capture or pawn move. Searches use it
+        (together with Board.repetitions() for their own line) to score repeated positions as draws.
+
+        Args:
+            position_hash: Zobrist hash of the position (Board.hash).
+            times: Minimum number of previous occurrences.
+
+        Returns:
+            True if the position happened at least `times` times.
+        """
+        return self.position_counts.get(position_hash, 0) >= times
+
+    def check_game_over(self) -> bool:
+        # Side to move without legal moves: checkmate or stalemate
+        if not self.chessboard.get_legal_moves():
+            if self.chessboard.in_check():
+                self.result = '1-0' if self.chessboard.turn == 'black' else '0-1'
+                self.result_reason = 'Checkmate'
+            else:
+                self.result = '1/2-1/2'
+                self.result_reason = 'Stalemate'
+            cute_print(f"{self.result_reason} ({self.result})", 'finish_flag', 'cyan')
+            return True
+        return self.check_draw()
+
+    def check_draw(self) -> bool:
+        if self.position_counts.get(self.chessboard.hash, 0) >= 3:
+            self.result_reason = 'Threefold repetition'
+        elif self.chessboard.halfmove_clock >= 100:
+            self.result_reason = 'Fifty-move rule'
+        else:
+            return False
+
+        self.result = '1/2-1/2'
+        cute_print(f"Draw by {self.result_reason.lower()}", 'finish_flag', 'cyan')
+        return True
+
+    def clocks_snapshot(self) -> tuple:
+        return (self.white_player.cumulative_time, self.black_player.cumulative_time, self.turn_time,
+                self.white_player.remaining_time, self.black_player.remaining_time)
+
+    def restore_clocks(self, clocks: tuple):
+        (self.white_player.cumulative_time, self.black_player.cumulative_time, self.turn_time,
+         self.white_player.remaining_time, self.black_player.remaining_time) = clocks
+        # Resume the current player's turn clock from the restored turn time
+        self.turn_change_mark = time.monotonic() - self.turn_time
+        self.update_elapsed_time()
+
+    def undo(self) -> bool:
+        """
+        Takes back the last turn: board, log, turn number and both players clocks.
+
+        Returns:
+            True if a turn was taken back, False if there was nothing to undo.
+        """
+        if not self.undo_stack:
+            cute_print('There is no move to take back', 'last_track', 'yellow')
+            return False
+
+        move_record, log_record, clocks_before, clocks_after = self.undo_stack.pop()
+        self.chessboard.unmake_move()
+        self.forget_position()
+        self.log.pop()
+        self.turn_nm -= 1
+        self.current_player = self.white_player if move_record.piece.color == 'white' else self.black_player
+        self.restore_clocks(clocks_before)
+        self.redo_stack.append((move_record, log_record, clocks_before, clocks_after))
+        cute_print(f"Took back {move_record.piece} {move_record.start_position} -> {move_record.end_position}", 'last_track')
+        if self.on_turn_change is not None:
+            self.on_turn_change(self)
+        return True
+
+    def redo(self) -> bool:
+        """
+        Plays again the last turn taken back with undo().
+
+        Returns:
+            True if a turn was replayed, False if there was nothing to redo.
+        """
+        if not self.redo_stack:
+            cute_print('There is no move to replay', 'next_track', 'yellow')
+            return False
+
+        move_record, log_record, clocks_before, clocks_after = self.redo_stack.pop()
+        new_move_record = self.chessboard.make_move(move_record.start_position, move_record.end_position, move_record.move_label)
+        self.log.append(log_record)
+        self.turn_nm += 1
+        self.current_player = self.black_player if new_move_record.piece.color == 'white' else self.white_player
+        self.restore_clocks(clocks_after)
+        self.undo_stack.append((new_move_record, log_record, clocks_before, clocks_after))
+        self.record_position()
+        cute_print(f"Replayed {new_move_record.piece} {new_move_record.start_position} -> {new_move_record.end_position}", 'next_track')
+        if self.on_turn_change is not None:
+            self.on_turn_change(self)
+        return True
+
+    def save_log(self, path) -> None:
+        """Saves players, result and the turn log as JSON, readable back with load_log()."""
+        with open(path, 'w', encoding='utf-8') as log_file:
+            json.dump({'White': str(self.white_player), 'Black': str(self.black_player), 'Result': self.result or '*', 'Log': self.log}, log_file, indent=2)
+        cute_print(f"Game log saved at {path}", 'download')
+
+
+def load_log(path) -> tuple[dict, list[tuple[tuple[int, int], tuple[int, int]]]]:
+    """
+    Loads a log saved by GameState.save_log().
+
+    Args:
+        path: JSON log file path.
+
+    Returns:
+        The game tags (White, Black, Result) and its moves as (start_position, end_position) pairs.
+    """
+    with open(path, encoding='utf-8') as log_file:
+        data = json.load(log_file)
+    tags = {name: data[name] for name in ('White', 'Black', 'Result') if name in data}
+    moves = [(tuple(record['Move']['StartPosition']), tuple(record['Move']['EndPosition'])) for record in data['Log']]
+    return tags, moves
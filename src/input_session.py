@@ -0,0 +1,238 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import pathlib
+import random
+import time
+from typing import Union
+import pygame
+from src.board import Board
+from src.config import update_game_dimensions
+from src.utils import cute_print
+
+# Recorded pygame events and the attributes kept of each
+RECORDED_EVENTS = {'QUIT': (),
+                   'MOUSEMOTION': ('pos', 'rel', 'buttons'),
+                   'MOUSEBUTTONDOWN': ('pos', 'button'),
+                   'MOUSEBUTTONUP': ('pos', 'button'),
+                   'VIDEORESIZE': ('w', 'h', 'size'),
+                   'KEYDOWN': ('key', 'mod', 'unicode'),
+                   'KEYUP': ('key', 'mod')}
+SESSION_VERSION = 1
+# Window size main() opens with, used to place the clicks of generated scenarios
+WINDOW_SIZE = (1200, 675)
+# Generated scenarios: frames a drag takes, and idle frames after each move
+DRAG_FRAMES = 6
+IDLE_FRAMES = 2
+
+
+class InputRecorder:
+    """
+    Records the input events of the game loop with their frame number and time since the first frame.
+    """
+
+    def __init__(self):
+        self.events: list[dict] = []
+        self.frames = 0
+        self.start_time: Union[float, None] = None
+
+    def record(self, frame: int, events: list[pygame.event.Event]):
+        if self.start_time is None:
+            self.start_time = time.perf_counter()
+        timestamp = time.perf_counter() - self.start_time
+        for event in events:
+            name = pygame.event.event_name(event.type).upper()
+            if name not in RECORDED_EVENTS:
+                continue
+            record = {'frame': frame, 'time': round(timestamp, 6), 'type': name}
+            record.update({attribute: getattr(event, attribute) for attribute in RECORDED_EVENTS[name] if hasattr(event, attribute)})
+            self.events.append(record)
+        self.frames = frame + 1
+
+    def save(self, path: Union[pathlib.Path, str]):
+        with open(path, 'w', encoding='utf-8') as session_file:
+            json.dump({'version': SESSION_VERSION, 'frames': self.frames, 'events': self.events}, session_file)
+        cute_print(f"Input session of {self.frames} frames ({len(self.events)} events) saved at {path}", 'download')
+
+
+class InputPlayer:
+    """
+    Feeds recorded events back to the game loop. Events are given by frame number, not by time, so a replay handles the
+    same events on the same frames whatever the machine speed; realtime additionally waits for each event's time.
+    After the last recorded frame the player sends QUIT.
+    """
+
+    def __init__(self, events: list[dict], frames: int, realtime: bool = False):
+        self.frames = frames
+        self.realtime = realtime
+        self.by_frame: dict[int, list[dict]] = {}
+        for record in events:
+            self.by_frame.setdefault(record['frame'], []).append(record)
+        self.start_time: Union[float, None] = None
+
+    @classmethod
+    def load(cls, path: Union[pathlib.Path, str], realtime: bool = False) -> 'InputPlayer':
+        with open(path, encoding='utf-8') as session_file:
+            data = json.load(session_file)
+        if data.get('version') != SESSION_VERSION:
+            raise ValueError(f"{path} is not an input session (version {SESSION_VERSION})")
+        return cls(data['events'], data['frames'], realtime)
+
+    def events(self, frame: int) -> list[pygame.event.Event]:
+        if self.start_time is None:
+            self.start_time = time.perf_counter()
+        if frame >= self.frames:
+            return [pygame.event.Event(pygame.QUIT)]
+        events = []
+        for record in self.by_frame.get(frame, []):
+            if self.realtime:
+                time.sleep(max(record['time'] - (time.perf_counter() - self.start_time), 0))
+            attributes = {name: tuple(value) if isinstance(value, list) else value for name, value in record.items() if name not in ('frame', 'time', 'type')}
+            events.append(pygame.event.Event(getattr(pygame, record['type']), attributes))
+        return events
+
+
+# --------------------------------------------------------------------------------------------------- SCENARIOS
+class ScenarioBuilder:
+    """Builds a synthetic input session frame by frame, for the benchmark scenarios."""
+
+    def __init__(self, window_size: tuple[int, int] = WINDOW_SIZE):
+        _, self.square_px_size, self.margin_px_size, _, _, _ = update_game_dimensions(window_size[0])
+        self.events: list[dict] = []
+        self.frame = 0
+        self.mouse_position = (0, 0)
+
+    def square_center(self, position: tuple[int, int]) -> tuple[int, int]:
+        row, col = position
+        return col * self.square_px_size + self.margin_px_size + self.square_px_size // 2, row * self.square_px_size + self.margin_px_size + self.square_px_size // 2
+
+    def add(self, event_type: str, **attributes):
+        self.events.append({'frame': self.frame, 'time': 0.0, 'type': event_type, **attributes})
+
+    def idle(self, frames: int):
+        self.frame += frames
+
+    def move_mouse(self, position: tuple[int, int], buttons: tuple[int, int, int] = (0, 0, 0)):
+        self.add('MOUSEMOTION', pos=position, rel=(position[0] - self.mouse_position[0], position[1] - self.mouse_position[1]), buttons=buttons)
+        self.mouse_position = position
+
+    def drag(self, start: tuple[int, int], end: tuple[int, int], frames: int = DRAG_FRAMES):
+        # Press on start, move over a few frames and release on end (pixel positions)
+        self.move_mouse(start)
+        self.add('MOUSEBUTTONDOWN', pos=start, button=1)
+        self.frame += 1
+        for step in range(1, frames + 1):
+            self.move_mouse((start[0] + (end[0] - start[0]) * step // frames, start[1] + (end[1] - start[1]) * step // frames), (1, 0, 0))
+            self.frame += 1
+        self.add('MOUSEBUTTONUP', pos=end, button=1)
+        self.frame += 1
+
+    def resize(self, width: int, height: int):
+        self.add('VIDEORESIZE', w=width, h=height, size=(width, height))
+        self.frame += 1
+
+    def player(self) -> InputPlayer:
+        return InputPlayer(self.events, self.frame + 1)
+
+
+def game_replay_scenario(plies: int = 80, seed: int = 0) -> InputPlayer:
+    # A whole game played by dragging pieces: random legal moves (seeded) until the game ends or plies are played
+    builder, board, rng = ScenarioBuilder(), Board(), random.Random(seed)
+    for _ in range(plies):
+        legal_moves = board.get_legal_moves()
+        if not legal_moves:
+            break
+        move = rng.choice(legal_moves)
+        builder.drag(builder.square_center(move[0]), builder.square_center(move[1]))
+        builder.idle(IDLE_FRAMES)
+        board.make_move(*move)
+    return builder.player()
+
+
+def rapid_dragging_scenario(drags: int = 200, seed: int = 0) -> InputPlayer:
+    # Pieces picked up and dragged around quickly, mostly dropped on squares they can't go to
+    builder, rng = ScenarioBuilder(), random.Random(seed)
+    squares = [(row, col) for row in (0, 1, 6, 7) for col in range(8)]
+    for _ in range(drags):
+        builder.drag(builder.square_center(rng.choice(squares)), builder.square_center((rng.randrange(8), rng.randrange(8))), frames=2)
+    return builder.player()
+
+
+def window_resizes_scenario(resizes: int = 60) -> InputPlayer:
+    # Window resized back and forth between a few sizes, hovering the board in between
+    builder = ScenarioBuilder()
+    sizes = ((1200, 675), (1600, 900), (960, 540), (1920, 1080), (800, 450))
+    for index in range(resizes):
+        builder.resize(*sizes[index % len(sizes)])
+        builder.move_mouse(builder.square_center((index % 8, (index * 3) % 8)))
+        builder.idle(IDLE_FRAMES)
+    return builder.player()
+
+
+SCENARIOS = {'game_replay': game_replay_scenario,
+             'rapid_dragging': rapid_dragging_scenario,
+             'window_resizes': window_resizes_scenario}
+
+
+# --------------------------------------------------------------------------------------------------- BENCHMARK
+def run_benchmark(name: str, player: InputPlayer, output_directory: Union[pathlib.Path, None] = None) -> dict:
+    """
+    Plays an input session through the game loop (every frame kept in the statistics) and reports its frame times.
+    """
+    # Imported here: main.py imports this module for the recorder and player
+    from src.main import main as run_game
+    from src.instrumentation import FrameMetrics
+
+    # The game reports every turn on the console; keep it out of the output (and the timings)
+    with contextlib.redirect_stdout(io.StringIO()):
+        metrics = run_game(player=player, metrics=FrameMetrics(window=None))
+    summary = metrics.summary()
+    frame = summary['frame_ms']
+    cute_print(f"{name}: {summary['frames']} frames, {summary['fps']:.0f} FPS, frame p50 {frame['p50']:.2f} ms, p95 {frame['p95']:.2f} ms, "
+               f"p99 {frame['p99']:.2f} ms, max {frame['max']:.2f} ms, {sum(summary['allocations_per_frame'].values()):.1f} surfaces/frame", 'rocket')
+    slowest = sorted(summary['functions_ms'].items(), key=lambda item: -item[1]['p95'])[:3]
+    cute_print(', '.join(f"{function} p95 {times['p95']:.2f} ms" for function, times in slowest), 'bullet')
+    if output_directory is not None:
+        metrics.export(output_directory / f"{name}.json", label=name)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Record and replay input sessions of the game, and benchmark rendering with them.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    record_parser = commands.add_parser('record', help='Play the game, recording every input event')
+    record_parser.add_argument('output', type=pathlib.Path, help='Session file')
+    replay_parser = commands.add_parser('replay', help='Play a recorded session back in a window')
+    replay_parser.add_argument('session', type=pathlib.Path)
+    replay_parser.add_argument('--realtime', action='store_true', help='Keep the recorded timing instead of replaying as fast as possible')
+    bench_parser = commands.add_parser('bench', help="Replay scenarios headless (SDL dummy video driver) and report frame times")
+    bench_parser.add_argument('-s', '--scenario', choices=sorted(SCENARIOS), nargs='*', help='Built-in scenarios (default: all)')
+    bench_parser.add_argument('--session', type=pathlib.Path, nargs='*', default=[], help='Recorded sessions to benchmark as well')
+    bench_parser.add_argument('-o', '--output', type=pathlib.Path, help='Directory for one metrics report per scenario (see src.instrumentation)')
+    args = parser.parse_args()
+
+    # Imported here: main.py imports this module for the recorder and player
+    from src.main import main as run_game
+
+    if args.command == 'record':
+        recorder = InputRecorder()
+        run_game(recorder=recorder)
+        recorder.save(args.output)
+
+    elif args.command == 'replay':
+        run_game(player=InputPlayer.load(args.session, args.realtime))
+
+    elif args.command == 'bench':
+        # No display or GPU needed: render to memory with SDL's dummy drivers
+        os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+        os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+        scenarios = [(name, SCENARIOS[name]()) for name in (args.scenario or sorted(SCENARIOS))]
+        scenarios += [(path.stem, InputPlayer.load(path)) for path in args.session]
+        for name, player in scenarios:
+            run_benchmark(name, player, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,284 @@
+import argparse
+import functools
+import json
+import pathlib
+import platform
+import subprocess
+import time
+from collections import deque
+from typing import Callable, Union
+import pygame
+from src.config import FONT_TYPE
+from src.utils import cute_print, percentile
+
+# Frames kept for the rolling statistics
+ROLLING_FRAMES = 300
+PERCENTILES = (('p50', 0.5), ('p95', 0.95), ('p99', 0.99))
+# Overlay: toggled with F3, statistics exported with F4; its text is rendered again at most this often (seconds)
+OVERLAY_KEY = pygame.K_F3
+EXPORT_KEY = pygame.K_F4
+OVERLAY_REFRESH = 0.5
+OVERLAY_FONT_SIZE = 14
+OVERLAY_BACKGROUND = (0, 0, 0, 180)
+OVERLAY_TEXT_COLOR = (230, 230, 230)
+# Pygame calls that allocate a new Surface, counted while allocation counting is installed
+ALLOCATION_KINDS = ('surface', 'text', 'scale', 'font')
+
+
+def _milliseconds(values) -> dict:
+    statistics = {name: percentile(values, fraction) * 1000 for name, fraction in PERCENTILES}
+    statistics['max'] = max(values, default=0) * 1000
+    return statistics
+
+
+def build_id() -> Union[str, None]:
+    # Commit of the working tree, so exported metrics can be compared between builds
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, timeout=5,
+                              cwd=pathlib.Path(__file__).resolve().parent).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+class FrameMetrics:
+    """
+    Per-frame measurements of the UI loop over the last ROLLING_FRAMES frames: frame time and FPS, time spent in each
+    instrumented draw function, Surfaces allocated per frame and event handling latency.
+
+    The loop calls begin_frame(), events_received() right after pygame.event.get(), events_handled() after handling
+    them and end_frame() after the display update; draw functions are wrapped with instrument().
+    """
+
+    def __init__(self, window: Union[int, None] = ROLLING_FRAMES):
+        # window=None keeps every frame (benchmarks)
+        self.window = window
+        self.frames = 0
+        self.frame_times: deque = deque(maxlen=window)
+        self.frame_ends: deque = deque(maxlen=window)
+        self.function_times: dict[str, deque] = {}
+        self.function_calls: dict[str, int] = {}
+        self.allocations: dict[str, deque] = {}
+        self.allocation_totals = dict.fromkeys(ALLOCATION_KINDS, 0)
+        # Time to handle a frame's events, and from fetching them to the display update showing their effect
+        self.event_handling_times: deque = deque(maxlen=window)
+        self.input_latencies: deque = deque(maxlen=window)
+        self.events = 0
+        # Current frame
+        self.frame_start = 0.0
+        self.events_start: Union[float, None] = None
+        self.frame_functions: dict[str, float] = {}
+        self.frame_allocations: dict[str, int] = {}
+        self.current_function = 'other'
+        # Overlay
+        self.overlay_visible = False
+        self.overlay_surface: Union[pygame.Surface, None] = None
+        self.overlay_rendered = 0.0
+        self.originals: dict = {}
+
+    # ----------------------------------------------------------------------------------------------- MEASURING
+    def instrument(self, function: Callable) -> Callable:
+        """
+        Wraps a draw function so its time (summed over the calls of a frame) and allocations are recorded under its name.
+        """
+        name = function.__name__
+        self.function_times.setdefault(name, deque(maxlen=self.window))
+        self.function_calls.setdefault(name, 0)
+
+        @functools.wraps(function)
+        def timed(*args, **kwargs):
+            previous_function, self.current_function = self.current_function, name
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.frame_functions[name] = self.frame_functions.get(name, 0.0) + time.perf_counter() - start
+                self.function_calls[name] += 1
+                self.current_function = previous_function
+        return timed
+
+    def begin_frame(self):
+        self.frame_start = time.perf_counter()
+        self.events_start = None
+        self.frame_functions = {}
+        self.frame_allocations = {}
+
+    def events_received(self, events: list):
+        if events:
+            self.events_start = time.perf_counter()
+            self.events += len(events)
+
+    def events_handled(self):
+        if self.events_start is not None:
+            self.event_handling_times.append(time.perf_counter() - self.events_start)
+
+    def end_frame(self):
+        now = time.perf_counter()
+        self.frames += 1
+        self.frame_times.append(now - self.frame_start)
+        self.frame_ends.append(now)
+        if self.events_start is not None:
+            self.input_latencies.append(now - self.events_start)
+        for name, times in self.function_times.items():
+            times.append(self.frame_functions.get(name, 0.0))
+        for name in set(self.allocations) | set(self.frame_allocations):
+            self.allocations.setdefault(name, deque(maxlen=self.window)).append(self.frame_allocations.get(name, 0))
+
+    def count_allocation(self, kind: str):
+        self.allocation_totals[kind] += 1
+        self.frame_allocations[self.current_function] = self.frame_allocations.get(self.current_function, 0) + 1
+
+    def install(self):
+        """
+        Counts Surface allocations by replacing pygame.Surface, pygame.font.Font and the scaling functions with
+        counting versions (subclasses, so isinstance checks still hold). uninstall() puts the originals back.
+        """
+        if self.originals:
+            return
+        metrics = self
+        self.originals = {'Surface': pygame.Surface, 'Font': pygame.font.Font, 'scale': pygame.transform.scale, 'smoothscale': pygame.transform.smoothscale}
+
+        class CountingSurface(self.originals['Surface']):
+            def __init__(self, *args, **kwargs):
+                metrics.count_allocation('surface')
+                super().__init__(*args, **kwargs)
+
+        class CountingFont(self.originals['Font']):
+            def __init__(self, *args, **kwargs):
+                metrics.count_allocation('font')
+                super().__init__(*args, **kwargs)
+
+            def render(self, *args, **kwargs):
+                metrics.count_allocation('text')
+                return super().render(*args, **kwargs)
+
+        def counting_scale(original):
+            @functools.wraps(original)
+            def scale(*args, **kwargs):
+                metrics.count_allocation('scale')
+                return original(*args, **kwargs)
+            return scale
+
+        pygame.Surface = CountingSurface
+        pygame.font.Font = CountingFont
+        pygame.transform.scale = counting_scale(self.originals['scale'])
+        pygame.transform.smoothscale = counting_scale(self.originals['smoothscale'])
+
+    def uninstall(self):
+        if not self.originals:
+            return
+        pygame.Surface = self.originals['Surface']
+        pygame.font.Font = self.originals['Font']
+        pygame.transform.scale = self.originals['scale']
+        pygame.transform.smoothscale = self.originals['smoothscale']
+        self.originals = {}
+
+    # ----------------------------------------------------------------------------------------------- REPORTING
+    def fps(self) -> float:
+        if len(self.frame_ends) < 2:
+            return 0.0
+        return (len(self.frame_ends) - 1) / max(self.frame_ends[-1] - self.frame_ends[0], 1e-9)
+
+    def summary(self) -> dict:
+        """
+        Rolling statistics over the last frames (times in milliseconds), as shown by the overlay and exported.
+        """
+        frames = max(len(self.frame_times), 1)
+        return {'frames': self.frames,
+                'window': len(self.frame_times),
+                'fps': self.fps(),
+                'frame_ms': _milliseconds(self.frame_times),
+                'functions_ms': {name: _milliseconds(times) for name, times in self.function_times.items()},
+                'function_calls': dict(self.function_calls),
+                'allocations_per_frame': {name: sum(counts) / frames for name, counts in sorted(self.allocations.items())},
+                'allocations_total': dict(self.allocation_totals),
+                'events': self.events,
+                'event_handling_ms': _milliseconds(self.event_handling_times),
+                'input_latency_ms': _milliseconds(self.input_latencies)}
+
+    def export(self, path: Union[pathlib.Path, str], label: Union[str, None] = None) -> pathlib.Path:
+        """
+        Writes the summary as JSON along with the build (git commit) and platform, for comparisons with compare().
+        """
+        path = pathlib.Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        report = {'label': label,
+                  'build': build_id(),
+                  'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+                  'python': platform.python_version(),
+                  'pygame': pygame.version.ver,
+                  'video_driver': pygame.display.get_driver() if pygame.display.get_init() else None,
+                  **self.summary()}
+        with open(path, 'w', encoding='utf-8') as report_file:
+            json.dump(report, report_file, indent=2)
+        cute_print(f"Frame metrics saved at {path}", 'download')
+        return path
+
+    def overlay_lines(self) -> list[str]:
+        summary = self.summary()
+        frame = summary['frame_ms']
+        lines = [f"FPS {summary['fps']:.1f}   frame p50 {frame['p50']:.2f}  p95 {frame['p95']:.2f}  p99 {frame['p99']:.2f} ms",
+                 f"{'function':<20}{'p50':>7}{'p95':>7}{'p99':>7}{'alloc':>7}"]
+        for name, times in summary['functions_ms'].items():
+            lines.append(f"{name:<20}{times['p50']:>7.2f}{times['p95']:>7.2f}{times['p99']:>7.2f}{summary['allocations_per_frame'].get(name, 0):>7.1f}")
+        events, latency = summary['event_handling_ms'], summary['input_latency_ms']
+        lines.append(f"surfaces/frame {sum(summary['allocations_per_frame'].values()):.1f}")
+        lines.append(f"events p95 {events['p95']:.2f} ms   input to display p95 {latency['p95']:.2f} ms")
+        return lines
+
+    def draw_overlay(self, screen: pygame.Surface):
+        # Drawn outside the instrumented functions; its text is refreshed every OVERLAY_REFRESH seconds
+        if not self.overlay_visible:
+            return
+        previous_function, self.current_function = self.current_function, 'overlay'
+        now = time.perf_counter()
+        if self.overlay_surface is None or now - self.overlay_rendered >= OVERLAY_REFRESH:
+            font = pygame.font.Font(FONT_TYPE, OVERLAY_FONT_SIZE)
+            texts = [font.render(line, True, OVERLAY_TEXT_COLOR) for line in self.overlay_lines()]
+            self.overlay_surface = pygame.Surface((max(text.get_width() for text in texts) + 16, sum(text.get_height() for text in texts) + 16), pygame.SRCALPHA)
+            self.overlay_surface.fill(OVERLAY_BACKGROUND)
+            y = 8
+            for text in texts:
+                self.overlay_surface.blit(text, (8, y))
+                y += text.get_height()
+            self.overlay_rendered = now
+        screen.blit(self.overlay_surface, (screen.get_width() - self.overlay_surface.get_width(), 0))
+        self.current_function = previous_function
+
+    def toggle_overlay(self):
+        self.overlay_visible = not self.overlay_visible
+        self.overlay_surface = None
+
+
+def compare(baseline_path: pathlib.Path, candidate_path: pathlib.Path):
+    """
+    Prints the p50/p95 changes between two exported reports (e.g. two builds running the same scenario).
+    """
+    with open(baseline_path, encoding='utf-8') as baseline_file, open(candidate_path, encoding='utf-8') as candidate_file:
+        baseline, candidate = json.load(baseline_file), json.load(candidate_file)
+    cute_print(f"{baseline_path} ({baseline.get('build')}) -> {candidate_path} ({candidate.get('build')})", 'info')
+    rows = [('frame', baseline['frame_ms'], candidate['frame_ms']),
+            *((name, times, candidate['functions_ms'].get(name)) for name, times in baseline['functions_ms'].items()),
+            ('event handling', baseline['event_handling_ms'], candidate['event_handling_ms']),
+            ('input to display', baseline['input_latency_ms'], candidate['input_latency_ms'])]
+    for name, before, after in rows:
+        if after is None:
+            continue
+        changes = []
+        for statistic in ('p50', 'p95'):
+            change = (after[statistic] - before[statistic]) / before[statistic] if before[statistic] else 0
+            changes.append(f"{statistic} {before[statistic]:.2f} -> {after[statistic]:.2f} ms ({change:+.0%})")
+        cute_print(f"{name}: {', '.join(changes)}", 'bullet')
+    before_allocations, after_allocations = sum(baseline['allocations_per_frame'].values()), sum(candidate['allocations_per_frame'].values())
+    cute_print(f"surfaces per frame: {before_allocations:.1f} -> {after_allocations:.1f}, FPS {baseline['fps']:.1f} -> {candidate['fps']:.1f}", 'bullet')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare two frame metrics reports exported from the game (F4).')
+    parser.add_argument('baseline', type=pathlib.Path)
+    parser.add_argument('candidate', type=pathlib.Path)
+    args = parser.parse_args()
+    compare(args.baseline, args.candidate)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,12 +1,30 @@
+import time
+from typing import Union
 import pygame
 from pygame.locals import RESIZABLE  # FULLSCREEN, SCALED
 from src import GameState, Board
-from src.visualization import draw_board, draw_pieces, highlight_square, render_players_info, render_square_info, render_clock
-from src.config import update_game_dimensions, ASPECT_RATIO, BACKGROUND_COLOR, POSSIBLE_MOVES_COLOR, POSSIBLE_CAPTURES_COLOR
+from src.game import load_log
+from src.position_index import PositionIndex
+from src.instrumentation import FrameMetrics, OVERLAY_KEY, EXPORT_KEY
+from src.input_session import InputRecorder, InputPlayer
+from src.control_map import ControlMap, CONTROL_MAP_KEY
+from src import visualization
+from src.config import update_game_dimensions, LOG_DIRECTORY, INDEX_DIRECTORY, METRICS_DIRECTORY, ASPECT_RATIO, BACKGROUND_COLOR, POSSIBLE_MOVES_COLOR, POSSIBLE_CAPTURES_COLOR
 from src.utils import Emoji, cute_print
 
 
-def main():
+def main(recorder: Union[InputRecorder, None] = None, player: Union[InputPlayer, None] = None, metrics: Union[FrameMetrics, None] = None) -> FrameMetrics:
+    """
+    Runs the game window until it's closed.
+
+    Args:
+        recorder: Records every input event to replay the session later.
+        player: Takes the input events from a recorded session instead of the window (the game ends with the session).
+        metrics: Frame metrics to fill (a new rolling window by default).
+
+    Returns:
+        The frame metrics of the session.
+    """
     SEL_PIECE = None  # Stores the currently selected piece (None if no piece is selected)
     SEL_PIECE_ROW = None  # Row index of the selected piece (None if no piece is selected)
     SEL_PIECE_COL = None  # Column index of the selected piece (None if no piece is selected)
@@ -27,13 +45,33 @@ def main():
 
     # (Optional) Initialize other game elements (e.g., AI, player information)
 
+    # Frame metrics: time of every draw function, Surface allocations and event latency (F3 overlay, F4 export)
+    metrics = metrics or FrameMetrics()
+    metrics.install()
+    draw_board, draw_pieces, highlight_square, render_square_info, render_players_info, render_clock = (
+        metrics.instrument(function) for function in (visualization.draw_board, visualization.draw_pieces, visualization.highlight_square,
+                                                      visualization.render_square_info, visualization.render_players_info, visualization.render_clock))
+
+    # Square control overlay (F2), cached per position
+    control_map = ControlMap()
+
     # Main game loop
     valid_moves = []
     game.start('CevittoG', None)
+    mouse_position = pygame.mouse.get_pos()
+    frame = 0
     while game.state == 'running':
+        metrics.begin_frame()
         game.update_elapsed_time()
         # Handle user input (e.g., mouse clicks for move selection)
-        for event in pygame.event.get():
+        events = pygame.event.get()
+        if player is not None:
+            # Window events are dropped, the recorded ones for this frame are handled instead
+            events = player.events(frame)
+        if recorder is not None:
+            recorder.record(frame, events)
+        metrics.events_received(events)
+        for event in events:
             if event.type == pygame.QUIT:
                 game.stop()
 
@@ -57,10 +95,32 @@ def main():
                 # Clear the screen before redrawing
                 screen.fill(BACKGROUND_COLOR)
 
+            # Frame metrics overlay and export
+            elif event.type == pygame.KEYDOWN and event.key in (OVERLAY_KEY, EXPORT_KEY):
+                metrics.toggle_overlay() if event.key == OVERLAY_KEY else metrics.export(METRICS_DIRECTORY / f"{time.strftime('%Y%m%d_%H%M%S')}.json")
+
+            # Square control overlay
+            elif event.type == pygame.KEYDOWN and event.key == CONTROL_MAP_KEY:
+                control_map.toggle_overlay()
+
+            # Takeback events (Ctrl+Z undo, Ctrl+Y redo)
+            elif event.type == pygame.KEYDOWN and event.mod & pygame.KMOD_CTRL and event.key in (pygame.K_z, pygame.K_y):
+                game.undo() if event.key == pygame.K_z else game.redo()
+                # Drop any selection made on the previous position
+                SEL_PIECE = None
+                SEL_PIECE_ROW = None
+                SEL_PIECE_COL = None
+                valid_moves = []
+
+            # Mouse position (from the events, so replayed sessions move it too)
+            elif event.type == pygame.MOUSEMOTION:
+                mouse_position = event.pos
+
             # Click event
             elif event.type == pygame.MOUSEBUTTONDOWN:
                 # Check if a piece is clicked within the board area
-                mouse_x, mouse_y = pygame.mouse.get_pos()
+                mouse_position = event.pos
+                mouse_x, mouse_y = event.pos
                 row = (mouse_y - MARGIN_PX_SIZE) // SQUARE_PX_SIZE
                 col = (mouse_x - MARGIN_PX_SIZE) // SQUARE_PX_SIZE
 
@@ -70,13 +130,14 @@ def main():
                     SEL_PIECE_COL = col
 
                     # Check posible moves for specific piece
-                    valid_moves = SEL_PIECE.get_valid_moves(chessboard) if SEL_PIECE is not None else []
+                    valid_moves = chessboard.get_valid_moves((row, col))
 
             # Click release event
             elif event.type == pygame.MOUSEBUTTONUP:
                 # Check if a piece is released on a valid square
+                mouse_position = event.pos
                 if SEL_PIECE is not None:
-                    mouse_x, mouse_y = pygame.mouse.get_pos()
+                    mouse_x, mouse_y = event.pos
                     new_row = (mouse_y - MARGIN_PX_SIZE) // SQUARE_PX_SIZE
                     new_col = (mouse_x - MARGIN_PX_SIZE) // SQUARE_PX_SIZE
 
@@ -91,6 +152,8 @@ def main():
                     SEL_PIECE_COL = None
                     valid_moves = []
 
+        metrics.events_handled()
+
         # (Optional) Perform AI move calculation (if applicable)
 
         # Render the game state (board, pieces, etc.)
@@ -98,23 +161,40 @@ def main():
         screen.fill(BACKGROUND_COLOR)
         # Light and dark squares
         draw_board(screen)
+        # Square control
+        control_map.draw_overlay(screen, chessboard)
         # Posible moves
         highlight_square(screen, [position for position, label in valid_moves if 'empty' in label], POSSIBLE_MOVES_COLOR)
         highlight_square(screen, [position for position, label in valid_moves if 'opponent' in label], POSSIBLE_CAPTURES_COLOR)
         # Every piece in the board
-        draw_pieces(screen, chessboard, SEL_PIECE_ROW, SEL_PIECE_COL)
+        draw_pieces(screen, chessboard, SEL_PIECE_ROW, SEL_PIECE_COL, mouse_position)
         # Square information flowing mouse position
-        render_square_info(screen, chessboard)
+        render_square_info(screen, chessboard, mouse_position)
         # Players info
         render_players_info(screen, game)
         # Time
         render_clock(screen, game)
+        # Frame metrics
+        metrics.draw_overlay(screen)
 
         # Update the display
         pygame.display.update()
+        metrics.end_frame()
+        frame += 1
+
+    # Save game log for later review (replayed sessions are only played again)
+    if game.log and player is None:
+        LOG_DIRECTORY.mkdir(exist_ok=True)
+        log_path = LOG_DIRECTORY / f"{time.strftime('%Y%m%d_%H%M%S')}.json"
+        game.save_log(log_path)
+        # Add its positions to the archive index (same game id as batch analysis: the path inside the log directory)
+        with PositionIndex(INDEX_DIRECTORY) as index:
+            index.add_game(log_path.name, *load_log(log_path))
 
     # Quit Pygame
+    metrics.uninstall()
     pygame.quit()
+    return metrics
 
 
 if __name__ == "__main__":
@@ -0,0 +1,238 @@
+import argparse
+import random
+import time
+from array import array
+from typing import Union
+from src.board import Board
+from src.ordering import Move
+from src.pgn import board_from_fen, move_to_san
+from src.utils import cute_print
+
+# Proof and disproof numbers saturate here (they fit the 32 bit table fields)
+INFINITE = 1_000_000_000
+DEFAULT_NODES = 20000
+DEFAULT_HASH_MB = 16
+MAX_MATE_MOVES = 3
+# Longest mate the solver can look for: the depth keys cover its plies
+MAX_HORIZON_MOVES = 32
+# Table entry: 64 bit key, 32 bit phi and delta
+ENTRY_BYTES = 16
+# Remaining plies are part of the table key: a position proven with 3 plies left isn't proven with 1
+_DEPTH_RANDOM = random.Random(0x6d617465)
+DEPTH_KEYS = [_DEPTH_RANDOM.getrandbits(64) for _ in range(2 * MAX_HORIZON_MOVES)]
+
+
+class SolverAborted(Exception):
+    # Raised inside the search when the node budget is spent
+    pass
+
+
+class MateSolver:
+    """
+    Depth-first proof-number search (df-pn) for forced mates.
+
+    Each node keeps a (phi, delta) pair from the side to move point of view: phi is the proof number of its
+    winning (0 when it surely wins), delta the proof number of its losing. The attacker wins by mating within the ply
+    limit; the defender wins by escaping it, by stalemate or by a draw by repetition. The search always expands the
+    most proving child and stays in a subtree while its numbers are under the thresholds passed down.
+
+    Proof numbers live in a fixed size table (three flat arrays indexed by hash), so memory stays bounded
+    whatever the node budget; an entry overwritten by another position is simply computed again.
+    """
+
+    def __init__(self, max_nodes: int = DEFAULT_NODES, hash_mb: int = DEFAULT_HASH_MB):
+        self.max_nodes = max_nodes
+        self.size = 1 << max((hash_mb * 1024 * 1024 // ENTRY_BYTES).bit_length() - 1, 10)
+        self.mask = self.size - 1
+        self.keys = array('Q', bytes(8 * self.size))
+        self.phis = array('I', bytes(4 * self.size))
+        self.deltas = array('I', bytes(4 * self.size))
+        # Statistics of the last solve() or keeps_mate() call (callers add them up)
+        self.nodes = 0
+        self.seconds = 0.0
+        self.budget_exhausted = False
+        self.node_limit = 0
+
+    @property
+    def memory_bytes(self) -> int:
+        return sum(table.itemsize * len(table) for table in (self.keys, self.phis, self.deltas))
+
+    @property
+    def nodes_per_second(self) -> float:
+        return self.nodes / self.seconds if self.seconds else 0.0
+
+    def clear(self):
+        self.keys = array('Q', bytes(8 * self.size))
+
+    def lookup(self, key: int) -> tuple[int, int]:
+        index = key & self.mask
+        if self.keys[index] == key:
+            return self.phis[index], self.deltas[index]
+        return 1, 1
+
+    def store(self, key: int, phi: int, delta: int):
+        index = key & self.mask
+        self.keys[index] = key
+        self.phis[index] = phi
+        self.deltas[index] = delta
+
+    # ----------------------------------------------------------------------------------------------- SEARCH
+    def terminal(self, board: Board, moves: list[Move], attacker: str, plies: int) -> Union[tuple[int, int], None]:
+        # (phi, delta) of a node decided without children, None otherwise
+        attacker_to_move = board.turn == attacker
+        if board.repetitions() >= 1 or board.halfmove_clock >= 100:
+            return (INFINITE, 0) if attacker_to_move else (0, INFINITE)
+        if not moves:
+            # Checkmate is a loss for the side to move; stalemate a loss for the attacker only
+            return (INFINITE, 0) if attacker_to_move or board.in_check() else (0, INFINITE)
+        if plies == 0:
+            # Out of plies: the attacker didn't mate
+            return (INFINITE, 0) if attacker_to_move else (0, INFINITE)
+        return None
+
+    def mid(self, board: Board, attacker: str, plies: int, phi_threshold: int, delta_threshold: int) -> tuple[int, int]:
+        # Multiple iterative deepening: searches the node until its (phi, delta) reaches one of the thresholds
+        self.nodes += 1
+        if self.nodes > self.node_limit:
+            raise SolverAborted
+        key = board.hash ^ DEPTH_KEYS[plies]
+        moves = board.get_legal_moves()
+        decided = self.terminal(board, moves, attacker, plies)
+        if decided is not None:
+            self.store(key, *decided)
+            return decided
+
+        # Children keys and their last known numbers; the attacker tries checks first, and its last move can only mate
+        # with a check, so quiet last moves are lost for it without a visit
+        attacker_to_move = board.turn == attacker
+        children = []
+        for move in moves:
+            board.make_move(*move)
+            child_key = board.hash ^ DEPTH_KEYS[plies - 1]
+            check = board.in_check()
+            board.unmake_move()
+            numbers = (0, INFINITE) if attacker_to_move and plies == 1 and not check else self.lookup(child_key)
+            children.append([move, child_key, *numbers, check])
+        if attacker_to_move:
+            children.sort(key=lambda child: not child[4])
+
+        while True:
+            phi = min(child[3] for child in children)
+            delta = min(sum(child[2] for child in children), INFINITE)
+            if phi >= phi_threshold or delta >= delta_threshold:
+                self.store(key, phi, delta)
+                return phi, delta
+            # Most proving child (smallest delta), and the second smallest delta to know when to switch
+            best, second_delta = None, INFINITE
+            for child in children:
+                if best is None or child[3] < best[3]:
+                    if best is not None:
+                        second_delta = min(second_delta, best[3])
+                    best = child
+                else:
+                    second_delta = min(second_delta, child[3])
+            child_phi_threshold = min(delta_threshold + best[2] - delta, INFINITE)
+            child_delta_threshold = min(phi_threshold, second_delta + 1)
+            board.make_move(*best[0])
+            best[2], best[3] = self.mid(board, attacker, plies - 1, child_phi_threshold, child_delta_threshold)
+            board.unmake_move()
+
+    def prove(self, board: Board, attacker: str, plies: int) -> Union[bool, None]:
+        """
+        Whether attacker mates within plies from the position (either side to move), or None when the node budget
+        of the current solve runs out first.
+        """
+        plies_played = len(board.move_stack)
+        try:
+            phi, delta = self.mid(board, attacker, plies, INFINITE, INFINITE)
+        except SolverAborted:
+            while len(board.move_stack) > plies_played:
+                board.unmake_move()
+            self.budget_exhausted = True
+            return None
+        attacker_to_move = board.turn == attacker
+        return (phi == 0) if attacker_to_move else (delta == 0)
+
+    def solve(self, board: Board, max_moves: int = MAX_MATE_MOVES) -> tuple[Union[Move, None], Union[int, None]]:
+        """
+        Looks for the shortest forced mate for the side to move, proving mate in 1, 2, ... up to max_moves moves.
+
+        Returns:
+            The mating move and the number of moves to mate, or (None, None) if there is no mate that short or the node
+            budget ran out (budget_exhausted tells them apart).
+        """
+        if max_moves > MAX_HORIZON_MOVES:
+            raise ValueError(f"Mates are looked for up to {MAX_HORIZON_MOVES} moves, not {max_moves}")
+        self.begin()
+        try:
+            for moves in range(1, max_moves + 1):
+                plies = 2 * moves - 1
+                proven = self.prove(board, board.turn, plies)
+                if proven is None:
+                    return None, None
+                if proven:
+                    # Finding the move may re-prove a few children, give it its own budget
+                    self.node_limit = self.nodes + self.max_nodes
+                    return self.mating_move(board, plies), moves
+            return None, None
+        finally:
+            self.seconds = time.perf_counter() - self.start_time
+
+    def mating_move(self, board: Board, plies: int) -> Union[Move, None]:
+        # A root move whose position is proven lost for the defender (most are found in the table)
+        attacker = board.turn
+        for move in board.get_legal_moves():
+            board.make_move(*move)
+            phi, _ = self.lookup(board.hash ^ DEPTH_KEYS[plies - 1])
+            proven = phi == INFINITE or (phi != 0 and self.prove(board, attacker, plies - 1))
+            board.unmake_move()
+            if proven:
+                return move
+        return None
+
+    def keeps_mate(self, board: Board, move: Move, moves: int) -> Union[bool, None]:
+        """
+        Whether move still forces mate in at most moves moves (counting itself), None if the budget runs out.
+        """
+        if moves > MAX_HORIZON_MOVES:
+            raise ValueError(f"Mates are looked for up to {MAX_HORIZON_MOVES} moves, not {moves}")
+        self.begin()
+        attacker = board.turn
+        board.make_move(*move)
+        try:
+            return self.prove(board, attacker, 2 * moves - 2)
+        finally:
+            board.unmake_move()
+            self.seconds = time.perf_counter() - self.start_time
+
+    def begin(self):
+        self.nodes = 0
+        self.node_limit = self.max_nodes
+        self.budget_exhausted = False
+        self.start_time = time.perf_counter()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Prove or disprove a forced mate with proof-number search.')
+    parser.add_argument('fen', help='Position as FEN')
+    parser.add_argument('-m', '--moves', type=int, default=MAX_MATE_MOVES, help=f'Longest mate looked for, in moves (up to {MAX_HORIZON_MOVES})')
+    parser.add_argument('-n', '--nodes', type=int, default=DEFAULT_NODES, help='Node budget')
+    parser.add_argument('--hash-mb', type=int, default=DEFAULT_HASH_MB, help='Node table size')
+    args = parser.parse_args()
+    if not 1 <= args.moves <= MAX_HORIZON_MOVES:
+        parser.error(f"--moves must be between 1 and {MAX_HORIZON_MOVES}")
+
+    board = board_from_fen(args.fen)
+    solver = MateSolver(args.nodes, args.hash_mb)
+    move, mate_in = solver.solve(board, args.moves)
+    if move is not None:
+        cute_print(f"Mate in {mate_in}: {move_to_san(board, move)}", 'finish_flag', 'green')
+    elif solver.budget_exhausted:
+        cute_print(f"Undecided: node budget of {args.nodes} spent", 'warning', 'yellow')
+    else:
+        cute_print(f"No mate in {args.moves} moves or less", 'info')
+    cute_print(f"{solver.nodes} nodes in {solver.seconds:.2f} s ({solver.nodes_per_second:.0f} nodes/s), table {solver.memory_bytes / 1024 ** 2:.1f} MB ({solver.size} entries)", 'clock')
+
+
+if __name__ == '__main__':
+    main()
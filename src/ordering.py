@@ -0,0 +1,141 @@
+from typing import Union, Callable, Tuple
+from src.analysis import see_value
+from src.tables import pawn_forward
+
+Move = Tuple[Tuple[int, int], Tuple[int, int], str]
+
+# Promotions are searched among the captures, as if they won the difference between a queen and a pawn
+PROMOTION_BONUS = 800
+
+
+def is_promotion(board, move: Move) -> bool:
+    start_position, end_position, _ = move
+    return board.get_piece_at(start_position).type == 'pawn' and end_position[0] in (0, 7)
+
+
+def is_capture(board, move: Move) -> bool:
+    return 'opponent' in move[2] or 'passant' in move[2]
+
+
+def is_tactical(board, move: Move) -> bool:
+    # Moves that change material: the only ones expanded by quiescence search
+    return is_capture(board, move) or is_promotion(board, move)
+
+
+def mvv_lva(board, move: Move) -> int:
+    # Most valuable victim first, least valuable attacker to break ties
+    start_position, end_position, move_label = move
+    victim = board.get_piece_at(end_position)
+    victim_value = see_value(victim) if victim is not None else (100 if 'passant' in move_label else 0)
+    score = victim_value * 10 - see_value(board.get_piece_at(start_position)) // 10
+    return score + PROMOTION_BONUS * 10 if is_promotion(board, move) else score
+
+
+class MovePicker:
+    """
+    Yields the legal moves of the side to move in stages, doing only the work the consumer asks for:
+    hash move, captures and promotions by MVV-LVA, killer moves, then quiet moves by history score.
+    Each stage generates its own moves when it is reached: captures are listed from the attacked pieces without
+    generating quiet moves, so a cutoff on a capture (or quiescence search) never lists them. Moves are only checked
+    for legality (make/unmake) when they are about to be yielded.
+    """
+
+    def __init__(self, board, hash_move: Union[Move, None] = None, killers: Union[list, None] = None, history: Union[dict, None] = None,
+                 tactical_only: bool = False, capture_filter: Union[Callable, None] = None):
+        self.board = board
+        self.hash_move = hash_move
+        self.killers = killers or []
+        self.history = history if history is not None else {}
+        self.tactical_only = tactical_only
+        self.capture_filter = capture_filter
+        # Statistics: moves generated (the hash move, then pseudo-legal moves of the stages reached), legality checks and moves yielded
+        self.generated = 0
+        self.legality_checks = 0
+        self.yielded = 0
+
+    def _own_pieces(self) -> list:
+        color = self.board.turn
+        return list(self.board.get_all_pieces(filter_by=(lambda piece, filter_color: piece is not None and piece.color == filter_color, color)))
+
+    def _tactical_moves(self) -> list[Move]:
+        # Captures found from their targets (every piece of the side to move attacking an opponent piece), en passant,
+        # and pawn pushes to the last rank; quiet moves of the other pieces are never listed
+        board, color = self.board, self.board.turn
+        tactical = []
+        for target in list(board.get_all_pieces(filter_by=(lambda piece, filter_color: piece is not None and piece.color != filter_color and piece.type != 'king', color))):
+            for start_position, _ in board.iter_attackers(target.current_square, color):
+                tactical.append((start_position, target.current_square, 'opponent-standard'))
+        passing_square = board.en_passant_square
+        for piece in self._own_pieces():
+            if piece.type != 'pawn':
+                continue
+            row, col = piece.current_square
+            if passing_square is not None and passing_square[0] == row + pawn_forward(color) and abs(passing_square[1] - col) == 1:
+                tactical.extend((piece.current_square, end_position, move_label) for end_position, move_label in board.get_valid_moves(piece.current_square) if 'passant' in move_label)
+            if row + pawn_forward(color) in (0, 7) and board.get_piece_at((row + pawn_forward(color), col)) is None:
+                tactical.append((piece.current_square, (row + pawn_forward(color), col), 'empty-standard'))
+        self.generated += len(tactical)
+        return tactical
+
+    def _quiet_moves(self) -> list[Move]:
+        quiet = []
+        for piece in self._own_pieces():
+            start_position = piece.current_square
+            for end_position, move_label in self.board.get_valid_moves(start_position):
+                move = (start_position, end_position, move_label)
+                if not is_tactical(self.board, move):
+                    quiet.append(move)
+        self.generated += len(quiet)
+        return quiet
+
+    def _legal(self, move: Move) -> bool:
+        self.legality_checks += 1
+        return self.board.is_legal(*move)
+
+    def __iter__(self):
+        # Stage 1: hash move from the transposition table, before generating anything
+        hash_move = self.hash_move
+        if hash_move is not None and not self.tactical_only:
+            start_position, end_position, move_label = hash_move
+            piece = self.board.get_piece_at(start_position)
+            if piece is not None and piece.color == self.board.turn and (end_position, move_label) in self.board.get_valid_moves(start_position) and self._legal(hash_move):
+                self.generated += 1
+                self.yielded += 1
+                yield hash_move
+            else:
+                hash_move = None
+
+        # Stage 2: captures and promotions, most valuable victim first
+        tactical = self._tactical_moves()
+        if hash_move in tactical:
+            # Listed again by its stage, but generated once
+            self.generated -= 1
+        tactical.sort(key=lambda move: -mvv_lva(self.board, move))
+        for move in tactical:
+            if move == hash_move or (self.capture_filter is not None and not self.capture_filter(self.board, move)):
+                continue
+            if self._legal(move):
+                self.yielded += 1
+                yield move
+        if self.tactical_only:
+            return
+
+        # Stage 3: killer moves (quiet moves that caused a cutoff at the same ply in a sibling node); quiet moves are only
+        # generated once the search gets here
+        quiet = self._quiet_moves()
+        if hash_move in quiet:
+            self.generated -= 1
+        killers = [killer for killer in self.killers if killer != hash_move and killer in quiet]
+        for move in killers:
+            if self._legal(move):
+                self.yielded += 1
+                yield move
+
+        # Stage 4: remaining quiet moves, best history score first
+        quiet.sort(key=lambda move: -self.history.get((move[0], move[1]), 0))
+        for move in quiet:
+            if move == hash_move or move in killers:
+                continue
+            if self._legal(move):
+                self.yielded += 1
+                yield move
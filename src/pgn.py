@@ -0,0 +1,244 @@
+import re
+from typing import Iterator, Union, Tuple
+from src.board import Board
+from src.pieces import King, Queen, Bishop, Knight, Rook, Pawn
+from src.zobrist import compute_hash
+from src.utils import position_to_chess_notation
+
+Move = Tuple[Tuple[int, int], Tuple[int, int], str]
+
+PIECE_LETTERS = {'king': 'K', 'queen': 'Q', 'bishop': 'B', 'knight': 'N', 'rook': 'R', 'pawn': ''}
+LETTER_PIECES = {letter: name for name, letter in PIECE_LETTERS.items() if letter}
+RESULTS = ('1-0', '0-1', '1/2-1/2', '*')
+FEN_PIECES = {'k': King, 'q': Queen, 'b': Bishop, 'n': Knight, 'r': Rook, 'p': Pawn}
+START_FEN = 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1'
+# Castling right letter -> (king square, rook square), see Board.castling_rights()
+FEN_CASTLING = {'K': ((7, 4), (7, 7)), 'Q': ((7, 4), (7, 0)), 'k': ((0, 4), (0, 7)), 'q': ((0, 4), (0, 0))}
+
+TAG_PATTERN = re.compile(r'\[(\w+)\s+"(.*)"\]')
+# Comments, variations and numeric annotations are skipped, only the main line is read
+NOISE_PATTERN = re.compile(r'\{[^}]*\}|;[^\n]*|\$\d+')
+MOVE_NUMBER_PATTERN = re.compile(r'^\d+\.+')
+SAN_PATTERN = re.compile(r'^([KQBNR])?([a-h])?([1-8])?x?([a-h][1-8])(=?[QBNR])?$')
+
+
+def square_name(position: tuple[int, int]) -> str:
+    return position_to_chess_notation(position).lower()
+
+
+def square_position(name: str) -> tuple[int, int]:
+    return 8 - int(name[1]), ord(name[0]) - ord('a')
+
+
+# --------------------------------------------------------------------------------------------------- READING
+def read_games(path) -> Iterator[tuple[dict, list[str]]]:
+    """
+    Streams the games of a PGN file one at a time, so archives of any size are read with flat memory.
+
+    Args:
+        path: PGN file path.
+
+    Yields:
+        (tags, san_moves) per game: the tag pairs as a dict and the main line moves in SAN.
+    """
+    tags, movetext = {}, []
+    with open(path, encoding='utf-8', errors='replace') as pgn_file:
+        for line in pgn_file:
+            line = line.strip()
+            tag = TAG_PATTERN.match(line)
+            if tag:
+                # A tag after some movetext starts the next game
+                if movetext:
+                    yield tags, parse_movetext(' '.join(movetext))
+                    tags, movetext = {}, []
+                tags[tag.group(1)] = tag.group(2)
+            elif line:
+                movetext.append(line)
+    if tags or movetext:
+        yield tags, parse_movetext(' '.join(movetext))
+
+
+def count_games(path) -> int:
+    # Cheap first pass to size progress bars, splitting games like read_games(): a tag after movetext starts a new one
+    games, in_movetext, pending = 0, False, False
+    with open(path, encoding='utf-8', errors='replace') as pgn_file:
+        for line in pgn_file:
+            line = line.strip()
+            if TAG_PATTERN.match(line):
+                games += in_movetext
+                in_movetext, pending = False, True
+            elif line:
+                in_movetext, pending = True, True
+    return games + pending
+
+
+def parse_movetext(movetext: str) -> list[str]:
+    movetext = NOISE_PATTERN.sub(' ', movetext)
+    # Drop variations, which can be nested
+    while '(' in movetext:
+        movetext = re.sub(r'\([^()]*\)', ' ', movetext)
+
+    san_moves = []
+    for token in movetext.split():
+        token = MOVE_NUMBER_PATTERN.sub('', token)
+        if token and token not in RESULTS:
+            san_moves.append(token)
+    return san_moves
+
+
+def san_to_move(board: Board, san: str) -> Union[Move, None]:
+    """
+    Finds the legal move of the side to move written in SAN (e.g. 'Nbd7', 'exd5', 'O-O', 'e8=Q+').
+    Board always promotes to a queen, so any promotion piece is read as a queen.
+
+    Returns:
+        The (start_position, end_position, move_label) move, or None if no legal move matches.
+    """
+    san = san.rstrip('+#!?')
+    legal_moves = board.get_legal_moves()
+
+    if san.replace('0', 'O') in ('O-O', 'O-O-O'):
+        side = 'kingside' if san.replace('0', 'O') == 'O-O' else 'queenside'
+        return next((move for move in legal_moves if move[2] == f'empty-{side}_castling'), None)
+
+    match = SAN_PATTERN.match(san)
+    if match is None:
+        return None
+    piece_letter, from_file, from_rank, destination, _ = match.groups()
+    piece_type = LETTER_PIECES[piece_letter] if piece_letter else 'pawn'
+    end_position = square_position(destination)
+
+    for move in legal_moves:
+        start_position = move[0]
+        if move[1] != end_position or board.get_piece_at(start_position).type != piece_type:
+            continue
+        if from_file and start_position[1] != ord(from_file) - ord('a'):
+            continue
+        if from_rank and start_position[0] != 8 - int(from_rank):
+            continue
+        return move
+    return None
+
+
+# --------------------------------------------------------------------------------------------------- WRITING
+def move_to_san(board: Board, move: Move) -> str:
+    """
+    Writes a legal move of the side to move in SAN, with disambiguation, check and mate symbols.
+    """
+    start_position, end_position, move_label = move
+    piece = board.get_piece_at(start_position)
+
+    if 'castling' in move_label:
+        san = 'O-O' if 'kingside' in move_label else 'O-O-O'
+    else:
+        capture = 'opponent' in move_label or 'passant' in move_label
+        if piece.type == 'pawn':
+            san = (square_name(start_position)[0] + 'x' if capture else '') + square_name(end_position)
+            if end_position[0] in (0, 7):
+                san += '=Q'
+        else:
+            # Other pieces of the same type that can also reach end_position
+            rivals = [other[0] for other in board.get_legal_moves() if other[1] == end_position and other[0] != start_position and board.get_piece_at(other[0]).type == piece.type]
+            disambiguation = ''
+            if rivals:
+                if all(rival[1] != start_position[1] for rival in rivals):
+                    disambiguation = square_name(start_position)[0]
+                elif all(rival[0] != start_position[0] for rival in rivals):
+                    disambiguation = square_name(start_position)[1]
+                else:
+                    disambiguation = square_name(start_position)
+            san = PIECE_LETTERS[piece.type] + disambiguation + ('x' if capture else '') + square_name(end_position)
+
+    board.make_move(*move)
+    if board.in_check():
+        san += '#' if not board.get_legal_moves() else '+'
+    board.unmake_move()
+    return san
+
+
+def write_game(pgn_file, tags: dict, san_moves: list[str], result: str = '*'):
+    """Writes one game in PGN, with the seven tag roster first."""
+    roster = {'Event': '?', 'Site': '?', 'Date': '????.??.??', 'Round': '?', 'White': '?', 'Black': '?', 'Result': result}
+    roster.update(tags)
+    for name, value in roster.items():
+        pgn_file.write(f'[{name} "{value}"]\n')
+
+    tokens = []
+    for ply, san in enumerate(san_moves):
+        tokens.append(f'{ply // 2 + 1}. {san}' if ply % 2 == 0 else san)
+    tokens.append(roster['Result'])
+    # Movetext lines shorter than 80 characters
+    line = ''
+    pgn_file.write('\n')
+    for token in tokens:
+        if len(line) + len(token) + 1 > 79:
+            pgn_file.write(line.rstrip() + '\n')
+            line = ''
+        line += token + ' '
+    pgn_file.write(line.rstrip() + '\n\n')
+
+
+# --------------------------------------------------------------------------------------------------- FEN
+def board_from_fen(fen: str) -> Board:
+    """
+    Builds a Board from a FEN string. Board derives castling rights from whether kings and rooks have moved, so
+    kings and rooks without a right get a move in their history.
+    """
+    fields = fen.split()
+    if len(fields) < 4:
+        raise ValueError(f"Incomplete FEN '{fen}'")
+    placement, turn, castling, en_passant = fields[:4]
+    rows = placement.split('/')
+    if len(rows) != 8:
+        raise ValueError(f"FEN '{fen}' doesn't have 8 ranks")
+
+    board = Board(setup=False)
+    for row, rank in enumerate(rows):
+        col = 0
+        for letter in rank:
+            if letter.isdigit():
+                col += int(letter)
+                continue
+            if letter.lower() not in FEN_PIECES or col > 7:
+                raise ValueError(f"Bad rank '{rank}' in FEN '{fen}'")
+            piece = FEN_PIECES[letter.lower()]('white' if letter.isupper() else 'black', (row, col))
+            board.board[row][col] = piece
+            if isinstance(piece, King):
+                board.kings[piece.color] = piece
+            col += 1
+    if set(board.kings) != {'white', 'black'}:
+        raise ValueError(f"FEN '{fen}' needs both kings")
+
+    # Kings and rooks that can't castle (including any off their starting squares) are marked as moved
+    granted = {square for right, squares in FEN_CASTLING.items() if right in castling for square in squares}
+    for row in board.board:
+        for piece in row:
+            if isinstance(piece, (King, Rook)) and piece.current_square not in granted:
+                piece.movements.append(piece.current_square)
+
+    board.turn = 'white' if turn == 'w' else 'black'
+    board.en_passant_square = square_position(en_passant) if en_passant != '-' else None
+    board.halfmove_clock = int(fields[4]) if len(fields) > 4 else 0
+    board.hash = compute_hash(board)
+    board.material, board.pst = board.compute_scores()
+    return board
+
+
+def board_to_fen(board: Board) -> str:
+    ranks = []
+    for row in range(8):
+        rank, empty = '', 0
+        for col in range(8):
+            piece = board.board[row][col]
+            if piece is None:
+                empty += 1
+                continue
+            letter = next(letter for letter, piece_class in FEN_PIECES.items() if isinstance(piece, piece_class))
+            rank += (str(empty) if empty else '') + (letter.upper() if piece.color == 'white' else letter)
+            empty = 0
+        ranks.append(rank + (str(empty) if empty else ''))
+
+    rights = board.castling_rights()
+    castling = ''.join(letter for letter, bit in (('K', 1), ('Q', 2), ('k', 4), ('q', 8)) if rights & bit) or '-'
+    en_passant = square_name(board.en_passant_square) if board.en_passant_square is not None else '-'
+    return f"{'/'.join(ranks)} {board.turn[0]} {castling} {en_passant} {board.halfmove_clock} {len(board.move_stack) // 2 + 1}"
@@ -1,5 +1,4 @@
 from typing import Union, Tuple
-from src.utils import adjacent_positions
 
 
 class Piece:
@@ -69,7 +68,7 @@ class King(Piece):
                         break  # Stop if any piece is encountered
                 if not middle_piece:
                     # Check if movement will put King on check
-                    if not self.in_check(board, (row, col - 2)):
+                    if not self.in_check(board, (row, col - 1)) and not self.in_check(board, (row, col - 2)):
                         # Add queen-side castling move (king moves 2 left, rook jumps to position next to king)
                         valid_moves.append(((row, col - 2), 'empty-queenside_castling'))
 
@@ -83,26 +82,17 @@ class King(Piece):
                         break  # Stop if any piece is encountered
                 if not middle_piece:
                     # Check if movement will put King on check
-                    if not self.in_check(board, (row, col + 2)):
+                    if not self.in_check(board, (row, col + 1)) and not self.in_check(board, (row, col + 2)):
                         # Add king-side castling move (king moves 2 right, rook jumps to position next to king)
                         valid_moves.append(((row, col + 2), 'empty-kingside_castling'))
 
         return valid_moves
 
     def in_check(self, board, king_position) -> bool:
-        # Check for opponent pieces attacking the king's position
-        for opponent_piece in board.get_all_pieces(filter_by=(lambda piece, filter_color: piece is not None and piece.color != filter_color, self.color)):
-            # Create auxiliar board to check king_position is in attack. aux_board is needed in the case king_position != self.current_position
-            aux_board = board.copy()
-            aux_board.board[king_position[0]][king_position[1]] = King(self.color, king_position)
-            attack_squares = [position for position, label in opponent_piece.get_valid_moves(aux_board) if 'opponent' in label] if not isinstance(opponent_piece, King) else []
-
-            # Check for an enemy piece at any given square of the board that could capture king_position
-            if not isinstance(opponent_piece, King) and king_position in attack_squares:
-                return True  # Enemy piece can capture the king
-            elif isinstance(opponent_piece, King) and adjacent_positions(king_position, opponent_piece.current_square):
-                return True  # Thread is King... This is checked separately because of recursion problem between get_valid_moves() and in_check() methods
-        return False
+        # Check for opponent pieces attacking the king's position. The king's current square is seen as empty, so a
+        # king can't step back along the ray of a slider attacking it
+        opponent_color = 'black' if self.color == 'white' else 'white'
+        return board.is_attacked(king_position, opponent_color, ignore=(self.current_square,))
 
 
 class Queen(Piece):
@@ -262,13 +252,11 @@ class Pawn(Piece):
         if row == (6 if self.color == "white" else 1) and board.get_piece_at((row + move_direction, col)) is None and board.get_piece_at((row + 2 * move_direction, col)) is None:
             valid_moves.append(((row + 2 * move_direction, col), 'empty-standard'))
 
-        # Additional logic for "en passant" (in passing) ToDo: Complete validation (pawn must had move last turn)
-        passing_piece = board.get_piece_at((row, col + 1))
-        if passing_piece is not None and passing_piece.color != self.color and len(passing_piece.movements) == 2:
-            valid_moves.append(((row + move_direction, col + 1), 'empty-right_passant'))
-        passing_piece = board.get_piece_at((row, col - 1))
-        if passing_piece is not None and passing_piece.color != self.color and len(passing_piece.movements) == 2:
-            valid_moves.append(((row + move_direction, col - 1), 'empty-left_passant'))
+        # En passant (in passing): only right after an adjacent opponent pawn moved two squares, board keeps the square it skipped
+        passing_square = board.en_passant_square
+        passing_piece = board.get_piece_at((row, passing_square[1])) if passing_square is not None else None
+        if passing_square is not None and passing_square[0] == row + move_direction and abs(passing_square[1] - col) == 1 and isinstance(passing_piece, Pawn) and passing_piece.color != self.color:
+            valid_moves.append((passing_square, 'empty-right_passant' if passing_square[1] > col else 'empty-left_passant'))
 
         # Capture right diagonal moves (if enemy piece is present)
         if 0 <= row + move_direction < 8 and 0 <= col + 1 < 8 and board.get_piece_at((row + move_direction, col + 1)) is not None and board.get_piece_at((row + move_direction, col + 1)).color != self.color:
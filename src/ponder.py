@@ -0,0 +1,204 @@
+import argparse
+import contextlib
+import io
+import multiprocessing
+import pickle
+import random
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, wait
+from typing import Union
+from src.board import Board
+from src.ai import Engine
+from src.game import GameState
+from src.ordering import Move, MovePicker
+from src.transposition import SharedTranspositionTable
+from src.utils import cute_print
+
+# Shared table size given to engines that don't have one, so ponder searches leave their results to the engine
+PONDER_HASH_MB = 32
+
+# Stop signal of the ponder searches, set in every worker process by the pool initializer
+_PONDER_STOP = None
+
+
+def _init_worker(stop_event):
+    global _PONDER_STOP
+    _PONDER_STOP = stop_event
+
+
+def _ponder_search(board_snapshot: bytes, depth: int, transposition_table: SharedTranspositionTable) -> tuple[Union[Move, None], int, int]:
+    # Process pool task: search a position the opponent may reach until done or told to stop
+    board = pickle.loads(board_snapshot)
+    engine = Engine(max_depth=depth, transposition_table=transposition_table)
+    engine.stop_event = _PONDER_STOP
+    move, score = engine.search(board, depth)
+    return move, score, engine.depth_reached
+
+
+class Ponderer:
+    """
+    Searches on the opponent's time. While the human thinks, the engine's predicted reply (or every reply, with
+    all_replies) is searched in background processes, writing to the engine's shared transposition table. When the
+    human moves, a finished search of that move is played right away; otherwise the ponder searches are stopped and
+    the engine searches from the warm table, which already holds the iterations done so far.
+    """
+
+    def __init__(self, engine: Engine, workers: int = 1, all_replies: bool = False):
+        if not isinstance(engine.transposition_table, SharedTranspositionTable):
+            engine.transposition_table = SharedTranspositionTable(PONDER_HASH_MB)
+        self.engine = engine
+        self.all_replies = all_replies
+        self.stop_event = multiprocessing.Event()
+        self.executor = ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(self.stop_event,))
+        # Position hash after each pondered human move -> search of the engine reply
+        self.searches: dict[int, Future] = {}
+        # Statistics
+        self.hits = 0
+        self.misses = 0
+        self.latencies: list[float] = []
+
+    def predicted_move(self, board: Board) -> Union[Move, None]:
+        # The reply the engine expected when it searched its own move, if the table still has it
+        entry = self.engine.transposition_table.get(board.hash)
+        return entry[3] if entry is not None and entry[3] is not None else None
+
+    def start(self, board: Board):
+        """
+        Starts pondering the position where the human is to move (call it right after the engine's move).
+        """
+        self.stop()
+        if self.all_replies:
+            human_moves = list(MovePicker(board))
+        else:
+            predicted = self.predicted_move(board)
+            human_moves = [predicted] if predicted is not None else list(MovePicker(board))[:1]
+        for move in human_moves:
+            # The pool pickles its arguments later on another thread: hand it the position while the move is made
+            board.make_move(*move)
+            self.searches[board.hash] = self.executor.submit(_ponder_search, pickle.dumps(board), self.engine.max_depth, self.engine.transposition_table)
+            board.unmake_move()
+
+    def attach(self, game: GameState, engine_color: str):
+        """
+        Ponders on the game's turns: whenever the turn passes to the human in a running game (after the engine's move,
+        or a takeback), the replies to the new position are searched until the human moves and reply() is asked for
+        the engine's move.
+        """
+        def turn_changed(changed_game: GameState):
+            # Finished games aren't pondered (a takeback reopens them and calls back again)
+            if changed_game.result is not None:
+                self.stop()
+            elif changed_game.current_player.color != engine_color:
+                self.start(changed_game.chessboard)
+
+        game.on_turn_change = turn_changed
+
+    def stop(self):
+        # Stop every ponder search and wait for them, so the table is free for the engine
+        if not self.searches:
+            return
+        for search in self.searches.values():
+            search.cancel()
+        self.stop_event.set()
+        wait(list(self.searches.values()))
+        self.stop_event.clear()
+        self.searches = {}
+
+    def reply(self, board: Board) -> tuple[Union[Move, None], int]:
+        """
+        The engine move after the human's move (already made on board), from a finished ponder search when there is
+        one, otherwise from a normal search on the warmed table.
+
+        Returns:
+            (move, score) like Engine.search().
+        """
+        reply_start = time.perf_counter()
+        search = self.searches.pop(board.hash, None)
+        if search is not None and search.done() and not search.cancelled():
+            move, score, _ = search.result()
+            self.hits += 1
+        else:
+            self.stop()
+            move, score = self.engine.search(board)
+            self.misses += 1
+        self.stop()
+        self.latencies.append(time.perf_counter() - reply_start)
+        return move, score
+
+    def report(self):
+        average_latency = sum(self.latencies) / len(self.latencies) if self.latencies else 0
+        cute_print(f"Ponder hits {self.hits}/{self.hits + self.misses}, average reply {average_latency * 1000:.0f} ms", 'clock')
+
+    def close(self):
+        self.stop()
+        self.executor.shutdown()
+
+
+def simulate(moves: int, depth: int, think_time: float, ponder: bool, all_replies: bool, workers: int, seed: int) -> list[float]:
+    """
+    Plays the engine (white) against a simulated human who thinks think_time seconds and then plays a random move (the
+    engine's prediction half of the time), through a GameState the ponderer is attached to. Returns the latencies of
+    the engine replies played.
+    """
+    def play(move: Move):
+        # GameState reports every turn; keep the simulation output quiet
+        with contextlib.redirect_stdout(io.StringIO()):
+            game.turn(move[0], move[1], board.get_valid_moves(move[0]))
+
+    engine = Engine(max_depth=depth, hash_mb=PONDER_HASH_MB)
+    ponderer = Ponderer(engine, workers, all_replies) if ponder else None
+    board = Board()
+    game = GameState(board)
+    game.start('Engine', 'Human')
+    if ponderer:
+        ponderer.attach(game, 'white')
+    latencies = []
+    move, _ = engine.search(board)
+    for _ in range(moves):
+        # Engine move (pondering starts as the turn passes to the human)
+        if move is None:
+            break
+        play(move)
+        human_moves = list(MovePicker(board))
+        if not human_moves:
+            break
+        entry = engine.transposition_table.get(board.hash)
+        predicted = entry[3] if entry is not None else None
+
+        # Human move
+        time.sleep(think_time)
+        game.update_elapsed_time()
+        # Chosen from the position alone, so runs with and without pondering play the same game
+        rng = random.Random(seed ^ board.hash)
+        human_move = predicted if predicted is not None and rng.random() < 0.5 else rng.choice(human_moves)
+        play(human_move)
+
+        # Engine reply, played on the next iteration
+        reply_start = time.perf_counter()
+        move, _ = ponderer.reply(board) if ponderer else engine.search(board)
+        latencies.append(time.perf_counter() - reply_start)
+
+    if ponderer:
+        ponderer.report()
+        ponderer.close()
+    engine.close()
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure engine reply latency with and without pondering against a simulated human.')
+    parser.add_argument('-m', '--moves', type=int, default=10, help='Engine moves per run')
+    parser.add_argument('-d', '--depth', type=int, default=3, help='Engine search depth')
+    parser.add_argument('-t', '--think', type=float, default=2.0, help='Simulated human thinking time in seconds')
+    parser.add_argument('-w', '--workers', type=int, default=1, help='Ponder worker processes')
+    parser.add_argument('--all-replies', action='store_true', help='Ponder every human reply instead of the predicted one')
+    args = parser.parse_args()
+
+    for ponder in (False, True):
+        latencies = simulate(args.moves, args.depth, args.think, ponder, args.all_replies, args.workers, seed=0)
+        average = sum(latencies) / len(latencies) if latencies else 0
+        cute_print(f"{'Pondering' if ponder else 'No pondering'}: average reply {average * 1000:.0f} ms, worst {max(latencies, default=0) * 1000:.0f} ms", 'rocket')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,367 @@
+import argparse
+import contextlib
+import heapq
+import mmap
+import os
+import pathlib
+import random
+import struct
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, Union
+from src.board import Board
+from src.batch_analysis import iter_archive, count_archive, resolve_move
+from src.ordering import Move
+from src.pgn import RESULTS, board_from_fen, move_to_san, san_to_move
+from src.transposition import pack_move, unpack_move
+from src.utils import cute_print, progress_bar
+try:
+    import fcntl
+except ImportError:
+    # Windows: byte range locks instead
+    fcntl = None
+    import msvcrt
+
+# Index directory layout:
+#   positions.bin  magic header, then fixed size entries sorted by (position hash, game, ply)
+#   recent.bin     entries appended as games are saved, unsorted, merged into positions.bin once large enough
+#   games.txt      one game id per line, the line number is the game number used by the entries
+#   index.lock     held exclusively by a writer (appends and merges), so the UI and updates can write at the same time
+INDEX_MAGIC = b'FCINDEX1'
+ENTRY_FORMAT = struct.Struct('<QIHHB')  # position hash, game number, ply, packed move played, result
+HASH_FORMAT = struct.Struct('<Q')
+POSITIONS_FILE = 'positions.bin'
+RECENT_FILE = 'recent.bin'
+GAMES_FILE = 'games.txt'
+LOCK_FILE = 'index.lock'
+# Move of the final position of a game (nothing was played from it)
+NO_MOVE = 0xFFFF
+# Recent entries are merged into the sorted table past this many, or past an eighth of the table
+MERGE_MIN_ENTRIES = 1 << 16
+MERGE_ENTRIES_FRACTION = 8
+WRITE_CHUNK_ENTRIES = 1 << 16
+
+
+def _replay_game(game_id: str, tags: dict, moves: list) -> tuple[str, int, list[tuple[int, int, int]]]:
+    # Process pool task: the (position hash, ply, packed move) of every position of a game, up to an unreadable move
+    board = Board()
+    positions = []
+    for ply, move in enumerate(moves):
+        played_move = resolve_move(board, move)
+        if played_move is None:
+            break
+        positions.append((board.hash, ply, pack_move(played_move)))
+        board.make_move(*played_move)
+    else:
+        positions.append((board.hash, len(moves), NO_MOVE))
+    result = tags.get('Result', '*')
+    return game_id, RESULTS.index(result) if result in RESULTS else RESULTS.index('*'), positions
+
+
+class PositionIndex:
+    """
+    Position hash -> (game, ply, move played, result) over a whole game archive.
+
+    Most entries live in a sorted, memory-mapped table searched by binary search, so a lookup reads O(log n) pages
+    whatever the archive size. Games saved since the last merge are appended to a small unsorted file, read into memory,
+    and merged into the table once it grows (heapq.merge of both sorted streams into a new table).
+    """
+
+    def __init__(self, directory: Union[pathlib.Path, str]):
+        self.directory = pathlib.Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.positions_path = self.directory / POSITIONS_FILE
+        self.recent_path = self.directory / RECENT_FILE
+        self.games_path = self.directory / GAMES_FILE
+        self.lock_path = self.directory / LOCK_FILE
+        self.lock_file = None
+        self.lock_depth = 0
+        if not self.positions_path.exists():
+            self.positions_path.write_bytes(INDEX_MAGIC)
+        self.positions_file = None
+        self.data = None
+        self.entries_count = 0
+        self.positions_stat = None
+        self.open_positions()
+        # Game ids by game number, and entries of recent.bin by position hash, read up to the file ends so far
+        self.game_ids: list[str] = []
+        self.game_numbers: dict[str, int] = {}
+        self.games_offset = 0
+        self.recent: dict[int, list[tuple[int, int, int, int]]] = {}
+        self.recent_count = 0
+        self.recent_offset = 0
+        self.refresh()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return self.entries_count + self.recent_count
+
+    def open_positions(self):
+        self.positions_file = open(self.positions_path, 'rb')
+        self.positions_stat = os.fstat(self.positions_file.fileno())
+        self.data = mmap.mmap(self.positions_file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.data[:len(INDEX_MAGIC)] != INDEX_MAGIC:
+            self.close()
+            raise ValueError(f"{self.positions_path} is not a position index")
+        self.entries_count = (len(self.data) - len(INDEX_MAGIC)) // ENTRY_FORMAT.size
+
+    def refresh(self):
+        """
+        Picks up games appended (or a merge done) by another process since the last read.
+        """
+        positions_stat = os.stat(self.positions_path)
+        recent_size = self.recent_path.stat().st_size if self.recent_path.exists() else 0
+        if (positions_stat.st_ino, positions_stat.st_size) != (self.positions_stat.st_ino, self.positions_stat.st_size) or recent_size < self.recent_offset:
+            # Merged since: the table was replaced and recent.bin emptied
+            self.data.close()
+            self.positions_file.close()
+            self.open_positions()
+            self.recent, self.recent_count, self.recent_offset = {}, 0, 0
+
+        if self.games_path.exists():
+            with open(self.games_path, 'rb') as games_file:
+                games_file.seek(self.games_offset)
+                data = games_file.read()
+            # Only whole lines, a game id being written is read next time
+            data = data[:data.rfind(b'\n') + 1]
+            self.games_offset += len(data)
+            for game_id in data.decode('utf-8').splitlines():
+                self.game_numbers[game_id] = len(self.game_ids)
+                self.game_ids.append(game_id)
+
+        if recent_size > self.recent_offset:
+            with open(self.recent_path, 'rb') as recent_file:
+                recent_file.seek(self.recent_offset)
+                data = recent_file.read((recent_size - self.recent_offset) // ENTRY_FORMAT.size * ENTRY_FORMAT.size)
+            self.recent_offset += len(data)
+            for position_hash, *entry in ENTRY_FORMAT.iter_unpack(data):
+                self.recent.setdefault(position_hash, []).append(tuple(entry))
+                self.recent_count += 1
+
+    # ----------------------------------------------------------------------------------------------- LOOKUP
+    def _hash_at(self, index: int) -> int:
+        return HASH_FORMAT.unpack_from(self.data, len(INDEX_MAGIC) + index * ENTRY_FORMAT.size)[0]
+
+    def entries(self, position_hash: int) -> list[tuple[int, int, int, int]]:
+        # Lower bound binary search in the table, then the matching (game number, ply, packed move, result) entries
+        low, high = 0, self.entries_count
+        while low < high:
+            middle = (low + high) // 2
+            if self._hash_at(middle) < position_hash:
+                low = middle + 1
+            else:
+                high = middle
+        found = []
+        while low < self.entries_count:
+            entry_hash, *entry = ENTRY_FORMAT.unpack_from(self.data, len(INDEX_MAGIC) + low * ENTRY_FORMAT.size)
+            if entry_hash != position_hash:
+                break
+            found.append(tuple(entry))
+            low += 1
+        return found + self.recent.get(position_hash, [])
+
+    def lookup(self, position_hash: int) -> list[tuple[str, int, Union[Move, None], str]]:
+        """
+        Every time a position was reached in the archive.
+
+        Returns:
+            (game id, ply, move played from the position or None if the game ended there, game result) tuples, in game order.
+        """
+        self.refresh()
+        return [(self.game_ids[game_number], ply, unpack_move(packed_move) if packed_move != NO_MOVE else None, RESULTS[result])
+                for game_number, ply, packed_move, result in sorted(self.entries(position_hash))]
+
+    def games(self, board: Board) -> list[dict]:
+        """
+        Games that reached the position of board, with the move played there in SAN. Moves that aren't legal on board
+        (a hash collision) are dropped.
+        """
+        legal_moves = board.get_legal_moves()
+        found = []
+        for game_id, ply, move, result in self.lookup(board.hash):
+            if move is not None and move not in legal_moves:
+                continue
+            found.append({'GameId': game_id, 'Ply': ply, 'Played': move_to_san(board, move) if move is not None else None, 'Result': result})
+        return found
+
+    # ----------------------------------------------------------------------------------------------- WRITING
+    @contextlib.contextmanager
+    def locked(self):
+        """
+        Holds the index lock (exclusive, across processes) and refreshes, so writes see every game written before them.
+        Re-entrant within one PositionIndex.
+        """
+        if self.lock_depth == 0:
+            self.lock_file = open(self.lock_path, 'a+b')
+            if fcntl is not None:
+                fcntl.flock(self.lock_file.fileno(), fcntl.LOCK_EX)
+            else:
+                self.lock_file.seek(0)
+                msvcrt.locking(self.lock_file.fileno(), msvcrt.LK_LOCK, 1)
+        self.lock_depth += 1
+        try:
+            self.refresh()
+            yield
+        finally:
+            self.lock_depth -= 1
+            if self.lock_depth == 0:
+                if fcntl is not None:
+                    fcntl.flock(self.lock_file.fileno(), fcntl.LOCK_UN)
+                else:
+                    self.lock_file.seek(0)
+                    msvcrt.locking(self.lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+                self.lock_file.close()
+                self.lock_file = None
+
+    def __contains__(self, game_id: str) -> bool:
+        return game_id in self.game_numbers
+
+    def append_games(self, replayed_games: list[tuple[str, int, list[tuple[int, int, int]]]]) -> int:
+        # Adds replayed games (see _replay_game()) to recent.bin, the game ids first so entries never point past games.txt.
+        # Under the lock, game numbers can't be taken by another writer between the two appends
+        with self.locked():
+            replayed_games = [game for game in replayed_games if game[0] not in self.game_numbers]
+            if not replayed_games:
+                return 0
+            first_number = len(self.game_ids)
+            with open(self.games_path, 'a', encoding='utf-8') as games_file:
+                games_file.write(''.join(f'{game_id}\n' for game_id, _, _ in replayed_games))
+            data = b''.join(ENTRY_FORMAT.pack(position_hash, first_number + index, ply, packed_move, result)
+                            for index, (_, result, positions) in enumerate(replayed_games) for position_hash, ply, packed_move in positions)
+            with open(self.recent_path, 'ab') as recent_file:
+                recent_file.write(data)
+            self.refresh()
+        return len(data) // ENTRY_FORMAT.size
+
+    def add_game(self, game_id: str, tags: dict, moves: list) -> int:
+        """
+        Indexes one game (SAN moves or (start_position, end_position) pairs, as iter_archive() yields them), merging
+        the recent entries into the table when there are enough of them. Games already indexed are skipped.
+
+        Returns:
+            Number of positions added.
+        """
+        if game_id in self.game_numbers:
+            return 0
+        replayed_game = _replay_game(game_id, tags, moves)
+        with self.locked():
+            added = self.append_games([replayed_game])
+            if self.recent_count >= max(MERGE_MIN_ENTRIES, self.entries_count // MERGE_ENTRIES_FRACTION):
+                self.merge()
+        return added
+
+    def update(self, archive_directory: pathlib.Path, workers: int = os.cpu_count() or 1) -> int:
+        """
+        Indexes every game of an archive that isn't in the index yet, replaying them on a process pool, and merges.
+
+        Returns:
+            Number of games added.
+        """
+        self.refresh()
+        games = [game for game in iter_archive(archive_directory) if game[0] not in self.game_numbers]
+        if not games:
+            return 0
+        start_time = time.time()
+        replayed_games = []
+        with ProcessPoolExecutor(workers) as executor:
+            for replayed_game in executor.map(_replay_game, *zip(*games), chunksize=max(1, len(games) // (workers * 16))):
+                replayed_games.append(replayed_game)
+                progress_bar(len(replayed_games), len(games), start_time, title='Index')
+                # Written in batches, so a crash only loses the games in memory
+                if len(replayed_games) >= WRITE_CHUNK_ENTRIES // 64:
+                    self.append_games(replayed_games)
+                    replayed_games = []
+        self.append_games(replayed_games)
+        self.merge()
+        return len(games)
+
+    def iter_table(self) -> Iterator[tuple[int, int, int, int, int]]:
+        chunk_bytes = WRITE_CHUNK_ENTRIES * ENTRY_FORMAT.size
+        end = len(INDEX_MAGIC) + self.entries_count * ENTRY_FORMAT.size
+        for offset in range(len(INDEX_MAGIC), end, chunk_bytes):
+            yield from ENTRY_FORMAT.iter_unpack(self.data[offset:min(offset + chunk_bytes, end)])
+
+    def merge(self):
+        """
+        Merges the recent entries into the sorted table: both are streamed in order into a new file, which then
+        replaces the table, and recent.bin is emptied.
+        """
+        with self.locked():
+            if not self.recent_count:
+                return
+            recent = sorted((position_hash, *entry) for position_hash, entries in self.recent.items() for entry in entries)
+            temporary_path = self.positions_path.with_suffix('.tmp')
+            with open(temporary_path, 'wb') as positions_file:
+                positions_file.write(INDEX_MAGIC)
+                chunk = []
+                for entry in heapq.merge(self.iter_table(), recent):
+                    chunk.append(ENTRY_FORMAT.pack(*entry))
+                    if len(chunk) >= WRITE_CHUNK_ENTRIES:
+                        positions_file.write(b''.join(chunk))
+                        chunk = []
+                positions_file.write(b''.join(chunk))
+            os.replace(temporary_path, self.positions_path)
+            self.recent_path.write_bytes(b'')
+            self.refresh()
+
+    def close(self):
+        if self.lock_file is not None:
+            self.lock_file.close()
+            self.lock_file = None
+        if self.data is not None:
+            self.data.close()
+            self.positions_file.close()
+            self.data = None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Index every position of a game archive, or look a position up in the index.')
+    parser.add_argument('-i', '--index', type=pathlib.Path, default=pathlib.Path('index'), help='Index directory')
+    commands = parser.add_subparsers(dest='command', required=True)
+    update_parser = commands.add_parser('update', help='Add the games of an archive that are not indexed yet')
+    update_parser.add_argument('directory', type=pathlib.Path, help='Directory with .pgn and .json game logs (searched recursively)')
+    update_parser.add_argument('-w', '--workers', type=int, default=os.cpu_count() or 1, help='Worker processes')
+    query_parser = commands.add_parser('query', help='Games that reached a position')
+    query_parser.add_argument('--fen', help='Position as FEN (defaults to the starting position)')
+    query_parser.add_argument('--moves', nargs='*', default=[], help='SAN moves played from the position')
+    bench_parser = commands.add_parser('bench', help='Time lookups of random indexed positions')
+    bench_parser.add_argument('-n', '--lookups', type=int, default=10000)
+    args = parser.parse_args()
+
+    with PositionIndex(args.index) as index:
+        if args.command == 'update':
+            total = count_archive(args.directory)
+            added = index.update(args.directory, args.workers)
+            cute_print(f"{added} new games of {total} indexed, {len(index)} positions in {args.index}", 'download', 'green')
+
+        elif args.command == 'query':
+            board = board_from_fen(args.fen) if args.fen else Board()
+            for san in args.moves:
+                move = san_to_move(board, san)
+                if move is None:
+                    parser.error(f"Illegal move '{san}'")
+                board.make_move(*move)
+            lookup_start = time.perf_counter()
+            games = index.games(board)
+            cute_print(f"{len(games)} games reached the position ({(time.perf_counter() - lookup_start) * 1000:.2f} ms)", 'info')
+            for game in games:
+                cute_print(f"{game['GameId']} ply {game['Ply']}: {game['Played'] or 'game over'} ({game['Result']})", 'bullet')
+
+        elif args.command == 'bench':
+            if not index.entries_count:
+                parser.error(f"{args.index} has no merged positions")
+            rng = random.Random(0)
+            hashes = [index._hash_at(rng.randrange(index.entries_count)) for _ in range(args.lookups)]
+            lookup_start = time.perf_counter()
+            found = sum(len(index.lookup(position_hash)) for position_hash in hashes)
+            elapsed = time.perf_counter() - lookup_start
+            cute_print(f"{args.lookups} lookups over {len(index)} positions: {elapsed / args.lookups * 1e6:.1f} µs each, {found} entries found", 'rocket')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,308 @@
+import argparse
+import asyncio
+import contextlib
+import io
+import itertools
+import json
+import os
+import pickle
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Union
+from src.board import Board
+from src.game import GameState
+from src.clock import TimeControl
+from src.ai import Engine
+from src.ordering import Move
+from src.pgn import square_name
+from src.utils import cute_print, percentile
+
+# Newline delimited JSON over a local socket: one request per line, one response line per request
+HOST = '127.0.0.1'
+PORT = 8765
+DEFAULT_DEPTH = 2
+
+# One engine per worker process and depth, so tables stay warm between requests of any session
+_WORKER_ENGINES: dict[int, Engine] = {}
+
+
+def _engine_reply(board_snapshot: bytes, depth: int) -> Union[Move, None]:
+    # Process pool task: the engine move in a session position
+    board = pickle.loads(board_snapshot)
+    engine = _WORKER_ENGINES.get(depth)
+    if engine is None:
+        engine = _WORKER_ENGINES[depth] = Engine(max_depth=depth)
+    return engine.search(board)[0]
+
+
+def move_to_text(move: Move) -> str:
+    # Long algebraic notation, e.g. 'e2e4' (promotions are always to a queen)
+    return square_name(move[0]) + square_name(move[1])
+
+
+class Session:
+    """One game hosted by the server: its own Board and GameState, and the engine playing one side."""
+
+    def __init__(self, session_id: int, human_color: str, depth: int, time_control: Union[TimeControl, None]):
+        self.session_id = session_id
+        self.board = Board()
+        self.game = GameState(self.board, time_control)
+        self.human_color = human_color
+        self.depth = depth
+        # Requests of a session are answered in order, even from several connections
+        self.lock = asyncio.Lock()
+        self.latencies: list[float] = []
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.game.start('Player' if human_color == 'white' else 'Engine', 'Player' if human_color == 'black' else 'Engine')
+
+    def legal_moves(self) -> list[Move]:
+        return self.board.get_legal_moves() if self.game.result is None else []
+
+    def play(self, move: Move):
+        # GameState reports every turn; keep the server output quiet
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.game.update_elapsed_time()
+            self.game.turn(move[0], move[1], self.board.get_valid_moves(move[0]))
+
+    def state(self) -> dict:
+        return {'session': self.session_id,
+                'turn': self.board.turn,
+                'moves': [move_to_text((record.start_position, record.end_position, record.move_label)) for record in self.board.move_stack],
+                'legal': [move_to_text(move) for move in self.legal_moves()],
+                'result': self.game.result,
+                'reason': self.game.result_reason}
+
+
+class GameServer:
+    """
+    Hosts many concurrent games in one asyncio process. Moves are validated against the session board, and engine
+    replies are searched on a process pool, so the event loop keeps serving other sessions meanwhile.
+    """
+
+    def __init__(self, host: str = HOST, port: int = PORT, workers: int = os.cpu_count() or 1):
+        self.host = host
+        self.port = port
+        self.executor = ProcessPoolExecutor(workers)
+        self.sessions: dict[int, Session] = {}
+        self.session_ids = itertools.count(1)
+        self.server: Union[asyncio.AbstractServer, None] = None
+        # Open connections (handler task -> writer), closed before the server stops
+        self.connections: dict[asyncio.Task, asyncio.StreamWriter] = {}
+        self.start_time = time.monotonic()
+        self.games_finished = 0
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle_connection, self.host, self.port)
+        # Port 0 asks the system for a free port
+        self.port = self.server.sockets[0].getsockname()[1]
+        self.start_time = time.monotonic()
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            # Handlers end on their own once their connection is closed (cancelling them would leave them half done)
+            for writer in self.connections.values():
+                writer.close()
+            await asyncio.gather(*self.connections, return_exceptions=True)
+            await self.server.wait_closed()
+        self.executor.shutdown(cancel_futures=True)
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.connections[asyncio.current_task()] = writer
+        try:
+            while line := await reader.readline():
+                request_start = time.perf_counter()
+                try:
+                    request = json.loads(line)
+                    response = await self.handle_request(request)
+                except (ValueError, KeyError, TypeError) as error:
+                    request, response = {}, {'error': str(error)}
+                writer.write(json.dumps(response).encode() + b'\n')
+                await writer.drain()
+                session = self.sessions.get(request.get('session')) if isinstance(request, dict) else None
+                if session is not None:
+                    session.latencies.append(time.perf_counter() - request_start)
+        except ConnectionError:
+            pass
+        finally:
+            del self.connections[asyncio.current_task()]
+            writer.close()
+
+    async def handle_request(self, request: dict) -> dict:
+        """
+        Commands:
+            new: {'cmd': 'new', 'color': 'white', 'depth': 2, 'tc': '300+2'} starts a session (the engine moves first
+                if the player is black).
+            move: {'cmd': 'move', 'session': 1, 'move': 'e2e4'} plays the player's move and the engine reply.
+            state: {'cmd': 'state', 'session': 1} returns the session position.
+            close: {'cmd': 'close', 'session': 1} ends the session.
+            stats: {'cmd': 'stats'} returns the server statistics.
+        """
+        command = request['cmd']
+        if command == 'new':
+            human_color = request.get('color', 'white')
+            if human_color not in ('white', 'black'):
+                raise ValueError(f"Unknown color '{human_color}'")
+            time_control = TimeControl.parse(request['tc']) if request.get('tc') else None
+            session = Session(next(self.session_ids), human_color, int(request.get('depth', DEFAULT_DEPTH)), time_control)
+            self.sessions[session.session_id] = session
+            if human_color == 'black':
+                async with session.lock:
+                    await self.engine_move(session)
+            return session.state()
+        if command == 'stats':
+            return self.statistics()
+        if command not in ('state', 'close', 'move'):
+            return {'error': f"Unknown command '{command}'"}
+
+        session = self.sessions.get(request.get('session'))
+        if session is None:
+            return {'error': f"Unknown session {request.get('session')}"}
+        if command == 'state':
+            # Listing legal moves makes and unmakes them on the session board: wait for the session's pending request
+            async with session.lock:
+                return session.state()
+        if command == 'close':
+            del self.sessions[session.session_id]
+            return {'session': session.session_id, 'closed': True}
+
+        async with session.lock:
+            if session.game.result is not None or session.board.turn != session.human_color:
+                return {'error': 'Not your turn', **session.state()}
+            text = request['move']
+            move = next((legal_move for legal_move in session.legal_moves() if move_to_text(legal_move) == text[:4]), None)
+            if move is None:
+                return {'error': f"Illegal move '{text}'", **session.state()}
+            session.play(move)
+            reply = await self.engine_move(session)
+            return {'reply': move_to_text(reply) if reply else None, **session.state()}
+
+    async def engine_move(self, session: Session) -> Union[Move, None]:
+        if session.game.result is not None:
+            self.games_finished += 1
+            return None
+        # The pool pickles its arguments later on another thread: hand it a copy of the position as it is now
+        move = await asyncio.get_running_loop().run_in_executor(self.executor, _engine_reply, pickle.dumps(session.board), session.depth)
+        session.play(move)
+        if session.game.result is not None:
+            self.games_finished += 1
+        return move
+
+    def statistics(self) -> dict:
+        elapsed = time.monotonic() - self.start_time
+        latencies = [latency for session in self.sessions.values() for latency in session.latencies]
+        return {'sessions': len(self.sessions),
+                'games_finished': self.games_finished,
+                'games_per_second': self.games_finished / elapsed if elapsed else 0,
+                'latency_mean': sum(latencies) / len(latencies) if latencies else 0,
+                'latency_p50': percentile(latencies, 0.5),
+                'latency_p95': percentile(latencies, 0.95),
+                'per_session': {session_id: {'requests': len(session.latencies),
+                                             'latency_mean': sum(session.latencies) / len(session.latencies) if session.latencies else 0,
+                                             'latency_max': max(session.latencies, default=0)}
+                                for session_id, session in self.sessions.items()}}
+
+
+# --------------------------------------------------------------------------------------------------- LOOPBACK CLIENT
+class LoopbackClient:
+    """Minimal client of the server protocol, standing in for real players in tests and benchmarks."""
+
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self.reader: Union[asyncio.StreamReader, None] = None
+        self.writer: Union[asyncio.StreamWriter, None] = None
+
+    async def connect(self):
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+
+    async def request(self, **request) -> dict:
+        self.writer.write(json.dumps(request).encode() + b'\n')
+        await self.writer.drain()
+        return json.loads(await self.reader.readline())
+
+    async def close(self):
+        self.writer.close()
+        await self.writer.wait_closed()
+
+    async def play_random_game(self, depth: int, seed: int, max_moves: int = 60) -> tuple[dict, list[float]]:
+        """
+        Plays random legal moves against the engine (the session stays open). Returns the final state and the round
+        trip time of each move.
+        """
+        rng = random.Random(seed)
+        state = await self.request(cmd='new', color=rng.choice(('white', 'black')), depth=depth)
+        round_trips = []
+        for _ in range(max_moves):
+            if state['result'] is not None or not state['legal']:
+                break
+            request_start = time.perf_counter()
+            state = await self.request(cmd='move', session=state['session'], move=rng.choice(state['legal']))
+            round_trips.append(time.perf_counter() - request_start)
+        return state, round_trips
+
+
+async def benchmark(sessions: int, depth: int, max_moves: int, workers: int) -> dict:
+    """
+    Starts a server on a free local port and plays `sessions` concurrent random games against it through loopback
+    clients. Returns games per second and round trip latency statistics.
+    """
+    server = GameServer(port=0, workers=workers)
+    await server.start()
+    clients = [LoopbackClient(server.host, server.port) for _ in range(sessions)]
+    await asyncio.gather(*(client.connect() for client in clients))
+
+    start_time = time.perf_counter()
+    results = await asyncio.gather(*(client.play_random_game(depth, seed, max_moves) for seed, client in enumerate(clients)))
+    elapsed = time.perf_counter() - start_time
+    statistics = await clients[0].request(cmd='stats')
+
+    await asyncio.gather(*(client.request(cmd='close', session=state['session']) for client, (state, _) in zip(clients, results)))
+    await asyncio.gather(*(client.close() for client in clients))
+    await server.close()
+    session_latencies = [session['latency_mean'] for session in statistics['per_session'].values()]
+    round_trips = [round_trip for _, game_round_trips in results for round_trip in game_round_trips]
+    return {'games': sessions,
+            'seconds': elapsed,
+            'games_per_second': sessions / elapsed,
+            'moves': len(round_trips),
+            'round_trip_mean': sum(round_trips) / len(round_trips) if round_trips else 0,
+            'round_trip_p95': percentile(round_trips, 0.95),
+            'round_trip_max': max(round_trips, default=0),
+            'session_latency_mean': sum(session_latencies) / len(session_latencies) if session_latencies else 0,
+            'session_latency_worst': max(session_latencies, default=0)}
+
+
+async def serve(host: str, port: int, workers: int):
+    server = GameServer(host, port, workers)
+    await server.start()
+    cute_print(f"Serving games on {server.host}:{server.port} with {workers} engine workers", 'rocket')
+    try:
+        await server.server.serve_forever()
+    finally:
+        await server.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Host many games over a local socket (newline delimited JSON).')
+    parser.add_argument('--host', default=HOST)
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('-w', '--workers', type=int, default=os.cpu_count() or 1, help='Engine worker processes')
+    parser.add_argument('--bench', type=int, metavar='SESSIONS', help='Play this many concurrent loopback games and report throughput instead of serving')
+    parser.add_argument('-d', '--depth', type=int, default=1, help='Engine depth of benchmark games')
+    parser.add_argument('--max-moves', type=int, default=40, help='Moves per benchmark game')
+    args = parser.parse_args()
+
+    if args.bench:
+        report = asyncio.run(benchmark(args.bench, args.depth, args.max_moves, args.workers))
+        cute_print(f"{report['games']} games in {report['seconds']:.1f} s ({report['games_per_second']:.2f} games/s), {report['moves']} moves, "
+                   f"round trip mean {report['round_trip_mean'] * 1000:.0f} ms, p95 {report['round_trip_p95'] * 1000:.0f} ms, "
+                   f"max {report['round_trip_max'] * 1000:.0f} ms", 'finish_flag', 'green')
+        cute_print(f"Server side latency per session: mean {report['session_latency_mean'] * 1000:.0f} ms, worst session {report['session_latency_worst'] * 1000:.0f} ms", 'clock')
+    else:
+        asyncio.run(serve(args.host, args.port, args.workers))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,427 @@
+import argparse
+import mmap
+import pathlib
+import time
+from array import array
+from typing import Iterator, Union
+from src.board import Board
+from src.tables import PIECE_VALUES, KNIGHT_STEPS, KING_STEPS, SLIDER_DIRECTIONS, pawn_forward
+from src.utils import cute_print, progress_bar
+
+# Material signatures are written white pieces then black pieces, kings first: 'KQK' is king and queen against king
+PIECE_LETTERS = {'king': 'K', 'queen': 'Q', 'rook': 'R', 'bishop': 'B', 'knight': 'N', 'pawn': 'P'}
+LETTER_PIECES = {letter: name for name, letter in PIECE_LETTERS.items()}
+LETTER_ORDER = 'KQRBNP'
+DEFAULT_SIGNATURES = ('KQK', 'KRK', 'KPK')
+# Endings nobody can win are draws without a table
+DRAWN_SIGNATURES = ('KK', 'KBK', 'KNK')
+MAX_PIECES = 4
+
+# File layout: magic header, signature (8 bytes), then one signed byte per position index
+TABLE_MAGIC = b'FCTB0001'
+HEADER_BYTES = 16
+TABLE_SUFFIX = '.tb'
+# Entry values from the side to move point of view: 0 draw, n > 0 mates in n plies, -n - 1 gets mated in n plies
+ILLEGAL = -128
+# Longest distance to mate that fits in a byte entry: wins store n, losses -n - 1 (down to -127, -128 is ILLEGAL)
+MAX_MATE_PLIES = 126
+
+
+def _on_board(row: int, col: int) -> bool:
+    return 0 <= row < 8 and 0 <= col < 8
+
+
+# Squares are row * 8 + col (row 0 is the 8th rank, like Board.board)
+KING_TARGETS = [[(row + dr) * 8 + col + dc for dr, dc in KING_STEPS if _on_board(row + dr, col + dc)] for row in range(8) for col in range(8)]
+KNIGHT_TARGETS = [[(row + dr) * 8 + col + dc for dr, dc in KNIGHT_STEPS if _on_board(row + dr, col + dc)] for row in range(8) for col in range(8)]
+RAYS = {piece_type: [[[(row + dr * step) * 8 + col + dc * step for step in range(1, 8) if _on_board(row + dr * step, col + dc * step)] for dr, dc in directions]
+                     for row in range(8) for col in range(8)]
+        for piece_type, directions in SLIDER_DIRECTIONS.items()}
+PAWN_CAPTURES = {color: [[(row + pawn_forward(color)) * 8 + col + dc for dc in (-1, 1) if _on_board(row + pawn_forward(color), col + dc)] for row in range(8) for col in range(8)]
+                 for color in ('white', 'black')}
+
+
+def _squares_between(start: int, end: int) -> Union[tuple, None]:
+    # Squares strictly between two squares on a line, with the kind of line; None if they aren't aligned
+    (start_row, start_col), (end_row, end_col) = divmod(start, 8), divmod(end, 8)
+    dr, dc = end_row - start_row, end_col - start_col
+    if start == end or not (dr == 0 or dc == 0 or abs(dr) == abs(dc)):
+        return None
+    steps = max(abs(dr), abs(dc))
+    step_row, step_col = dr // steps, dc // steps
+    line = 'rook' if dr == 0 or dc == 0 else 'bishop'
+    return line, tuple((start_row + step_row * step) * 8 + start_col + step_col * step for step in range(1, steps))
+
+
+BETWEEN = [[_squares_between(start, end) for end in range(64)] for start in range(64)]
+
+
+def other(color: str) -> str:
+    return 'black' if color == 'white' else 'white'
+
+
+# --------------------------------------------------------------------------------------------------- SIGNATURES
+def parse_signature(signature: str) -> list[tuple[str, str]]:
+    """
+    Pieces of a signature in index order: white king, black king, then white and black pieces as written.
+    """
+    split = signature.index('K', 1)
+    white, black = signature[1:split], signature[split + 1:]
+    return [('white', 'king'), ('black', 'king')] + [('white', LETTER_PIECES[letter]) for letter in white] + [('black', LETTER_PIECES[letter]) for letter in black]
+
+
+def normalize(placed: list[tuple[str, str, int]], turn: str) -> tuple[str, tuple[int, ...], str]:
+    """
+    Writes a position (pieces as (color, type, square)) the way tables store it: the side with more material is
+    white (flipping colors and ranks if needed) and pieces are in signature order.
+
+    Returns:
+        (signature, squares, turn) of the stored position.
+    """
+    def order(piece):
+        return LETTER_ORDER.index(PIECE_LETTERS[piece[1]]), piece[2]
+
+    def strength(color):
+        side = sorted((piece for piece in placed if piece[0] == color), key=order)
+        return sum(PIECE_VALUES[piece_type] for _, piece_type, _ in side), [-LETTER_ORDER.index(PIECE_LETTERS[piece_type]) for _, piece_type, _ in side]
+
+    if strength('black') > strength('white'):
+        placed = [(other(color), piece_type, (7 - square // 8) * 8 + square % 8) for color, piece_type, square in placed]
+        turn = other(turn)
+    white, black = (sorted((piece for piece in placed if piece[0] == color), key=order) for color in ('white', 'black'))
+    placed = [white[0], black[0]] + white[1:] + black[1:]
+    signature = ''.join(PIECE_LETTERS[piece_type] for _, piece_type, _ in white + black)
+    return signature, tuple(square for _, _, square in placed), turn
+
+
+def position_index(squares: tuple[int, ...], turn: str) -> int:
+    # Perfect index: side to move, then 6 bits per piece square
+    index = 0 if turn == 'white' else 1
+    for square in squares:
+        index = (index << 6) | square
+    return index
+
+
+def index_position(index: int, pieces_count: int) -> tuple[list[int], str]:
+    squares = [(index >> (6 * (pieces_count - 1 - i))) & 63 for i in range(pieces_count)]
+    return squares, 'white' if index >> (6 * pieces_count) == 0 else 'black'
+
+
+# --------------------------------------------------------------------------------------------------- MOVES
+def is_attacked(target: int, by_color: str, pieces: list[tuple[str, str]], squares: list[int], occupied: set) -> bool:
+    for (color, piece_type), square in zip(pieces, squares):
+        if color != by_color or square < 0:
+            continue
+        if piece_type == 'king':
+            if target in KING_TARGETS[square]:
+                return True
+        elif piece_type == 'knight':
+            if target in KNIGHT_TARGETS[square]:
+                return True
+        elif piece_type == 'pawn':
+            if target in PAWN_CAPTURES[color][square]:
+                return True
+        else:
+            between = BETWEEN[square][target]
+            if between is not None and (piece_type == 'queen' or between[0] == piece_type) and not occupied.intersection(between[1]):
+                return True
+    return False
+
+
+def is_valid(pieces: list[tuple[str, str]], squares: list[int], turn: str) -> bool:
+    # Distinct squares, no pawn on a back rank, kings apart and the side that just moved not in check
+    occupied = set(squares)
+    if len(occupied) != len(squares) or squares[1] in KING_TARGETS[squares[0]]:
+        return False
+    if any(piece_type == 'pawn' and square // 8 in (0, 7) for (_, piece_type), square in zip(pieces, squares)):
+        return False
+    waiting_king = squares[0] if turn == 'black' else squares[1]
+    return not is_attacked(waiting_king, turn, pieces, squares, occupied)
+
+
+def legal_moves(pieces: list[tuple[str, str]], squares: list[int], turn: str) -> Iterator[tuple[list[int], int, Union[int, None], bool]]:
+    """
+    Legal moves of the side to move in a table position.
+
+    Yields:
+        (new_squares, moved_piece_index, captured_piece_index, promotion) per move; a captured piece square is -1.
+    """
+    occupant = {square: i for i, square in enumerate(squares)}
+    king = squares[0] if turn == 'white' else squares[1]
+    for i, ((color, piece_type), square) in enumerate(zip(pieces, squares)):
+        if color != turn:
+            continue
+        if piece_type == 'king':
+            targets = KING_TARGETS[square]
+        elif piece_type == 'knight':
+            targets = KNIGHT_TARGETS[square]
+        elif piece_type == 'pawn':
+            forward = square + pawn_forward(color) * 8
+            targets = [target for target in PAWN_CAPTURES[color][square] if target in occupant]
+            if forward not in occupant:
+                targets.append(forward)
+                double = forward + pawn_forward(color) * 8
+                if square // 8 == (6 if color == 'white' else 1) and double not in occupant:
+                    targets.append(double)
+        else:
+            targets = []
+            for ray in RAYS[piece_type][square]:
+                for target in ray:
+                    targets.append(target)
+                    if target in occupant:
+                        break
+
+        for target in targets:
+            captured = occupant.get(target)
+            if captured is not None and (pieces[captured][0] == turn or pieces[captured][1] == 'king'):
+                continue
+            new_squares = list(squares)
+            new_squares[i] = target
+            if captured is not None:
+                new_squares[captured] = -1
+            occupied = set(new_squares)
+            occupied.discard(-1)
+            if is_attacked(target if piece_type == 'king' else king, other(turn), pieces, new_squares, occupied):
+                continue
+            yield new_squares, i, captured, piece_type == 'pawn' and target // 8 in (0, 7)
+
+
+def retracted_positions(pieces: list[tuple[str, str]], squares: list[int], turn: str) -> Iterator[list[int]]:
+    """
+    Squares of every position where the side that just moved could have made a quiet move to this one. Captures and
+    promotions change the material, so they never lead into a position of the same table.
+    """
+    mover = other(turn)
+    occupied = set(squares)
+    for i, ((color, piece_type), square) in enumerate(zip(pieces, squares)):
+        if color != mover:
+            continue
+        if piece_type == 'king':
+            sources = [source for source in KING_TARGETS[square] if source not in occupied]
+        elif piece_type == 'knight':
+            sources = [source for source in KNIGHT_TARGETS[square] if source not in occupied]
+        elif piece_type == 'pawn':
+            sources = []
+            backward = square - pawn_forward(color) * 8
+            if backward // 8 not in (0, 7) and backward not in occupied:
+                sources.append(backward)
+                double = backward - pawn_forward(color) * 8
+                if double // 8 == (6 if color == 'white' else 1) and double not in occupied:
+                    sources.append(double)
+        else:
+            sources = []
+            for ray in RAYS[piece_type][square]:
+                for source in ray:
+                    if source in occupied:
+                        break
+                    sources.append(source)
+
+        for source in sources:
+            retracted = list(squares)
+            retracted[i] = source
+            yield retracted
+
+
+# --------------------------------------------------------------------------------------------------- TABLES
+class Tablebase:
+    """
+    Distance to mate table of one material signature, memory-mapped read only. One signed byte per perfect index.
+    """
+
+    def __init__(self, path: Union[pathlib.Path, str]):
+        self.path = pathlib.Path(path)
+        self.table_file = open(self.path, 'rb')
+        self.data = mmap.mmap(self.table_file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.data[:len(TABLE_MAGIC)] != TABLE_MAGIC:
+            self.close()
+            raise ValueError(f"{self.path} is not a tablebase")
+        self.signature = self.data[len(TABLE_MAGIC):HEADER_BYTES].rstrip(b'\0').decode()
+        self.values = memoryview(self.data)[HEADER_BYTES:].cast('b')
+
+    def __getitem__(self, index: int) -> int:
+        return self.values[index]
+
+    def close(self):
+        if hasattr(self, 'values'):
+            self.values.release()
+        self.data.close()
+        self.table_file.close()
+
+
+class Tablebases:
+    """
+    Every table of a directory, opened on first use. Probes answer from the side to move point of view with the
+    table value (0 draw, n > 0 mates in n plies, -n - 1 gets mated in n plies) or None when there's no table.
+    """
+
+    def __init__(self, directory: Union[pathlib.Path, str]):
+        self.directory = pathlib.Path(directory)
+        self.tables: dict[str, Union[Tablebase, None]] = {}
+        signatures = [path.stem for path in self.directory.glob(f'*{TABLE_SUFFIX}')]
+        # Cheap test for probe(): positions with more material than every table can be skipped without a scan
+        self.max_material = max((sum(PIECE_VALUES[piece_type] for _, piece_type in parse_signature(signature)) for signature in signatures), default=0)
+
+    def __getstate__(self):
+        return {'directory': self.directory}
+
+    def __setstate__(self, state):
+        self.__init__(state['directory'])
+
+    def table(self, signature: str) -> Union[Tablebase, None]:
+        if signature not in self.tables:
+            path = self.directory / f'{signature}{TABLE_SUFFIX}'
+            self.tables[signature] = Tablebase(path) if path.exists() else None
+        return self.tables[signature]
+
+    def probe_position(self, placed: list[tuple[str, str, int]], turn: str) -> Union[int, None]:
+        signature, squares, turn = normalize(placed, turn)
+        if signature in DRAWN_SIGNATURES:
+            return 0
+        table = self.table(signature)
+        return table[position_index(squares, turn)] if table is not None else None
+
+    def probe(self, board: Board) -> Union[int, None]:
+        if board.material['white'] + board.material['black'] > self.max_material or board.castling_rights() or board.en_passant_square is not None:
+            return None
+        placed = []
+        for piece in board.get_all_pieces():
+            if len(placed) == MAX_PIECES:
+                return None
+            row, col = piece.current_square
+            placed.append((piece.color, piece.type, row * 8 + col))
+        return self.probe_position(placed, board.turn)
+
+    def close(self):
+        for table in self.tables.values():
+            if table is not None:
+                table.close()
+        self.tables = {}
+
+
+# --------------------------------------------------------------------------------------------------- GENERATION
+def generate(signature: str, directory: pathlib.Path) -> pathlib.Path:
+    """
+    Builds the distance to mate table of a signature by retrograde analysis, after the tables its captures and
+    promotions lead to. Every position is first scored by its moves out of the table (mates, stalemates, captures,
+    promotions) and counts its legal moves; then, from the mates outwards, each resolved position resolves the
+    positions that lead to it: a lost position makes them won, and a position whose every move is won for the
+    opponent is lost.
+
+    Args:
+        signature: Material signature (e.g. 'KRK').
+        directory: Directory the table (and any missing table it needs) is written to.
+
+    Returns:
+        The table path.
+    """
+    directory.mkdir(parents=True, exist_ok=True)
+    pieces = parse_signature(signature)
+    path = directory / f'{signature}{TABLE_SUFFIX}'
+    if len(pieces) > MAX_PIECES:
+        raise ValueError(f"Tables are built for up to {MAX_PIECES} pieces, {signature} has {len(pieces)}")
+
+    # Tables of the positions reached by captures and promotions
+    for child_signature in child_signatures(pieces):
+        if child_signature not in DRAWN_SIGNATURES and not (directory / f'{child_signature}{TABLE_SUFFIX}').exists():
+            generate(child_signature, directory)
+    tablebases = Tablebases(directory)
+
+    size = 2 << (6 * len(pieces))
+    values = array('b', bytes(size))
+    remaining = bytearray(size)
+    # Positions resolved at each distance, and moves out of the table whose result is known at that distance
+    resolved: dict[int, list[int]] = {}
+    exits: dict[int, list[tuple[int, bool]]] = {}
+    start_time = time.time()
+    for index in range(size):
+        squares, turn = index_position(index, len(pieces))
+        if not is_valid(pieces, squares, turn):
+            values[index] = ILLEGAL
+            continue
+        moves_count = 0
+        for new_squares, moved, captured, promotion in legal_moves(pieces, squares, turn):
+            moves_count += 1
+            if captured is None and not promotion:
+                continue
+            placed = [(color, 'queen' if promotion and i == moved else piece_type, square) for i, ((color, piece_type), square) in enumerate(zip(pieces, new_squares)) if square >= 0]
+            child_value = tablebases.probe_position(placed, other(turn))
+            if child_value < 0:
+                exits.setdefault(-child_value - 1, []).append((index, True))
+            elif child_value > 0:
+                exits.setdefault(child_value, []).append((index, False))
+        remaining[index] = moves_count
+        if moves_count == 0 and is_attacked(squares[0] if turn == 'white' else squares[1], other(turn), pieces, squares, set(squares)):
+            values[index] = -1
+            resolved.setdefault(0, []).append(index)
+        if index % 65536 == 0:
+            progress_bar(index + 1, size, start_time, title=f'{signature} moves')
+
+    distance = 0
+    while resolved or exits:
+        if distance >= MAX_MATE_PLIES:
+            tablebases.close()
+            raise ValueError(f"{signature} has mates longer than {MAX_MATE_PLIES} plies, they don't fit the one byte table entries")
+        for index, child_lost in exits.pop(distance, []):
+            resolve(index, child_lost, distance, values, remaining, resolved)
+        for child_index in resolved.get(distance, []):
+            child_squares, child_turn = index_position(child_index, len(pieces))
+            child_lost = values[child_index] < 0
+            for squares in retracted_positions(pieces, child_squares, child_turn):
+                index = position_index(tuple(squares), other(child_turn))
+                if values[index] != ILLEGAL:
+                    resolve(index, child_lost, distance, values, remaining, resolved)
+        resolved.pop(distance, None)
+        distance += 1
+    tablebases.close()
+    cute_print(f"{signature}: longest mate in {distance - 1} plies", 'info')
+
+    with open(path, 'wb') as table_file:
+        table_file.write(TABLE_MAGIC + signature.encode().ljust(HEADER_BYTES - len(TABLE_MAGIC), b'\0'))
+        values.tofile(table_file)
+    return path
+
+
+def resolve(index: int, child_lost: bool, distance: int, values: array, remaining: bytearray, resolved: dict):
+    # A move to a position lost for the opponent wins; once every move reaches a position won by the opponent, it's lost
+    if values[index] != 0:
+        return
+    if child_lost:
+        values[index] = distance + 1
+    else:
+        remaining[index] -= 1
+        if remaining[index]:
+            return
+        values[index] = -distance - 2
+    resolved.setdefault(distance + 1, []).append(index)
+
+
+def child_signatures(pieces: list[tuple[str, str]]) -> set[str]:
+    # Signatures reached by capturing any non-king piece or promoting any pawn (always to a queen)
+    signatures = set()
+    for i, (color, piece_type) in enumerate(pieces):
+        if piece_type == 'king':
+            continue
+        remaining_pieces = pieces[:i] + pieces[i + 1:]
+        signatures.add(normalize([(piece_color, remaining_type, 0) for piece_color, remaining_type in remaining_pieces], 'white')[0])
+        if piece_type == 'pawn':
+            promoted = pieces[:i] + [(color, 'queen')] + pieces[i + 1:]
+            signatures.add(normalize([(piece_color, promoted_type, 0) for piece_color, promoted_type in promoted], 'white')[0])
+    return signatures
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build distance to mate endgame tables by retrograde analysis.')
+    parser.add_argument('signatures', nargs='*', default=list(DEFAULT_SIGNATURES), help=f'Material signatures of up to {MAX_PIECES} pieces (default: {" ".join(DEFAULT_SIGNATURES)})')
+    parser.add_argument('-o', '--output', type=pathlib.Path, default=pathlib.Path('tablebases'), help='Tables directory')
+    args = parser.parse_args()
+
+    for signature in args.signatures:
+        try:
+            path = generate(signature.upper(), args.output)
+        except ValueError as error:
+            parser.error(str(error))
+        cute_print(f"{signature} saved at {path}", 'download', 'green')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+# Evaluation constants shared by the batch evaluator (numpy) and the board incremental scores (pure Python)
+PIECE_NAMES = ('king', 'queen', 'bishop', 'knight', 'rook', 'pawn')
+PIECE_COLORS = ('white', 'black')
+
+# Material in centipawns
+PIECE_VALUES = {'king': 0, 'queen': 900, 'bishop': 330, 'knight': 320, 'rook': 500, 'pawn': 100}
+
+# Piece-square tables from white's point of view, indexed row * 8 + col (row 0 is the 8th rank, like Board.board).
+# Black uses the same tables mirrored vertically, see pst_index(). Values from the "Simplified Evaluation Function".
+PIECE_SQUARE_TABLES = {
+    'pawn': (0, 0, 0, 0, 0, 0, 0, 0,
+             50, 50, 50, 50, 50, 50, 50, 50,
+             10, 10, 20, 30, 30, 20, 10, 10,
+             5, 5, 10, 25, 25, 10, 5, 5,
+             0, 0, 0, 20, 20, 0, 0, 0,
+             5, -5, -10, 0, 0, -10, -5, 5,
+             5, 10, 10, -20, -20, 10, 10, 5,
+             0, 0, 0, 0, 0, 0, 0, 0),
+    'knight': (-50, -40, -30, -30, -30, -30, -40, -50,
+               -40, -20, 0, 0, 0, 0, -20, -40,
+               -30, 0, 10, 15, 15, 10, 0, -30,
+               -30, 5, 15, 20, 20, 15, 5, -30,
+               -30, 0, 15, 20, 20, 15, 0, -30,
+               -30, 5, 10, 15, 15, 10, 5, -30,
+               -40, -20, 0, 5, 5, 0, -20, -40,
+               -50, -40, -30, -30, -30, -30, -40, -50),
+    'bishop': (-20, -10, -10, -10, -10, -10, -10, -20,
+               -10, 0, 0, 0, 0, 0, 0, -10,
+               -10, 0, 5, 10, 10, 5, 0, -10,
+               -10, 5, 5, 10, 10, 5, 5, -10,
+               -10, 0, 10, 10, 10, 10, 0, -10,
+               -10, 10, 10, 10, 10, 10, 10, -10,
+               -10, 5, 0, 0, 0, 0, 5, -10,
+               -20, -10, -10, -10, -10, -10, -10, -20),
+    'rook': (0, 0, 0, 0, 0, 0, 0, 0,
+             5, 10, 10, 10, 10, 10, 10, 5,
+             -5, 0, 0, 0, 0, 0, 0, -5,
+             -5, 0, 0, 0, 0, 0, 0, -5,
+             -5, 0, 0, 0, 0, 0, 0, -5,
+             -5, 0, 0, 0, 0, 0, 0, -5,
+             -5, 0, 0, 0, 0, 0, 0, -5,
+             0, 0, 0, 5, 5, 0, 0, 0),
+    'queen': (-20, -10, -10, -5, -5, -10, -10, -20,
+              -10, 0, 0, 0, 0, 0, 0, -10,
+              -10, 0, 5, 5, 5, 5, 0, -10,
+              -5, 0, 5, 5, 5, 5, 0, -5,
+              0, 0, 5, 5, 5, 5, 0, -5,
+              -10, 5, 5, 5, 5, 5, 0, -10,
+              -10, 0, 5, 0, 0, 0, 0, -10,
+              -20, -10, -10, -5, -5, -10, -10, -20),
+    'king': (-30, -40, -40, -50, -50, -40, -40, -30,
+             -30, -40, -40, -50, -50, -40, -40, -30,
+             -30, -40, -40, -50, -50, -40, -40, -30,
+             -30, -40, -40, -50, -50, -40, -40, -30,
+             -20, -30, -30, -40, -40, -30, -30, -20,
+             -10, -20, -20, -20, -20, -20, -20, -10,
+             20, 20, 0, 0, 0, 0, 20, 20,
+             20, 30, 10, 0, 0, 10, 30, 20),
+}
+
+# Centipawns per square a piece attacks that is not occupied by a friendly piece
+MOBILITY_WEIGHTS = {'king': 0, 'queen': 1, 'bishop': 4, 'knight': 4, 'rook': 2, 'pawn': 0}
+
+# King safety: penalty per enemy attack on the king or its adjacent squares, bonus per friendly pawn right in front of it
+KING_ZONE_ATTACK_PENALTY = 8
+PAWN_SHIELD_BONUS = 10
+
+# Piece movement directions as (row, col) steps
+KNIGHT_STEPS = ((2, 1), (2, -1), (-2, 1), (-2, -1), (1, 2), (1, -2), (-1, 2), (-1, -2))
+KING_STEPS = ((1, 0), (-1, 0), (0, 1), (0, -1), (1, 1), (1, -1), (-1, 1), (-1, -1))
+SLIDER_DIRECTIONS = {'bishop': ((1, 1), (1, -1), (-1, 1), (-1, -1)),
+                     'rook': ((1, 0), (-1, 0), (0, 1), (0, -1)),
+                     'queen': ((1, 0), (-1, 0), (0, 1), (0, -1), (1, 1), (1, -1), (-1, 1), (-1, -1))}
+
+
+def pst_index(color: str, position: tuple[int, int]) -> int:
+    row, col = position
+    return (row if color == 'white' else 7 - row) * 8 + col
+
+
+def pawn_forward(color: str) -> int:
+    return -1 if color == 'white' else 1
@@ -0,0 +1,200 @@
+import argparse
+import contextlib
+import io
+import math
+import os
+import pathlib
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Union
+from src.board import Board
+from src.game import GameState
+from src.clock import TimeControl
+from src.ai import Engine
+from src.pgn import read_games, san_to_move, move_to_san, write_game
+from src.utils import cute_print, progress_bar
+
+# Short, balanced openings; every opening is played twice with colors swapped
+DEFAULT_OPENINGS = (('e4', 'e5'), ('d4', 'd5'), ('e4', 'c5'), ('e4', 'e6'), ('e4', 'c6'), ('c4', 'e5'), ('Nf3', 'd5'), ('d4', 'Nf6', 'c4', 'e6'),
+                    ('e4', 'e5', 'Nf3', 'Nc6'), ('d4', 'd5', 'c4', 'c6'), ('e4', 'd5'), ('g3', 'd5'))
+# Games still running after this many plies are adjudicated as draws
+MAX_PLIES = 300
+
+
+def play_game(game_number: int, opening: tuple, a_is_white: bool, engine_a: dict, engine_b: dict, limits: dict) -> dict:
+    """
+    Plays one engine vs engine game through GameState, timing every search. Runs in a worker process.
+
+    Args:
+        game_number: Game number, used as the PGN round.
+        opening: SAN moves played before the engines take over.
+        a_is_white: Whether engine A plays white.
+        engine_a: Engine keyword arguments for engine A (engine B likewise).
+        limits: Search limits for every move (depth, max_nodes and/or max_time), or a time_control string
+            (e.g. '60+1') played on the GameState clocks.
+
+    Returns:
+        Game result, PGN moves and per engine search statistics.
+    """
+    names = {'white': 'A' if a_is_white else 'B', 'black': 'B' if a_is_white else 'A'}
+    engines = {'white': Engine(**(engine_a if a_is_white else engine_b)), 'black': Engine(**(engine_b if a_is_white else engine_a))}
+    statistics = {name: {'Nodes': 0, 'Time': 0.0, 'Moves': 0} for name in ('A', 'B')}
+    board = Board()
+    time_control = TimeControl.parse(limits['time_control']) if limits.get('time_control') else None
+    game = GameState(board, time_control)
+    san_moves = []
+
+    # GameState reports every turn; keep worker output quiet
+    with contextlib.redirect_stdout(io.StringIO()):
+        game.start(f'Engine {names["white"]}', f'Engine {names["black"]}')
+        for ply in range(MAX_PLIES):
+            if game.result is not None:
+                break
+            game.update_elapsed_time()
+            if ply < len(opening):
+                move = san_to_move(board, opening[ply])
+            else:
+                engine, name = engines[board.turn], names[board.turn]
+                search_start = time.perf_counter()
+                if time_control is not None:
+                    player = game.current_player
+                    move, _ = engine.search_clock(board, game.time_left(player), time_control.increment, game.moves_to_go(player))
+                else:
+                    move, _ = engine.search(board, depth=limits.get('depth'), max_nodes=limits.get('max_nodes'), max_time=limits.get('max_time'))
+                statistics[name]['Time'] += time.perf_counter() - search_start
+                statistics[name]['Nodes'] += engine.nodes + engine.quiescence_nodes
+                statistics[name]['Moves'] += 1
+                # The flag can fall during the search
+                game.update_elapsed_time()
+                if game.result is not None:
+                    break
+            san_moves.append(move_to_san(board, move))
+            game.turn(move[0], move[1], board.get_valid_moves(move[0]))
+
+    result = game.result or '1/2-1/2'
+    reason = game.result_reason or 'Adjudicated after maximum length'
+    score_a = 0.5 if result == '1/2-1/2' else float((result == '1-0') == a_is_white)
+    return {'Round': game_number, 'White': f'Engine {names["white"]}', 'Black': f'Engine {names["black"]}', 'Result': result, 'Termination': reason,
+            'ScoreA': score_a, 'Moves': san_moves, 'Statistics': statistics}
+
+
+def elo_estimate(wins: int, draws: int, losses: int) -> tuple[float, float]:
+    """
+    Elo difference of A over B from a match score, with a 95% confidence margin from the per game score variance.
+
+    Returns:
+        (elo, margin); infinite when one side scored every point, and (0, inf) without games.
+    """
+    games = wins + draws + losses
+    if games == 0:
+        return 0.0, math.inf
+    score = (wins + draws / 2) / games
+
+    def to_elo(expected: float) -> float:
+        expected = min(max(expected, 1e-9), 1 - 1e-9)
+        return -400 * math.log10(1 / expected - 1)
+
+    if score in (0, 1):
+        return math.copysign(math.inf, score - 0.5), math.inf
+    variance = (wins * (1 - score) ** 2 + draws * (0.5 - score) ** 2 + losses * score ** 2) / games
+    deviation = math.sqrt(variance / games)
+    return to_elo(score), (to_elo(score + 1.96 * deviation) - to_elo(score - 1.96 * deviation)) / 2
+
+
+def load_openings(path: Union[pathlib.Path, None], plies: int) -> list[tuple]:
+    if path is None:
+        return list(DEFAULT_OPENINGS)
+    openings = []
+    for index, (_, san_moves) in enumerate(read_games(path)):
+        # Lines are cut at their first illegal or unreadable move, so workers only ever replay legal openings
+        board, opening = Board(), []
+        for san in san_moves[:plies]:
+            move = san_to_move(board, san)
+            if move is None:
+                cute_print(f"Opening {index + 1} of {path}: illegal or unreadable move {san}, line cut after {len(opening)} plies", 'warning', 'yellow')
+                break
+            board.make_move(*move)
+            opening.append(san)
+        if opening:
+            openings.append(tuple(opening))
+    return openings
+
+
+def run_tournament(games: int, engine_a: dict, engine_b: dict, limits: dict, openings: list[tuple], output_path: pathlib.Path,
+                   workers: int = os.cpu_count() or 1) -> dict:
+    """
+    Plays a match between two engine configurations on a process pool, saving every game as PGN as it finishes.
+
+    Returns:
+        W/D/L from A's point of view, Elo estimate and margin, and nodes per second and time per move per engine.
+    """
+    wins = draws = losses = 0
+    totals = {name: {'Nodes': 0, 'Time': 0.0, 'Moves': 0} for name in ('A', 'B')}
+    start_time = time.time()
+
+    with ProcessPoolExecutor(workers) as executor, open(output_path, 'w', encoding='utf-8') as pgn_file:
+        futures = [executor.submit(play_game, number + 1, openings[(number // 2) % len(openings)], number % 2 == 0, engine_a, engine_b, limits)
+                   for number in range(games)]
+        for completed, future in enumerate(as_completed(futures), start=1):
+            record = future.result()
+            wins += record['ScoreA'] == 1
+            draws += record['ScoreA'] == 0.5
+            losses += record['ScoreA'] == 0
+            for name in ('A', 'B'):
+                for key in totals[name]:
+                    totals[name][key] += record['Statistics'][name][key]
+            tags = {'Event': 'Engine match', 'Round': record['Round'], 'White': record['White'], 'Black': record['Black'], 'Termination': record['Termination']}
+            if limits.get('time_control'):
+                tags['TimeControl'] = str(TimeControl.parse(limits['time_control']))
+            write_game(pgn_file, tags, record['Moves'], record['Result'])
+            pgn_file.flush()
+            progress_bar(completed, games, start_time, title='Match')
+
+    elo, margin = elo_estimate(wins, draws, losses)
+    report = {'Wins': wins, 'Draws': draws, 'Losses': losses, 'Elo': elo, 'EloMargin': margin}
+    for name in ('A', 'B'):
+        report[f'NodesPerSecond{name}'] = totals[name]['Nodes'] / totals[name]['Time'] if totals[name]['Time'] else 0
+        report[f'TimePerMove{name}'] = totals[name]['Time'] / totals[name]['Moves'] if totals[name]['Moves'] else 0
+
+    cute_print(f"A vs B: +{wins} ={draws} -{losses}  Elo {elo:+.0f} ± {margin:.0f}", 'finish_flag', 'green')
+    for name in ('A', 'B'):
+        cute_print(f"Engine {name}: {report[f'NodesPerSecond{name}']:.0f} nodes/s, {report[f'TimePerMove{name}'] * 1000:.0f} ms/move", 'clock')
+    cute_print(f"Games saved at {output_path}", 'download')
+    return report
+
+
+def parse_engine_options(options: list[str]) -> dict:
+    # 'max_depth=3 hash_mb=16' -> {'max_depth': 3, 'hash_mb': 16}
+    parsed = {}
+    for option in options:
+        key, value = option.split('=', 1)
+        parsed[key] = int(value) if value.isdigit() else value
+    return parsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Play engine vs engine games and report match statistics.')
+    parser.add_argument('-n', '--games', type=int, default=24, help='Number of games')
+    parser.add_argument('-a', '--engine-a', nargs='*', default=[], help='Engine A options as key=value (e.g. max_depth=3)')
+    parser.add_argument('-b', '--engine-b', nargs='*', default=[], help='Engine B options as key=value')
+    parser.add_argument('--depth', type=int, help='Fixed depth per move')
+    parser.add_argument('--nodes', type=int, help='Fixed nodes per move')
+    parser.add_argument('--movetime', type=float, help='Fixed seconds per move')
+    parser.add_argument('--tc', help="Time control in seconds played on the game clocks: base, base+increment or moves/base+increment (e.g. 60+1)")
+    parser.add_argument('--openings', type=pathlib.Path, help='PGN file of openings (defaults to a built-in set)')
+    parser.add_argument('--opening-plies', type=int, default=8, help='Plies played from each PGN opening')
+    parser.add_argument('-w', '--workers', type=int, default=os.cpu_count() or 1, help='Worker processes')
+    parser.add_argument('-o', '--output', type=pathlib.Path, default=pathlib.Path('match.pgn'), help='PGN output file')
+    args = parser.parse_args()
+
+    limits = {'depth': args.depth, 'max_nodes': args.nodes, 'max_time': args.movetime, 'time_control': args.tc}
+    if not any(limits.values()):
+        limits['depth'] = 2
+    openings = load_openings(args.openings, args.opening_plies)
+    if not openings:
+        parser.error(f"no playable opening in {args.openings}")
+    run_tournament(args.games, parse_engine_options(args.engine_a), parse_engine_options(args.engine_b), limits, openings, args.output, args.workers)
+
+
+if __name__ == '__main__':
+    main()
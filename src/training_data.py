@@ -0,0 +1,312 @@
+import argparse
+import json
+import os
+import pathlib
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from typing import Iterator, Union
+import numpy as np
+from src.board import Board
+from src.game import load_log
+from src.ai import Engine
+from src.evaluation import PLANES, encode_board, evaluate
+from src.batch_analysis import iter_archive, count_archive, resolve_move
+from src.pgn import read_games, count_games
+from src.utils import cute_print, progress_bar
+
+# Dataset directory layout:
+#   manifest.json         arrays, dtypes and chunks, rewritten after every chunk (a crash keeps the finished chunks)
+#   <array>_<chunk>.npy   one file per array and chunk, opened memory-mapped when read back
+DATASET_VERSION = 1
+MANIFEST_FILE = 'manifest.json'
+CHUNK_SAMPLES = 1 << 16
+# Feature planes of a sample: the 12 piece planes, then side to move (all ones when white moves), en passant square
+# and the rook squares that still have castling rights, 64 squares each (index row * 8 + col)
+FEATURE_PLANES = PLANES + ('white_to_move', 'en_passant', 'castling_rooks')
+CASTLING_ROOK_SQUARES = ((1, 7 * 8 + 7), (2, 7 * 8 + 0), (4, 0 * 8 + 7), (8, 0 * 8 + 0))
+# Arrays of a dataset: dtype and shape of one sample
+ARRAYS = {'planes': (np.uint8, (len(FEATURE_PLANES), 64)),
+          'results': (np.int8, ()),
+          'scores': (np.int16, ()),
+          'hashes': (np.uint64, ()),
+          'plies': (np.uint16, ())}
+# Game result from white's point of view; unfinished games carry no label and are skipped
+RESULT_VALUES = {'1-0': 1, '1/2-1/2': 0, '0-1': -1}
+# Scores are clipped here (mates included) so they fit the int16 array
+MAX_SCORE = 10000
+
+# One engine per worker process, and the positions it already scored (most games share their first moves)
+_WORKER_ENGINE: Union[Engine, None] = None
+_WORKER_SEEN: set[int] = set()
+
+
+# --------------------------------------------------------------------------------------------------- ENCODING
+def encode_features(board: Board) -> np.ndarray:
+    """
+    Encodes a board as FEATURE_PLANES: a (15, 64) uint8 array whose first 12 planes are encode_board().
+    """
+    features = np.zeros((len(FEATURE_PLANES), 64), dtype=np.uint8)
+    features[:len(PLANES)] = encode_board(board)
+    if board.turn == 'white':
+        features[len(PLANES)] = 1
+    if board.en_passant_square is not None:
+        features[len(PLANES) + 1, board.en_passant_square[0] * 8 + board.en_passant_square[1]] = 1
+    rights = board.castling_rights()
+    for bit, square in CASTLING_ROOK_SQUARES:
+        if rights & bit:
+            features[len(PLANES) + 2, square] = 1
+    return features
+
+
+def _game_samples(tags: dict, moves: list, depth: int) -> Union[tuple[dict[str, np.ndarray], int], None]:
+    # Process pool task: the samples of every position of a game not seen by this worker yet and how many positions
+    # were skipped as already seen, None for games without a result. Scores are the static evaluation at depth 0
+    # (mates and stalemates scored like a search does), otherwise an engine search, both from white's point of view
+    global _WORKER_ENGINE
+    result = RESULT_VALUES.get(tags.get('Result', '*'))
+    if result is None:
+        return None
+    if depth and (_WORKER_ENGINE is None or _WORKER_ENGINE.max_depth != depth):
+        _WORKER_ENGINE = Engine(max_depth=depth)
+
+    board = Board()
+    samples = {name: [] for name in ARRAYS}
+    duplicates = 0
+    for ply in range(len(moves) + 1):
+        if board.hash in _WORKER_SEEN:
+            duplicates += 1
+        else:
+            _WORKER_SEEN.add(board.hash)
+            if depth:
+                _, score = _WORKER_ENGINE.search(board, depth)
+                score = score if board.turn == 'white' else -score
+            elif not board.get_legal_moves():
+                # Mated: the side to move lost; stalemate: a draw
+                score = (-MAX_SCORE if board.turn == 'white' else MAX_SCORE) if board.in_check() else 0
+            else:
+                score = evaluate(board)
+            samples['planes'].append(encode_features(board))
+            samples['results'].append(result)
+            samples['scores'].append(max(-MAX_SCORE, min(score, MAX_SCORE)))
+            samples['hashes'].append(board.hash)
+            samples['plies'].append(ply)
+        if ply == len(moves):
+            break
+        played_move = resolve_move(board, moves[ply])
+        if played_move is None:
+            break
+        board.make_move(*played_move)
+    return {name: np.array(values, dtype=ARRAYS[name][0]).reshape((len(values), *ARRAYS[name][1])) for name, values in samples.items()}, duplicates
+
+
+# --------------------------------------------------------------------------------------------------- SOURCES
+def iter_sources(sources: list[pathlib.Path]) -> Iterator[tuple[str, dict, list]]:
+    """
+    Streams the games of directories (see batch_analysis.iter_archive), PGN files and saved game logs.
+    """
+    for source in sources:
+        if source.is_dir():
+            yield from iter_archive(source)
+        elif source.suffix.lower() == '.pgn':
+            for index, (tags, san_moves) in enumerate(read_games(source)):
+                yield f'{source.name}#{index}', tags, san_moves
+        else:
+            yield source.name, *load_log(source)
+
+
+def count_sources(sources: list[pathlib.Path]) -> int:
+    return sum(count_archive(source) if source.is_dir() else count_games(source) if source.suffix.lower() == '.pgn' else 1 for source in sources)
+
+
+# --------------------------------------------------------------------------------------------------- WRITER
+class DatasetWriter:
+    """
+    Appends samples to a dataset directory one fixed size chunk at a time: samples fill preallocated chunk buffers,
+    and full buffers are saved as .npy files, so memory stays at one chunk whatever the dataset size. Samples whose
+    position hash was already written are dropped (the first occurrence is kept); duplicates counts them, together
+    with the ones dropped before add() (e.g. by the export workers).
+    """
+
+    def __init__(self, directory: Union[pathlib.Path, str], chunk_samples: int = CHUNK_SAMPLES, metadata: Union[dict, None] = None):
+        self.directory = pathlib.Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.chunk_samples = chunk_samples
+        self.metadata = metadata or {}
+        self.buffers = {name: np.zeros((chunk_samples, *shape), dtype=dtype) for name, (dtype, shape) in ARRAYS.items()}
+        self.count = 0
+        self.chunks: list[dict] = []
+        self.seen: set[int] = set()
+        self.samples = 0
+        self.duplicates = 0
+
+    def add(self, samples: dict[str, np.ndarray], dropped: int = 0):
+        # dropped: duplicates of these samples already left out by the caller
+        self.duplicates += dropped
+        keep = np.array([int(position_hash) not in self.seen for position_hash in samples['hashes']], dtype=bool)
+        # Duplicates inside the batch itself: first occurrence of each hash
+        _, first = np.unique(samples['hashes'], return_index=True)
+        unique = np.zeros(len(keep), dtype=bool)
+        unique[first] = True
+        keep &= unique
+        self.duplicates += len(keep) - int(keep.sum())
+        self.seen.update(int(position_hash) for position_hash in samples['hashes'][keep])
+        kept = {name: values[keep] for name, values in samples.items()}
+        start, total = 0, int(keep.sum())
+        while start < total:
+            size = min(total - start, self.chunk_samples - self.count)
+            for name, values in kept.items():
+                self.buffers[name][self.count:self.count + size] = values[start:start + size]
+            self.count += size
+            start += size
+            if self.count == self.chunk_samples:
+                self.flush()
+        self.samples += total
+
+    def flush(self):
+        if self.count == 0:
+            return
+        chunk = {'samples': self.count, 'files': {}}
+        for name, buffer in self.buffers.items():
+            file_name = f"{name}_{len(self.chunks):05d}.npy"
+            np.save(self.directory / file_name, buffer[:self.count])
+            chunk['files'][name] = file_name
+        self.chunks.append(chunk)
+        self.count = 0
+        self.write_manifest()
+
+    def write_manifest(self):
+        manifest = {'version': DATASET_VERSION,
+                    'planes': FEATURE_PLANES,
+                    'arrays': {name: {'dtype': np.dtype(dtype).str, 'shape': shape} for name, (dtype, shape) in ARRAYS.items()},
+                    'samples': sum(chunk['samples'] for chunk in self.chunks),
+                    'duplicates': self.duplicates,
+                    'chunks': self.chunks,
+                    **self.metadata}
+        # Replaced in one step, so a reader never sees a manifest half written
+        temporary_path = self.directory / f"{MANIFEST_FILE}.tmp"
+        with open(temporary_path, 'w', encoding='utf-8') as manifest_file:
+            json.dump(manifest, manifest_file, indent=2)
+        os.replace(temporary_path, self.directory / MANIFEST_FILE)
+
+    def close(self):
+        self.flush()
+        self.write_manifest()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+# --------------------------------------------------------------------------------------------------- READER
+class TrainingData:
+    """
+    Reads a dataset back without loading it: every chunk file is memory-mapped, so samples are paged in from disk as
+    they are used and slices within a chunk are views, not copies.
+    """
+
+    def __init__(self, directory: Union[pathlib.Path, str]):
+        self.directory = pathlib.Path(directory)
+        with open(self.directory / MANIFEST_FILE, encoding='utf-8') as manifest_file:
+            self.manifest = json.load(manifest_file)
+        if self.manifest.get('version') != DATASET_VERSION:
+            raise ValueError(f"{self.directory} is not a training dataset (version {DATASET_VERSION})")
+        self.chunks = [{name: np.load(self.directory / file_name, mmap_mode='r') for name, file_name in chunk['files'].items()}
+                       for chunk in self.manifest['chunks']]
+        self.offsets = np.cumsum([0] + [chunk['samples'] for chunk in self.manifest['chunks']])
+
+    def __len__(self):
+        return int(self.offsets[-1])
+
+    def __getitem__(self, index: int) -> dict[str, np.ndarray]:
+        if not -len(self) <= index < len(self):
+            raise IndexError(index)
+        index %= len(self)
+        chunk = int(np.searchsorted(self.offsets, index, side='right')) - 1
+        return {name: values[index - self.offsets[chunk]] for name, values in self.chunks[chunk].items()}
+
+    def batches(self, batch_size: int, names: tuple[str, ...] = ('planes', 'results', 'scores')) -> Iterator[dict[str, np.ndarray]]:
+        """
+        Yields the dataset in order as dicts of array views; batches don't cross chunks, so the last one of each chunk
+        may be smaller.
+        """
+        for chunk in self.chunks:
+            for start in range(0, len(chunk[names[0]]), batch_size):
+                yield {name: chunk[name][start:start + batch_size] for name in names}
+
+
+# --------------------------------------------------------------------------------------------------- EXPORT
+def export(sources: list[pathlib.Path], output_directory: pathlib.Path, depth: int = 0, workers: int = os.cpu_count() or 1,
+           chunk_samples: int = CHUNK_SAMPLES) -> DatasetWriter:
+    """
+    Replays every game of the sources on a process pool and writes one sample per distinct position: feature planes,
+    game result and score (static evaluation at depth 0, a search of depth plies otherwise). Only a few games per worker
+    are in flight at a time, so memory doesn't grow with the archive size.
+    """
+    total = count_sources(sources)
+    cute_print(f"Exporting {total} games with {workers} workers ({f'depth {depth}' if depth else 'static'} scores) to {output_directory}", 'rocket')
+    metadata = {'sources': [str(source) for source in sources], 'depth': depth, 'games': 0, 'skipped_games': 0}
+    completed, start_time = 0, time.time()
+    with ProcessPoolExecutor(workers) as executor, DatasetWriter(output_directory, chunk_samples, metadata) as writer:
+        pending = set()
+        for _, tags, moves in iter_sources(sources):
+            pending.add(executor.submit(_game_samples, tags, moves, depth))
+            if len(pending) < workers * 2:
+                continue
+            finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+            completed = write_samples(finished, writer, completed, total, start_time)
+        while pending:
+            finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+            completed = write_samples(finished, writer, completed, total, start_time)
+
+    cute_print(f"{writer.samples} samples from {metadata['games']} games ({metadata['skipped_games']} without result skipped, {writer.duplicates} "
+               f"duplicate positions dropped) in {len(writer.chunks)} chunks, {time.time() - start_time:.1f} s", 'download', 'green')
+    return writer
+
+
+def write_samples(finished, writer: DatasetWriter, completed: int, total: int, start_time: float) -> int:
+    for future in finished:
+        game_samples = future.result()
+        if game_samples is None:
+            writer.metadata['skipped_games'] += 1
+        else:
+            writer.metadata['games'] += 1
+            writer.add(*game_samples)
+        completed += 1
+        progress_bar(min(completed, total), total, start_time, title='Export')
+    return completed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export archive positions as training samples (feature planes, result, score) in memory-mapped NumPy arrays.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    export_parser = commands.add_parser('export', help='Replay games and write their positions to a dataset directory')
+    export_parser.add_argument('sources', type=pathlib.Path, nargs='+', help='Directories (searched recursively), PGN files or game logs')
+    export_parser.add_argument('-o', '--output', type=pathlib.Path, default=pathlib.Path('dataset'), help='Dataset directory')
+    export_parser.add_argument('-d', '--depth', type=int, default=0, help='Engine search depth for the scores (0 for the static evaluation)')
+    export_parser.add_argument('-w', '--workers', type=int, default=os.cpu_count() or 1, help='Worker processes')
+    export_parser.add_argument('--chunk', type=int, default=CHUNK_SAMPLES, help='Samples per chunk file')
+    info_parser = commands.add_parser('info', help='Summarise a dataset, reading it memory-mapped')
+    info_parser.add_argument('dataset', type=pathlib.Path)
+    args = parser.parse_args()
+
+    if args.command == 'export':
+        export(args.sources, args.output, args.depth, args.workers, args.chunk)
+
+    elif args.command == 'info':
+        dataset = TrainingData(args.dataset)
+        results = np.zeros(3, dtype=np.int64)
+        score_sum, score_squares = 0, 0
+        for batch in dataset.batches(CHUNK_SAMPLES, ('results', 'scores')):
+            results += np.bincount(batch['results'].astype(np.int64) + 1, minlength=3)
+            score_sum += int(batch['scores'].sum(dtype=np.int64))
+            score_squares += int(np.square(batch['scores'], dtype=np.int64).sum())
+        samples = max(len(dataset), 1)
+        cute_print(f"{len(dataset)} samples in {len(dataset.chunks)} chunks from {dataset.manifest['games']} games ({dataset.manifest['duplicates']} duplicates dropped)", 'info')
+        cute_print(f"Results: {results[2]} white wins, {results[1]} draws, {results[0]} black wins", 'bullet')
+        cute_print(f"Scores: mean {score_sum / samples:.1f}, deviation {max(score_squares / samples - (score_sum / samples) ** 2, 0) ** 0.5:.1f} centipawns", 'bullet')
+
+
+if __name__ == '__main__':
+    main()
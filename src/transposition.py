@@ -0,0 +1,106 @@
+from multiprocessing import shared_memory
+from typing import Union, Tuple
+
+Move = Tuple[Tuple[int, int], Tuple[int, int], str]
+
+# Every move label pieces can produce, so a move fits in 15 bits (from square, to square, label index)
+MOVE_LABELS = ('empty-standard', 'opponent-standard', 'empty-queenside_castling', 'empty-kingside_castling', 'empty-right_passant', 'empty-left_passant')
+MOVE_LABEL_INDEX = {label: index for index, label in enumerate(MOVE_LABELS)}
+
+# Entry data layout (64 bits): move (15) | has move (1) | score + offset (20) | depth (8) | bound (2)
+SCORE_OFFSET = 1 << 19
+ENTRY_BYTES = 16
+
+# Tables attached in this process, by shared memory name (pool workers get the table pickled on every task)
+_ATTACHED: dict = {}
+
+
+def pack_move(move: Move) -> int:
+    (start_row, start_col), (end_row, end_col), move_label = move
+    return (start_row * 8 + start_col) | ((end_row * 8 + end_col) << 6) | (MOVE_LABEL_INDEX[move_label] << 12)
+
+
+def unpack_move(packed_move: int) -> Move:
+    start, end = packed_move & 0x3F, (packed_move >> 6) & 0x3F
+    return divmod(start, 8), divmod(end, 8), MOVE_LABELS[(packed_move >> 12) & 0b111]
+
+
+def pack_entry(depth: int, score: int, bound: int, move: Union[Move, None]) -> int:
+    data = bound | (min(max(depth, 0), 255) << 2) | ((score + SCORE_OFFSET) << 10)
+    if move is not None:
+        data |= (1 << 30) | (pack_move(move) << 31)
+    return data
+
+
+def unpack_entry(data: int) -> tuple[int, int, int, Union[Move, None]]:
+    bound = data & 0b11
+    depth = (data >> 2) & 0xFF
+    score = ((data >> 10) & 0xFFFFF) - SCORE_OFFSET
+    move = unpack_move(data >> 31) if data & (1 << 30) else None
+    return depth, score, bound, move
+
+
+class SharedTranspositionTable:
+    """
+    Transposition table in a multiprocessing.shared_memory block, shared by every search process on the machine.
+    Each slot is two 64 bits words: (key xor data, data). Processes read and write without locks; a slot written
+    by two processes at once ends with words from different writes, which fails the key check and reads as a miss.
+    Has the same get()/put() interface as the LRUCache used by a single process engine.
+    """
+
+    def __init__(self, size_mb: int = 64, name: Union[str, None] = None):
+        if name is None:
+            self.slots_count = max(1, size_mb * 1024 * 1024 // ENTRY_BYTES)
+            self.shm = shared_memory.SharedMemory(create=True, size=self.slots_count * ENTRY_BYTES)
+            self.owner = True
+        else:
+            # Pool workers share the owner's resource tracker, so attaching doesn't add another registration
+            self.shm = shared_memory.SharedMemory(name=name)
+            self.slots_count = self.shm.size // ENTRY_BYTES
+            self.owner = False
+        self.slots = self.shm.buf.cast('Q')
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    def __len__(self):
+        return self.slots_count
+
+    def __getstate__(self):
+        return {'name': self.shm.name}
+
+    def __setstate__(self, state):
+        attached = _ATTACHED.get(state['name'])
+        if attached is None:
+            attached = SharedTranspositionTable(name=state['name'])
+            _ATTACHED[state['name']] = attached
+        self.__dict__.update(attached.__dict__)
+
+    def get(self, key: int, default=None):
+        index = (key % self.slots_count) * 2
+        data = self.slots[index + 1]
+        if data and self.slots[index] ^ data == key:
+            self.hits += 1
+            return unpack_entry(data)
+        self.misses += 1
+        return default
+
+    def put(self, key: int, value: tuple[int, int, int, Union[Move, None]]):
+        index = (key % self.slots_count) * 2
+        data = pack_entry(*value)
+        self.slots[index] = key ^ data
+        self.slots[index + 1] = data
+
+    def clear(self):
+        self.shm.buf[:] = bytes(self.shm.size)
+        self.hits = 0
+        self.misses = 0
+
+    def close(self):
+        self.slots.release()
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
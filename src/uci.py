@@ -0,0 +1,395 @@
+import argparse
+import pathlib
+import queue
+import subprocess
+import sys
+import threading
+import time
+from typing import Union, TextIO
+from src.board import Board
+from src.ai import Engine, MATE_SCORE, MATE_THRESHOLD, MAX_PLY
+from src.clock import allocate
+from src.ordering import Move, is_promotion
+from src.pgn import START_FEN, board_from_fen, square_name
+from src.utils import cute_print
+
+ENGINE_NAME = 'fluent-chess'
+ENGINE_AUTHOR = 'fluent-chess contributors'
+DEFAULT_HASH_MB = 16
+# Seconds the client waits for an answer before giving up on the engine
+CLIENT_TIMEOUT = 30.0
+
+
+def move_to_uci(board: Board, move: Move) -> str:
+    # Long algebraic notation with the promotion piece, e.g. 'e2e4', 'e7e8q' (promotions are always to a queen)
+    return square_name(move[0]) + square_name(move[1]) + ('q' if is_promotion(board, move) else '')
+
+
+def move_from_uci(board: Board, text: str) -> Move:
+    # Any promotion piece is accepted, the board always promotes to a queen
+    for move in board.get_legal_moves():
+        if square_name(move[0]) + square_name(move[1]) == text[:4]:
+            return move
+    raise ValueError(f"Illegal move '{text}'")
+
+
+def score_to_uci(score: int) -> str:
+    # 'cp <centipawns>' or 'mate <moves>' (negative when the side to move gets mated)
+    if abs(score) > MATE_THRESHOLD:
+        plies = MATE_SCORE - abs(score)
+        return f"mate {(plies + 1) // 2 if score > 0 else -(plies // 2)}"
+    return f"cp {score}"
+
+
+class UCIEngine:
+    """
+    Universal Chess Interface adapter: reads commands line by line and answers on the output stream. Searches run on
+    a worker thread, so 'stop', 'ponderhit' and 'isready' are served while the engine thinks; the search streams an
+    'info' line after every iteration and ends with 'bestmove'.
+    """
+
+    def __init__(self, output: TextIO = sys.stdout):
+        self.output = output
+        self.output_lock = threading.Lock()
+        self.options = {'Hash': DEFAULT_HASH_MB, 'BookFile': '', 'TablebasePath': ''}
+        self.engine: Union[Engine, None] = None
+        self.board = Board()
+        # Running search
+        self.search_thread: Union[threading.Thread, None] = None
+        self.stop_event = threading.Event()
+        # Set on 'stop' or 'ponderhit': an infinite or ponder search holds its bestmove until then
+        self.release_event = threading.Event()
+        self.search_board: Union[Board, None] = None
+        self.search_start = 0.0
+        self.ponder_limits: Union[tuple[float, float], None] = None
+        self.soft_deadline: Union[float, None] = None
+
+    def send(self, line: str):
+        with self.output_lock:
+            self.output.write(line + '\n')
+            self.output.flush()
+
+    def get_engine(self) -> Engine:
+        if self.engine is None:
+            self.engine = Engine(hash_mb=self.options['Hash'], book=self.options['BookFile'] or None, tablebases=self.options['TablebasePath'] or None)
+            self.engine.stop_event = self.stop_event
+            self.engine.on_iteration = self.report_iteration
+        return self.engine
+
+    def run(self, commands: TextIO = sys.stdin):
+        for line in commands:
+            if not self.handle(line):
+                break
+        self.quit()
+
+    def handle(self, line: str) -> bool:
+        """
+        Answers one command. Returns False on 'quit'.
+        """
+        tokens = line.split()
+        if not tokens:
+            return True
+        command, arguments = tokens[0], tokens[1:]
+        try:
+            if command == 'uci':
+                self.send(f"id name {ENGINE_NAME}")
+                self.send(f"id author {ENGINE_AUTHOR}")
+                self.send(f"option name Hash type spin default {DEFAULT_HASH_MB} min 1 max 1024")
+                self.send("option name BookFile type string default <empty>")
+                self.send("option name TablebasePath type string default <empty>")
+                self.send("option name Ponder type check default false")
+                self.send('uciok')
+            elif command == 'isready':
+                self.get_engine()
+                self.send('readyok')
+            elif command == 'setoption':
+                self.set_option(arguments)
+            elif command == 'ucinewgame':
+                self.stop()
+                self.board = Board()
+                if self.engine is not None:
+                    self.engine.transposition_table.clear()
+                    self.engine.history = {}
+            elif command == 'position':
+                self.board = self.parse_position(arguments)
+            elif command == 'go':
+                self.go(arguments)
+            elif command == 'stop':
+                self.stop()
+            elif command == 'ponderhit':
+                self.ponderhit()
+            elif command == 'quit':
+                return False
+            else:
+                self.send(f"info string Unknown command '{command}'")
+        except ValueError as error:
+            self.send(f"info string {error}")
+        return True
+
+    def set_option(self, arguments: list[str]):
+        # setoption name <name> [value <value>]; names and values may contain spaces
+        if 'name' not in arguments:
+            raise ValueError('setoption needs a name')
+        value_index = arguments.index('value') if 'value' in arguments else len(arguments)
+        name = ' '.join(arguments[arguments.index('name') + 1:value_index])
+        value = ' '.join(arguments[value_index + 1:])
+        if name == 'Ponder':
+            return
+        if name not in self.options:
+            raise ValueError(f"Unknown option '{name}'")
+        self.stop()
+        self.options[name] = int(value) if name == 'Hash' else ('' if value == '<empty>' else value)
+        # The engine is built again with the new options on the next search
+        if self.engine is not None:
+            self.engine.close()
+            self.engine = None
+
+    @staticmethod
+    def parse_position(arguments: list[str]) -> Board:
+        # position startpos | fen <6 fields> [moves <move>...]
+        moves_index = arguments.index('moves') if 'moves' in arguments else len(arguments)
+        if arguments[:1] == ['startpos']:
+            board = Board()
+        elif arguments[:1] == ['fen']:
+            board = board_from_fen(' '.join(arguments[1:moves_index]))
+        else:
+            raise ValueError("position needs 'startpos' or 'fen'")
+        for text in arguments[moves_index + 1:]:
+            board.make_move(*move_from_uci(board, text))
+        return board
+
+    def go(self, arguments: list[str]):
+        self.stop()
+        parameters, flags, searchmoves = {}, set(), []
+        tokens = iter(arguments)
+        for token in tokens:
+            if token in ('infinite', 'ponder'):
+                flags.add(token)
+            elif token == 'searchmoves':
+                searchmoves = [move_from_uci(self.board, text) for text in tokens]
+            else:
+                parameters[token] = float(next(tokens, '0'))
+
+        # Clock of the side to move, in seconds
+        prefix = 'w' if self.board.turn == 'white' else 'b'
+        clock_limits = None
+        if f'{prefix}time' in parameters:
+            clock_limits = allocate(parameters[f'{prefix}time'] / 1000, parameters.get(f'{prefix}inc', 0) / 1000,
+                                    int(parameters['movestogo']) if 'movestogo' in parameters else None)
+        limits = {'depth': int(parameters['depth']) if 'depth' in parameters else None,
+                  'root_moves': searchmoves or None,
+                  'max_nodes': int(parameters['nodes']) if 'nodes' in parameters else None,
+                  'max_time': parameters['movetime'] / 1000 if 'movetime' in parameters else None}
+        # Pondering searches without a time limit until 'ponderhit' starts the clock
+        self.ponder_limits = clock_limits if 'ponder' in flags else None
+        if clock_limits is not None and not flags:
+            limits['soft_time'], limits['max_time'] = clock_limits
+        if flags and limits['depth'] is None:
+            limits['depth'] = MAX_PLY - 1
+
+        engine = self.get_engine()
+        self.stop_event.clear()
+        self.release_event.clear()
+        self.soft_deadline = None
+        self.search_start = time.monotonic()
+        self.search_board = self.board
+        self.search_thread = threading.Thread(target=self.think, args=(engine, self.board, limits, bool(flags)), daemon=True)
+        self.search_thread.start()
+
+    def think(self, engine: Engine, board: Board, limits: dict, hold: bool):
+        # Worker thread: search, then answer with the best move (and the expected reply to ponder on)
+        move, score = engine.search(board, **limits)
+        if move is not None and engine.depth_reached == 0:
+            # Book and endgame table moves come without iterations
+            self.report_iteration(0, move, score)
+        if hold:
+            self.release_event.wait()
+        if move is None:
+            self.send('bestmove 0000')
+            return
+        line = engine.principal_variation(board, move, 2)
+        if len(line) > 1:
+            board.make_move(*line[0])
+            ponder = move_to_uci(board, line[1])
+            board.unmake_move()
+            self.send(f"bestmove {move_to_uci(board, move)} ponder {ponder}")
+        else:
+            self.send(f"bestmove {move_to_uci(board, move)}")
+
+    def report_iteration(self, depth: int, move: Move, score: int):
+        engine = self.engine
+        board = self.search_board
+        elapsed = time.monotonic() - self.search_start
+        nodes = engine.nodes + engine.quiescence_nodes
+        line = engine.principal_variation(board, move)
+        pv = []
+        for pv_move in line:
+            pv.append(move_to_uci(board, pv_move))
+            board.make_move(*pv_move)
+        for _ in line:
+            board.unmake_move()
+        self.send(f"info depth {depth} score {score_to_uci(score)} nodes {nodes} nps {int(nodes / max(elapsed, 0.001))} "
+                  f"time {int(elapsed * 1000)} pv {' '.join(pv)}")
+        # After a ponder hit, don't start another iteration past the soft limit
+        if self.soft_deadline is not None and time.monotonic() >= self.soft_deadline:
+            self.stop_event.set()
+
+    def stop(self):
+        if self.search_thread is None:
+            return
+        self.stop_event.set()
+        self.release_event.set()
+        self.search_thread.join()
+        self.search_thread = None
+
+    def ponderhit(self):
+        # The opponent played the expected move: the ponder search goes on as a normal search on the clock
+        if self.search_thread is None:
+            return
+        if self.ponder_limits is None:
+            self.stop_event.set()
+        else:
+            soft_time, hard_time = self.ponder_limits
+            now = time.monotonic()
+            self.soft_deadline = now + soft_time
+            self.engine.deadline = now + hard_time
+        self.release_event.set()
+
+    def quit(self):
+        self.stop()
+        if self.engine is not None:
+            self.engine.close()
+            self.engine = None
+
+
+class UCIClient:
+    """
+    Minimal UCI client that runs the engine as a child process over pipes, as a GUI or match runner would.
+    """
+
+    def __init__(self, command: Union[list[str], None] = None):
+        self.process = subprocess.Popen(command or [sys.executable, '-m', 'src.uci'], stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                        text=True, bufsize=1, cwd=pathlib.Path(__file__).resolve().parent.parent)
+        # Lines are read on a thread, so waiting for an answer can time out
+        self.lines: queue.Queue = queue.Queue()
+        self.reader = threading.Thread(target=self.read_lines, daemon=True)
+        self.reader.start()
+
+    def read_lines(self):
+        for line in self.process.stdout:
+            self.lines.put(line.strip())
+
+    def send(self, command: str):
+        self.process.stdin.write(command + '\n')
+        self.process.stdin.flush()
+
+    def wait_for(self, prefix: str, timeout: float = CLIENT_TIMEOUT) -> list[str]:
+        # Lines up to and including the first one starting with prefix
+        deadline = time.monotonic() + timeout
+        lines = []
+        while True:
+            try:
+                line = self.lines.get(timeout=max(deadline - time.monotonic(), 0))
+            except queue.Empty:
+                raise TimeoutError(f"No '{prefix}' from the engine after {timeout} s") from None
+            lines.append(line)
+            if line.startswith(prefix):
+                return lines
+
+    def handshake(self):
+        self.send('uci')
+        self.wait_for('uciok')
+        self.send('isready')
+        self.wait_for('readyok')
+
+    def go(self, position: str, parameters: str) -> tuple[str, list[str]]:
+        """
+        Searches a position ('startpos ...' or 'fen ...') and waits for the answer.
+
+        Returns:
+            The bestmove line and the info lines before it.
+        """
+        self.send(f"position {position}")
+        self.send(f"go {parameters}")
+        lines = self.wait_for('bestmove')
+        return lines[-1], [line for line in lines if line.startswith('info')]
+
+    def close(self):
+        self.send('quit')
+        self.process.wait(timeout=CLIENT_TIMEOUT)
+
+
+def check_engine(depth: int) -> bool:
+    """
+    Plays the engine through a UCI session over pipes: handshake, fixed depth, node and time limits, a mate position,
+    'stop' on an infinite search and a ponder hit on the clock. Reports each step and returns whether all of them passed.
+    """
+    client = UCIClient()
+    passed = True
+
+    def report(name: str, ok: bool, detail: str):
+        nonlocal passed
+        passed = passed and ok
+        cute_print(f"{name}: {detail}", 'success' if ok else 'error', 'green' if ok else 'red')
+
+    try:
+        handshake_start = time.perf_counter()
+        client.handshake()
+        report('Handshake', True, f"{(time.perf_counter() - handshake_start) * 1000:.0f} ms")
+
+        bestmove, infos = client.go('startpos moves e2e4 e7e5', f'depth {depth}')
+        depths = [int(info.split()[2]) for info in infos if info.startswith('info depth')]
+        report('Fixed depth', depths[-1:] == [depth] and 'pv' in infos[-1], f"{bestmove} after {len(infos)} info lines")
+
+        bestmove, infos = client.go(f'fen {START_FEN} moves d2d4', 'nodes 3000')
+        nodes = int(infos[-1].split()[infos[-1].split().index('nodes') + 1]) if infos else 0
+        report('Node limit', bestmove.split()[1] != '0000', f"{bestmove}, last completed iteration searched {nodes} nodes")
+
+        go_start = time.perf_counter()
+        bestmove, _ = client.go('startpos', 'movetime 500')
+        elapsed = time.perf_counter() - go_start
+        report('Move time', elapsed < 1.5, f"{bestmove} in {elapsed * 1000:.0f} ms (limit 500 ms)")
+
+        bestmove, infos = client.go('fen 6k1/5ppp/8/8/8/8/5PPP/R5K1 w - - 0 1', f'depth {depth}')
+        report('Mate', bestmove.split()[1] == 'a1a8' and 'score mate 1' in infos[-1], f"{bestmove}, {infos[-1].split(' pv')[0]}")
+
+        client.send('position startpos')
+        client.send('go infinite')
+        time.sleep(1.0)
+        stop_start = time.perf_counter()
+        client.send('stop')
+        bestmove = client.wait_for('bestmove')[-1]
+        report('Stop', time.perf_counter() - stop_start < 0.5, f"{bestmove} {(time.perf_counter() - stop_start) * 1000:.0f} ms after 'stop'")
+
+        client.send('position startpos moves e2e4')
+        client.send('go ponder wtime 10000 btime 10000')
+        time.sleep(0.5)
+        hit_start = time.perf_counter()
+        client.send('ponderhit')
+        bestmove = client.wait_for('bestmove')[-1]
+        soft_time, hard_time = allocate(10.0)
+        elapsed = time.perf_counter() - hit_start
+        report('Ponder hit', elapsed < hard_time + 0.5, f"{bestmove} {elapsed * 1000:.0f} ms after 'ponderhit' (soft {soft_time * 1000:.0f} ms, hard {hard_time * 1000:.0f} ms)")
+
+        client.send('isready')
+        client.wait_for('readyok')
+    finally:
+        client.close()
+    return passed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the engine as a UCI engine on stdin/stdout.')
+    parser.add_argument('--check', action='store_true', help='Run the engine through a local UCI client session instead and report the results')
+    parser.add_argument('-d', '--depth', type=int, default=3, help='Search depth of the checks')
+    args = parser.parse_args()
+
+    if args.check:
+        passed = check_engine(args.depth)
+        cute_print('UCI checks passed' if passed else 'UCI checks failed', 'finish_flag', 'green' if passed else 'red')
+        sys.exit(0 if passed else 1)
+    UCIEngine().run()
+
+
+if __name__ == '__main__':
+    main()
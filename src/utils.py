@@ -1,4 +1,5 @@
 import time
+from collections import OrderedDict
 from typing import Union, Tuple
 
 
@@ -160,6 +161,47 @@ def progress_bar(current_iter: int, max_iter: int, start_time: Union[int, float]
         print("")
 
 
+# --------------------------------------------------------------------------------------------------- CACHING
+class LRUCache:
+    """Bounded mapping that drops the least recently used entry when full."""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.entries: OrderedDict = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key, default=None):
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return self.entries[key]
+        self.misses += 1
+        return default
+
+    def put(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+
+# --------------------------------------------------------------------------------------------------- STATISTICS
+def percentile(values, fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
 # --------------------------------------------------------------------------------------------------- POSITIONS (TUPLES)
 def adjacent_positions(pos1: tuple, pos2: tuple) -> bool:
     row1, col1 = pos1
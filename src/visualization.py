@@ -3,6 +3,7 @@ from src.utils import position_to_chess_notation, move_to_chess_notation, second
 from src.config import update_game_dimensions, ICONS, ICON_PX_SIZE, FONT_TYPE, FONT_COLOR, PIECES_IMAGES, PIECE_PX_SIZE, BACKGROUND_COLOR, BOARD_LIGHT_COLOR, BOARD_DARK_COLOR, HIGHLIGHT_COLOR
 import pygame
 import math
+from typing import Union
 
 
 def calculate_piece_size(screen: pygame.Surface):
@@ -66,7 +67,7 @@ def draw_board(screen: pygame.Surface):
                 screen.blit(col_letter, col_letter_position)
 
 
-def draw_pieces(screen: pygame.Surface, board: Board, selected_piece_row: int, selected_piece_col: int):
+def draw_pieces(screen: pygame.Surface, board: Board, selected_piece_row: int, selected_piece_col: int, mouse_position: Union[tuple[int, int], None] = None):
     _, SQUARE_PX_SIZE, MARGIN_PX_SIZE, _, _, _ = update_game_dimensions(screen.get_width())
 
     piece_size = calculate_piece_size(screen)
@@ -90,7 +91,7 @@ def draw_pieces(screen: pygame.Surface, board: Board, selected_piece_row: int, s
 
                 # Calculate piece image position based on mouse (if selected)
                 if row == selected_piece_row and col == selected_piece_col:
-                    mouse_x, mouse_y = pygame.mouse.get_pos()
+                    mouse_x, mouse_y = mouse_position or pygame.mouse.get_pos()
                     square_x = ((mouse_x - MARGIN_PX_SIZE) // SQUARE_PX_SIZE) * SQUARE_PX_SIZE
                     square_y = ((mouse_y - MARGIN_PX_SIZE) // SQUARE_PX_SIZE) * SQUARE_PX_SIZE
 
@@ -173,10 +174,10 @@ def render_players_info(screen: pygame.Surface, game: GameState):
             screen.blit(captured_icon_list[i], (icon_captured_position_x, icon_captured_position_y))
 
 
-def render_square_info(screen: pygame.Surface, board):
+def render_square_info(screen: pygame.Surface, board, mouse_position: Union[tuple[int, int], None] = None):
     _, SQUARE_PX_SIZE, MARGIN_PX_SIZE, _, FONT_PX_SIZE_M, _ = update_game_dimensions(screen.get_width())
 
-    mouse_x, mouse_y = pygame.mouse.get_pos()
+    mouse_x, mouse_y = mouse_position or pygame.mouse.get_pos()
     row = ((mouse_y - MARGIN_PX_SIZE) // SQUARE_PX_SIZE)
     col = ((mouse_x - MARGIN_PX_SIZE) // SQUARE_PX_SIZE)
 
@@ -208,11 +209,12 @@ def render_clock(screen: pygame.Surface, game: GameState):
     general_clock_time = general_clock_font.render(f"{seconds_to_hms(game.time)}", True, FONT_COLOR)
     screen.blit(general_clock_time, (x_position, MARGIN_PX_SIZE + (SQUARE_PX_SIZE * 4) - FONT_PX_SIZE_L // 2))
 
-    # Players Clock
+    # Players Clock (time left with a time control, time used otherwise)
     player_clock_font = pygame.font.Font(FONT_TYPE, FONT_PX_SIZE_M)
+    white_time, black_time = (game.white_player.time, game.black_player.time) if game.time_control is None else (max(game.time_left(game.white_player), 0), max(game.time_left(game.black_player), 0))
     # White
-    wp_clock_time = player_clock_font.render(f"{seconds_to_hms(game.white_player.time)}", True, FONT_COLOR)
+    wp_clock_time = player_clock_font.render(f"{seconds_to_hms(white_time)}", True, FONT_COLOR)
     screen.blit(wp_clock_time, (x_position, MARGIN_PX_SIZE + BOARD_PX_SIZE - FONT_PX_SIZE_M))
     # Black
-    bp_clock_time = player_clock_font.render(f"{seconds_to_hms(game.black_player.time)}", True, FONT_COLOR)
+    bp_clock_time = player_clock_font.render(f"{seconds_to_hms(black_time)}", True, FONT_COLOR)
     screen.blit(bp_clock_time, (x_position, MARGIN_PX_SIZE))
@@ -0,0 +1,45 @@
+import random
+
+# Fixed seed: hashes must be identical across runs and processes (shared tables, books, indexes)
+ZOBRIST_SEED = 20240315
+_RANDOM = random.Random(ZOBRIST_SEED)
+
+# One 64 bits key per piece (color_type) and square (row * 8 + col)
+PIECE_KEYS: dict[str, list[int]] = {f"{color}_{name}": [_RANDOM.getrandbits(64) for _ in range(64)]
+                                    for color in ('white', 'black') for name in ('king', 'queen', 'bishop', 'knight', 'rook', 'pawn')}
+# Xor-ed in when black is to move
+SIDE_KEY: int = _RANDOM.getrandbits(64)
+# One key per castling rights mask (see Board.castling_rights())
+CASTLING_KEYS: list[int] = [_RANDOM.getrandbits(64) for _ in range(16)]
+# One key per en passant file
+EN_PASSANT_KEYS: list[int] = [_RANDOM.getrandbits(64) for _ in range(8)]
+
+
+def piece_key(piece, position: tuple[int, int]) -> int:
+    return PIECE_KEYS[f"{piece.color}_{piece.type}"][position[0] * 8 + position[1]]
+
+
+def compute_hash(board) -> int:
+    """
+    Computes the Zobrist hash of a board from scratch. Board keeps it updated incrementally on every move.
+
+    Args:
+        board: The Board to hash.
+
+    Returns:
+        A 64 bits integer identifying pieces placement, side to move, castling rights and en passant file.
+    """
+    position_hash = 0
+    for row in range(8):
+        for col in range(8):
+            piece = board.board[row][col]
+            if piece is not None:
+                position_hash ^= piece_key(piece, (row, col))
+
+    if board.turn == 'black':
+        position_hash ^= SIDE_KEY
+    position_hash ^= CASTLING_KEYS[board.castling_rights()]
+    if board.en_passant_square is not None:
+        position_hash ^= EN_PASSANT_KEYS[board.en_passant_square[1]]
+
+    return position_hash
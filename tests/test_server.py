@@ -0,0 +1,54 @@
+import asyncio
+import random
+import unittest
+from src.server import GameServer, LoopbackClient
+
+
+class ConcurrentSessionsTest(unittest.IsolatedAsyncioTestCase):
+    """Two sessions played at the same time through loopback clients, with state requests racing the engine moves."""
+
+    async def asyncSetUp(self):
+        self.server = GameServer(port=0, workers=2)
+        await self.server.start()
+
+    async def asyncTearDown(self):
+        await self.server.close()
+
+    async def play(self, human_color: str, seed: int, moves: int = 8) -> list[str]:
+        # One connection plays the moves while a second one keeps asking for the state of the same session
+        player, watcher = LoopbackClient(self.server.host, self.server.port), LoopbackClient(self.server.host, self.server.port)
+        await asyncio.gather(player.connect(), watcher.connect())
+        rng = random.Random(seed)
+        state = await player.request(cmd='new', color=human_color, depth=2)
+        played = list(state['moves'])
+        for _ in range(moves):
+            if state['result'] is not None:
+                break
+            self.assertEqual(state['turn'], human_color)
+            move = rng.choice(state['legal'])
+            state, watched = await asyncio.gather(player.request(cmd='move', session=state['session'], move=move),
+                                                  watcher.request(cmd='state', session=state['session']))
+            self.assertNotIn('error', state)
+            after = played + ([move, state['reply']] if state['reply'] else [move])
+            # The watcher sees the position before or after the whole request, never one in between
+            self.assertIn(watched['moves'], (played, after))
+            self.assertEqual(state['moves'], after)
+            played = after
+            # A reply searched in a position with the player to move would be refused, leaving the engine to move
+            if state['reply']:
+                self.assertEqual(state['turn'], human_color)
+        await player.request(cmd='close', session=state['session'])
+        await asyncio.gather(player.close(), watcher.close())
+        return played
+
+    async def test_concurrent_sessions(self):
+        white_game, black_game = await asyncio.gather(self.play('white', seed=1), self.play('black', seed=2))
+        # Each session kept its own game: the black player's game starts with the engine's move
+        self.assertGreater(len(white_game), 2)
+        self.assertGreater(len(black_game), 2)
+        self.assertNotEqual(white_game, black_game)
+        self.assertEqual(self.server.sessions, {})
+
+
+if __name__ == '__main__':
+    unittest.main()